@@ -0,0 +1,311 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from logs import get_logger
+from metrics import inc, register_gauge
+
+log = get_logger("admission")
+
+# ── Config ─────────────────────────────────────────────────────────────────
+
+# Rates are messages/calls per minute, burst is the bucket size
+SENDER_RATE  = float(os.getenv("RATE_LIMIT_SENDER_PER_MIN", "6"))
+SENDER_BURST = float(os.getenv("RATE_LIMIT_SENDER_BURST", "10"))
+TENANT_RATE  = float(os.getenv("RATE_LIMIT_TENANT_PER_MIN", "60"))
+TENANT_BURST = float(os.getenv("RATE_LIMIT_TENANT_BURST", "120"))
+GLOBAL_RATE  = float(os.getenv("RATE_LIMIT_GLOBAL_PER_MIN", "600"))
+GLOBAL_BURST = float(os.getenv("RATE_LIMIT_GLOBAL_BURST", "1200"))
+
+LLM_DAILY_TOKEN_BUDGET = int(os.getenv("LLM_DAILY_TOKEN_BUDGET", "300000"))
+USAGE_SYNC_SECONDS     = int(os.getenv("USAGE_SYNC_SECONDS", "60"))
+
+# Idle sender buckets are dropped after this long so the map stays small
+BUCKET_IDLE_SECONDS = 600
+
+# Live ConversationRelay calls per process and per Twilio number; 0 = no cap.
+# Calls over the cap go to voicemail (see voicemail.py).
+VOICE_MAX_CALLS            = int(os.getenv("VOICE_MAX_CALLS", "40"))
+VOICE_MAX_CALLS_PER_TENANT = int(os.getenv("VOICE_MAX_CALLS_PER_TENANT", "6"))
+# A slot reserved at /voice is freed if its socket hasn't connected by then
+VOICE_RESERVATION_SECONDS  = 30
+
+CANNED_SMS_REPLY = (
+    "Thanks for your message — we've got it and someone will get back to you shortly."
+)
+CANNED_VOICE_REPLY = (
+    "Sorry, we can't take your call right now. "
+    "Please send us a text message and we'll get back to you shortly."
+)
+
+Decision = namedtuple("Decision", ["admitted", "reason", "notify"])
+
+
+# ── Token buckets ──────────────────────────────────────────────────────────
+
+class TokenBucket:
+    """Classic token bucket. rate is tokens per minute, burst is capacity."""
+    __slots__ = ("rate", "capacity", "tokens", "updated", "rejected")
+
+    def __init__(self, rate, burst, now=None):
+        self.rate     = rate / 60.0
+        self.capacity = burst
+        self.tokens   = burst
+        self.updated  = now if now is not None else time.monotonic()
+        self.rejected = 0
+
+    def refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens  = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def has(self, n=1):
+        return self.tokens >= n
+
+    def take(self, n=1):
+        self.tokens  -= n
+        self.rejected = 0
+
+
+_lock            = threading.Lock()
+_sender_buckets  = {}
+_tenant_buckets  = {}
+_global_bucket   = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+
+
+def _bucket(buckets, key, rate, burst, now):
+    b = buckets.get(key)
+    if b is None:
+        b = buckets[key] = TokenBucket(rate, burst, now)
+    else:
+        b.refill(now)
+    return b
+
+
+def admit(channel, sender, tenant):
+    """Admission check for one inbound SMS or call.
+    sender is the caller's number, tenant is the Twilio number they reached —
+    both known from the webhook form, so no DB work happens before this.
+    Tokens are only taken when all three buckets have room.
+    notify is True on the first rejection of a burst, so callers can send
+    one canned reply instead of answering every message of a flood."""
+    now = time.monotonic()
+    with _lock:
+        sender_b = _bucket(_sender_buckets, (channel, sender), SENDER_RATE, SENDER_BURST, now)
+        tenant_b = _bucket(_tenant_buckets, (channel, tenant), TENANT_RATE, TENANT_BURST, now)
+        _global_bucket.refill(now)
+
+        if not sender_b.has():
+            limited, reason = sender_b, "sender"
+        elif not tenant_b.has():
+            limited, reason = tenant_b, "tenant"
+        elif not _global_bucket.has():
+            limited, reason = _global_bucket, "global"
+        else:
+            sender_b.take()
+            tenant_b.take()
+            _global_bucket.take()
+            return Decision(True, None, False)
+
+        limited.rejected += 1
+        notify = limited.rejected == 1
+
+    # The first rejection of a flood is a warning; the rest are sampled
+    if notify:
+        log.warning("rate_limited", reason=reason, channel=channel, sender=sender, to=tenant)
+    else:
+        log.info("rate_limited", reason=reason, channel=channel, sender=sender, to=tenant)
+    return Decision(False, reason, notify)
+
+
+def _prune_buckets():
+    now = time.monotonic()
+    with _lock:
+        for buckets in (_sender_buckets, _tenant_buckets):
+            idle = [k for k, b in buckets.items() if now - b.updated > BUCKET_IDLE_SECONDS]
+            for k in idle:
+                del buckets[k]
+        _expire_reservations(now)
+
+
+# ── Concurrent voice calls ─────────────────────────────────────────────────
+
+# call_sid → [tenant, deadline]. deadline is when an unclaimed /voice
+# reservation lapses; None once the relay socket is up.
+_calls            = {}
+_calls_by_tenant  = {}
+
+
+def _expire_reservations(now):
+    """Drop reservations whose socket never connected. Caller holds _lock."""
+    for sid in [s for s, (_, deadline) in _calls.items() if deadline is not None and deadline < now]:
+        _drop_call(sid)
+
+
+def _drop_call(call_sid):
+    tenant, _ = _calls.pop(call_sid)
+    left = _calls_by_tenant[tenant] - 1
+    if left:
+        _calls_by_tenant[tenant] = left
+    else:
+        del _calls_by_tenant[tenant]
+
+
+def admit_call(call_sid, tenant):
+    """Reserve a live-call slot at /voice, before any TwiML is returned.
+    tenant is the Twilio number reached. reason is "instance" or "tenant"
+    when a cap is hit — the caller should get voicemail instead, so calls
+    already in progress keep their latency."""
+    now = time.monotonic()
+    with _lock:
+        _expire_reservations(now)
+        if call_sid in _calls:
+            return Decision(True, None, False)  # Twilio retried the webhook
+        if VOICE_MAX_CALLS and len(_calls) >= VOICE_MAX_CALLS:
+            reason = "instance"
+        elif VOICE_MAX_CALLS_PER_TENANT and _calls_by_tenant.get(tenant, 0) >= VOICE_MAX_CALLS_PER_TENANT:
+            reason = "tenant"
+        else:
+            _calls[call_sid] = [tenant, now + VOICE_RESERVATION_SECONDS]
+            _calls_by_tenant[tenant] = _calls_by_tenant.get(tenant, 0) + 1
+            return Decision(True, None, False)
+        live = len(_calls)
+
+    inc("tradie_voice_calls_rejected_total", reason=reason)
+    log.warning("voice_capacity_full", reason=reason, to=tenant, call_sid=call_sid, live_calls=live)
+    return Decision(False, reason, False)
+
+
+def call_started(call_sid, tenant):
+    """The relay socket for call_sid is up: its slot is held until
+    call_ended(). Calls /voice never reserved (demo calls, a webhook served by
+    another process) take a slot regardless of the caps."""
+    with _lock:
+        call = _calls.get(call_sid)
+        if call is not None:
+            call[1] = None
+            return
+        _calls[call_sid] = [tenant, None]
+        _calls_by_tenant[tenant] = _calls_by_tenant.get(tenant, 0) + 1
+
+
+def call_ended(call_sid):
+    with _lock:
+        if call_sid in _calls:
+            _drop_call(call_sid)
+
+
+def _call_slots():
+    with _lock:
+        reserved = sum(1 for _, deadline in _calls.values() if deadline is not None)
+        return [({"state": "live"}, len(_calls) - reserved), ({"state": "reserved"}, reserved)]
+
+
+register_gauge("tradie_voice_call_slots", _call_slots)
+
+
+# ── Per-tenant daily usage ─────────────────────────────────────────────────
+
+# Totals are what Postgres reported at the last sync (all processes).
+# Pending is what this process added since then and has not flushed yet.
+_usage_day     = None
+_usage_totals  = {}
+_usage_pending = {}
+
+
+def _today():
+    return datetime.now(timezone.utc).date()
+
+
+def _tenant_key(client_id):
+    # The default (env-configured) client has no id — track it as tenant 0
+    return client_id or 0
+
+
+def _roll_day():
+    global _usage_day, _usage_totals
+    day = _today()
+    if day != _usage_day:
+        _usage_day    = day
+        _usage_totals = {}
+        _usage_pending.clear()
+
+
+def _count(client_id, field, n=1):
+    with _lock:
+        _roll_day()
+        pending = _usage_pending.setdefault(_tenant_key(client_id), {})
+        pending[field] = pending.get(field, 0) + n
+
+
+def record_llm_tokens(client_id, tokens):
+    """Add tokens consumed by one LLM call to the tenant's daily usage."""
+    _count(client_id, "llm_calls")
+    if tokens:
+        _count(client_id, "llm_tokens", int(tokens))
+
+
+def llm_tokens_used(client_id):
+    key = _tenant_key(client_id)
+    with _lock:
+        _roll_day()
+        return _usage_totals.get(key, 0) + _usage_pending.get(key, {}).get("llm_tokens", 0)
+
+
+def llm_budget_ok(client_id):
+    """True while the tenant is under its daily LLM token budget."""
+    if LLM_DAILY_TOKEN_BUDGET <= 0:
+        return True
+    ok = llm_tokens_used(client_id) < LLM_DAILY_TOKEN_BUDGET
+    if not ok:
+        log.warning("llm_budget_exhausted", tenant=_tenant_key(client_id))
+        _count(client_id, "llm_rejected")
+    return ok
+
+
+def sync_usage():
+    """Flush pending usage deltas to Postgres and pull back today's totals,
+    so the budget is shared across processes (up to one sync interval late)."""
+    from database import flush_tenant_usage
+
+    with _lock:
+        _roll_day()
+        day     = _usage_day
+        pending = {k: dict(v) for k, v in _usage_pending.items()}
+        _usage_pending.clear()
+
+    totals = flush_tenant_usage(day, pending)
+    if totals is None:
+        # Flush failed — put the deltas back so they go out next time
+        with _lock:
+            if _usage_day == day:
+                for key, fields in pending.items():
+                    target = _usage_pending.setdefault(key, {})
+                    for field, n in fields.items():
+                        target[field] = target.get(field, 0) + n
+        return False
+
+    with _lock:
+        if _usage_day == day:
+            _usage_totals.clear()
+            _usage_totals.update(totals)
+    return True
+
+
+def start_usage_sync():
+    """Background thread — syncs usage counters and prunes idle buckets."""
+    def _run():
+        while True:
+            try:
+                sync_usage()
+                _prune_buckets()
+            except Exception as e:
+                log.error("usage_sync_error", error=e)
+            time.sleep(USAGE_SYNC_SECONDS)
+
+    t = threading.Thread(target=_run, daemon=True)
+    t.start()
+    log.info("usage_sync_started")
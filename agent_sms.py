@@ -1,12 +1,11 @@
-import sys
-sys.stdout = sys.stderr
-
 import os
-from openai import OpenAI
-from twilio.rest import Client as TwilioClient
+from clients import twilio_client
 from database import save_message, get_conversation, save_lead
+from llm import complete
+from profiling import span
+from logs import get_logger
 
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+log = get_logger("agent_sms")
 
 BUSINESS_NAME  = os.getenv("BUSINESS_NAME", "Mike's Emergency Plumbing")
 BUSINESS_OWNER = os.getenv("BUSINESS_OWNER", "Mike")
@@ -27,36 +26,27 @@ Once you have all 4 details, confirm: "Got it — I have [name] at [address], ca
 """
 
 
-def get_agent_response(from_number, incoming_msg):
-    """Handle inbound SMS from a customer."""
-    save_message(from_number, "user", incoming_msg)
-    history = get_conversation(from_number)
+def get_agent_response(from_number, incoming_msg, client_id=None):
+    """Handle inbound SMS from a customer.
+    client_id scopes the conversation history and is charged the LLM tokens."""
+    save_message(from_number, "user", incoming_msg, client_id=client_id)
+    history = get_conversation(from_number, client_id=client_id)
 
     messages = [{"role": "system", "content": SMS_SYSTEM_PROMPT}] + [
         {"role": m["role"], "content": m["content"]} for m in history
     ]
 
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=150
-        )
-        reply = response.choices[0].message.content.strip()
-        save_message(from_number, "assistant", reply)
+        reply = complete("sms_turn", messages, client_id=client_id, temperature=0.7, max_tokens=150)
+        save_message(from_number, "assistant", reply, client_id=client_id)
         return reply
     except Exception as e:
-        print(f"SMS agent error: {e}")
+        log.error("sms_agent_error", client_id=client_id, error=e)
         return f"Thanks for reaching out — {BUSINESS_OWNER} will call you back shortly."
 
 
 def send_quote_to_customer(customer_phone, name, low, high, from_number=None):
     """Send a price quote SMS to the customer."""
-    twilio = TwilioClient(
-        os.getenv("TWILIO_ACCOUNT_SID"),
-        os.getenv("TWILIO_AUTH_TOKEN")
-    )
     msg = (
         f"Hi {name}, {BUSINESS_NAME} here.\n"
         f"Based on what you've described, we estimate ${low}-${high} CAD.\n"
@@ -64,13 +54,14 @@ def send_quote_to_customer(customer_phone, name, low, high, from_number=None):
         f"Reply YES to confirm or call us to discuss."
     )
     try:
-        result = twilio.messages.create(
-            body=msg,
-            from_=from_number or TWILIO_PHONE,
-            to=customer_phone
-        )
-        print(f"Quote sent to {name}: {result.sid}")
+        with span("twilio"):
+            result = twilio_client().messages.create(
+                body=msg,
+                from_=from_number or TWILIO_PHONE,
+                to=customer_phone
+            )
+        log.info("quote_sent", customer=customer_phone, sid=result.sid)
         return True
     except Exception as e:
-        print(f"send_quote error: {e}")
+        log.error("send_quote_error", error=e)
         return False
\ No newline at end of file
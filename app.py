@@ -1,26 +1,50 @@
-import sys
 import os
-import json
-sys.stdout = sys.stderr
-
-from flask import Flask, request, jsonify
+import hmac
+import zlib
+import hashlib
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from startup import mark, report as startup_report
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 from twilio.twiml.messaging_response import MessagingResponse
 from twilio.twiml.voice_response import VoiceResponse, Connect
-from twilio.rest import Client
 from dotenv import load_dotenv
 from database import (
-    get_all_leads, update_lead_status, init_db, get_lead_by_phone,
+    update_lead_status, get_lead_by_phone, get_owner_leads,
+    get_leads_page, get_lead_stats, get_outbound_leads_page, get_outbound_stats,
     get_client_by_twilio_number, create_client,
     create_outbound_lead, get_outbound_lead_by_phone,
-    update_outbound_lead, get_all_outbound_leads,
-    get_demo_session, delete_demo_session,
-    activate_trial
+    update_outbound_lead, get_outbound_timeline,
+    activate_trial, save_message, FUNNEL_GROUPS,
+    get_client_by_dashboard_token, get_recent_leads, search_leads, get_db,
+    begin_session, end_session, replica_status
 )
 from agent_sms import get_agent_response, send_quote_to_customer
-from outbound import handle_yes_response, send_batch, process_followups, start_scheduler, handle_demo_no_answer, activate_client_trial
+from outbound import handle_yes_response, send_batch, process_followups, start_scheduler, handle_demo_no_answer, activate_client_trial, get_funnel_report
+from demo_sessions import get_demo_session, delete_demo_session
+from event_sink import log_outbound_event, flush as flush_events
+from live import get_cached, put_cached, generation as cache_generation, stream_events, start_lead_listener
+from archive import get_transcript
+from export import export_chunks, parse_time, DATASETS as EXPORT_DATASETS, FORMATS as EXPORT_FORMATS
+from admission import (
+    admit, admit_call, call_started, call_ended, llm_budget_ok, start_usage_sync,
+    CANNED_SMS_REPLY, CANNED_VOICE_REPLY
+)
+from voicemail import voicemail_twiml, goodbye_twiml, enqueue as enqueue_voicemail
+from profiling import install as install_profiling, start_sampler, span, report as profile_report, slow_requests, slow_request
+from llm import report as llm_report
+from metrics import inc, dec, render as render_metrics, METRICS_TOKEN
+from clients import openai_client, twilio_client
+from logs import get_logger
+from jsoncodec import dumps, loads, install as install_json
 
 load_dotenv()
+mark("imports")
+
+log = get_logger("app")
 
 try:
     from simple_websocket import Server as WSServer
@@ -30,17 +54,33 @@ except ImportError:
 
 app = Flask(__name__)
 CORS(app, resources={r'/api/*': {'origins': '*'}})
-twilio_client = Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+install_profiling(app)
+install_json(app)
 
 OWNER_PHONE   = os.getenv("OWNER_PHONE", "")
 TWILIO_PHONE  = os.getenv("TWILIO_PHONE_NUMBER", "")
 BUSINESS_NAME = os.getenv("BUSINESS_NAME", "Mike's Emergency Plumbing")
 OWNER_NAME    = os.getenv("BUSINESS_OWNER", "Mike")
 BASE_URL      = os.getenv("BASE_URL", "")
+# Unlocks /admin/* — those routes 404 while it is unset
+ADMIN_TOKEN   = os.getenv("ADMIN_TOKEN", "")
+# Preload the voice path and API clients in create_app() before serving
+WARM_UP       = os.getenv("WARM_UP", "1") == "1"
+
+@app.before_request
+def _begin_db_session():
+    # Reads after a write in the same request go to the primary (read-your-writes)
+    g.db_session = begin_session()
 
-print("APP V7 — MULTI-CLIENT VOICE")
-start_scheduler()
-print(f"BASE_URL: {BASE_URL}")
+
+@app.teardown_request
+def _end_db_session(exc):
+    token = g.pop("db_session", None)
+    if token is not None:
+        try:
+            end_session(token)
+        except ValueError:
+            pass  # torn down from a different context (streamed response)
 
 
 # ── Client lookup ──────────────────────────────────────────────────────────
@@ -60,36 +100,77 @@ def get_default_client():
 def get_client_for_number(twilio_number):
     client = get_client_by_twilio_number(twilio_number)
     if client:
-        print(f"Client found: {client['business_name']}")
+        log.debug("client_found", business=client["business_name"])
         return client
-    print(f"No client for {twilio_number} — using default")
+    log.info("client_default", to=twilio_number)
     return get_default_client()
 
 
+# Twilio number → (owner phone, digits only; expires_at). Lets /sms recognise
+# the owner before admission without a DB read per inbound message.
+OWNER_CACHE_SECONDS = 60
+OWNER_CACHE_MAX     = 1000
+_owner_phones = {}
+
+def _phone_digits(phone):
+    return (phone or "").replace("+", "").replace(" ", "")
+
+def is_owner_number(from_number, to_number):
+    entry = _owner_phones.get(to_number)
+    now = time.monotonic()
+    if entry is None or entry[1] < now:
+        if len(_owner_phones) >= OWNER_CACHE_MAX:
+            _owner_phones.clear()
+        client = get_client_for_number(to_number)
+        entry = _owner_phones[to_number] = (_phone_digits(client["owner_phone"]), now + OWNER_CACHE_SECONDS)
+    return bool(entry[0]) and _phone_digits(from_number) == entry[0]
+
+
 # ── Owner commands ─────────────────────────────────────────────────────────
 
+# Owner SMS command → (get_owner_leads kind, noun used in the reply)
+OWNER_LEAD_COMMANDS = {
+    "LEADS":  ("new", "new leads"),
+    "URGENT": ("urgent", "urgent leads"),
+    "TODAY":  ("today", "leads today"),
+}
+OWNER_FIND_RESULTS = 5
+
 def handle_owner_command(from_number, body, client):
     cmd   = body.strip().upper()
     parts = body.strip().split(" ")
 
-    if cmd == "LEADS":
-        leads = get_all_leads(client_id=client.get("id"))
-        new_leads = [l for l in leads if l['status'] == 'new']
-        if not new_leads:
-            return "No new leads."
-        summary = f"{len(new_leads)} new leads:\n"
-        for l in new_leads[:5]:
+    if cmd in OWNER_LEAD_COMMANDS:
+        kind, label = OWNER_LEAD_COMMANDS[cmd]
+        result = get_owner_leads(client.get("id"), kind=kind, limit=5)
+        if not result["count"]:
+            return f"No {label}."
+        summary = f"{result['count']}{'+' if result['capped'] else ''} {label}:\n"
+        for l in result["leads"]:
             prefix = "URGENT " if l['urgent'] else ""
             summary += f"{prefix}{l['name']} - {l['contact_phone'] or l['phone']}\n"
         return summary.strip()
 
+    if cmd.startswith("FIND ") and len(parts) >= 2:
+        terms  = body.strip()[5:].strip()
+        result = search_leads(client.get("id"), terms, limit=OWNER_FIND_RESULTS)
+        if result is None:
+            return "Search failed, try again"
+        if not result["total"]:
+            return f"No leads match \"{terms}\""
+        summary = f"{result['total']} match{'es' if result['total'] != 1 else ''} for \"{terms}\":\n"
+        for l in result["results"]:
+            date = l["created_at"][:10]
+            summary += f"{l['name'] or 'Unknown'} - {l['contact_phone'] or l['phone']} - {l['problem'] or ''} ({date})\n"
+        return summary.strip()
+
     if cmd.startswith("APPROVE") and len(parts) >= 4:
         customer_phone = parts[1]
         try:
             low, high = int(parts[2]), int(parts[3])
         except:
             return "Usage: APPROVE +1xxxxxxxxxx 150 300"
-        lead = get_lead_by_phone(customer_phone)
+        lead = get_lead_by_phone(customer_phone, client_id=client.get("id"))
         name = lead['name'] if lead else "there"
         result = send_quote_to_customer(customer_phone, name, low, high,
                                         from_number=client["twilio_number"])
@@ -97,9 +178,9 @@ def handle_owner_command(from_number, body, client):
 
     if cmd.startswith("DONE") and len(parts) >= 2:
         customer_phone = parts[1]
-        lead = get_lead_by_phone(customer_phone)
+        lead = get_lead_by_phone(customer_phone, client_id=client.get("id"))
         if lead:
-            update_lead_status(lead['id'], 'done')
+            update_lead_status(lead['id'], 'done', client_id=client.get("id"))
             return f"Done: {lead['name']}"
         return f"No lead found for {customer_phone}"
 
@@ -113,15 +194,24 @@ def sms_reply():
     incoming_msg = request.form.get("Body", "")
     from_number  = request.form.get("From", "")
     to_number    = request.form.get("To", "")
-    print(f"SMS from {from_number} to {to_number}: {incoming_msg}")
+    log.info("sms_received", sender=from_number, to=to_number)
+    log.debug("sms_body", sender=from_number, body=incoming_msg)
+
+    resp  = MessagingResponse()
+    # The owner's own commands skip admission, so a flood can't lock them out
+    owner = is_owner_number(from_number, to_number)
+    if not owner:
+        decision = admit("sms", from_number, to_number)
+        if not decision.admitted:
+            # Reply once per flood, then drop silently — no DB, no LLM, no SMS
+            if decision.notify:
+                resp.message(CANNED_SMS_REPLY)
+            return str(resp)
 
+    inc("tradie_messages_processed_total", channel="sms")
     client = get_client_for_number(to_number)
-    resp   = MessagingResponse()
-
-    owner_clean    = client["owner_phone"].replace("+", "").replace(" ", "")
-    incoming_clean = from_number.replace("+", "").replace(" ", "")
 
-    if incoming_clean == owner_clean:
+    if owner:
         result = handle_owner_command(from_number, incoming_msg, client)
         if result:
             resp.message(result)
@@ -136,6 +226,7 @@ def sms_reply():
         client = get_client_by_twilio_number(to_number)
         if client:
             update_outbound_lead(from_number, trial_activated=True, status="trial")
+            log_outbound_event(from_number, "trial_activated")
             activate_client_trial(client["id"])
         return str(resp)
 
@@ -143,7 +234,12 @@ def sms_reply():
         handle_yes_response(lead)
         return str(resp)
 
-    reply = get_agent_response(from_number, incoming_msg)
+    if not llm_budget_ok(client.get("id")):
+        save_message(from_number, "user", incoming_msg, client_id=client.get("id"))
+        resp.message(CANNED_SMS_REPLY)
+        return str(resp)
+
+    reply = get_agent_response(from_number, incoming_msg, client_id=client.get("id"))
     resp.message(reply)
     return str(resp)
 
@@ -158,9 +254,19 @@ def voice_entry():
     caller    = request.form.get("From", "unknown")
     to_number = request.form.get("To", "")
     call_sid  = request.form.get("CallSid", "")
-    print(f"Call from {caller} to {to_number} — SID: {call_sid}")
+    log.info("call_received", caller=caller, to=to_number, call_sid=call_sid)
+
+    if not admit("voice", caller, to_number).admitted:
+        return _canned_voice_response()
 
     client        = get_client_for_number(to_number)
+    if not llm_budget_ok(client.get("id")):
+        return _canned_voice_response()
+
+    # Over the live-call caps: voicemail, so calls in progress stay fast
+    if not admit_call(call_sid, to_number).admitted:
+        return voicemail_twiml(client, BASE_URL or f"https://{request.host}"), 200, {"Content-Type": "text/xml"}
+
     business_name = client["business_name"]
     owner_name    = client["owner_name"]
 
@@ -196,6 +302,39 @@ def voice_entry():
     return str(response), 200, {"Content-Type": "text/xml"}
 
 
+def _canned_voice_response():
+    response = VoiceResponse()
+    response.say(CANNED_VOICE_REPLY)
+    response.hangup()
+    return str(response), 200, {"Content-Type": "text/xml"}
+
+
+@app.route("/voice/voicemail-transcribed", methods=["POST"])
+def voicemail_transcribed():
+    """Twilio transcription callback for an overflow voicemail. The lead is
+    extracted in the background."""
+    caller     = request.form.get("From", "unknown")
+    to_number  = request.form.get("To", "")
+    transcript = request.form.get("TranscriptionText", "").strip()
+    if request.form.get("TranscriptionStatus") != "completed":
+        transcript = None
+    log.info("voicemail_transcribed", caller=caller, to=to_number, ok=transcript is not None)
+    enqueue_voicemail(caller, get_client_for_number(to_number), request.form.get("CallSid", ""),
+                      transcript, request.form.get("RecordingUrl"))
+    return "", 204
+
+
+@app.route("/voice/voicemail-done", methods=["POST"])
+def voicemail_done():
+    """<Record> action: the recording ended. No transcription follows an
+    empty recording, so a hang-up before the beep is handled here."""
+    if not request.form.get("RecordingUrl") or request.form.get("RecordingDuration", "0") in ("", "0"):
+        caller = request.form.get("From", "unknown")
+        enqueue_voicemail(caller, get_client_for_number(request.form.get("To", "")),
+                          request.form.get("CallSid", ""), None, None)
+    return goodbye_twiml(), 200, {"Content-Type": "text/xml"}
+
+
 # ── WebSocket ──────────────────────────────────────────────────────────────
 
 try:
@@ -206,48 +345,56 @@ try:
     def voice_ws_sock(ws):
         caller_phone  = "unknown"
         twilio_number = TWILIO_PHONE
-        print("WebSocket connected")
+        call_sid      = None
+        log.info("ws_connected", route="voice")
+        inc("tradie_voice_websockets_active", route="voice")
 
         try:
             raw = ws.receive(timeout=10)
             if raw:
-                setup = json.loads(raw)
+                setup = loads(raw)
                 if setup.get("type") == "setup":
                     caller_phone  = setup.get("from", "unknown")
                     twilio_number = setup.get("to", TWILIO_PHONE)
-                    print(f"Setup — caller: {caller_phone}, to: {twilio_number}")
+                    call_sid      = setup.get("callSid")
+                    log.info("ws_setup", caller=caller_phone, to=twilio_number)
+                    if call_sid:
+                        call_started(call_sid, twilio_number)
 
             client = get_client_for_number(twilio_number)
-            print(f"CLIENT LOADED: {client['business_name']} / {client['owner_name']}")
+            log.info("client_loaded", business=client["business_name"])
             from voice_agent import handle_conversation_relay
             handle_conversation_relay(ws, caller_phone, client)
 
         except Exception as e:
-            print(f"WebSocket error: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("ws_error", route="voice", error=e)
+        finally:
+            dec("tradie_voice_websockets_active", route="voice")
+            if call_sid:
+                call_ended(call_sid)
 
-    print("flask-sock registered at /voice-ws")
+    log.debug("sock_registered", routes=["/voice-ws", "/demo-ws"])
 
     @sock.route("/demo-ws")
     def demo_ws_sock(ws):
         """
         WebSocket for outbound demo calls.
-        Looks up business name from demo_sessions by prospect phone.
+        Looks up business name from the demo session store by prospect phone.
         Completely separate from inbound /voice-ws — no shared state.
         """
         caller_phone = "unknown"
-        print("Demo WebSocket connected")
+        log.info("ws_connected", route="demo")
+        inc("tradie_voice_websockets_active", route="demo")
 
         try:
             raw = ws.receive(timeout=10)
             if raw:
-                setup = json.loads(raw)
+                setup = loads(raw)
                 if setup.get("type") == "setup":
                     caller_phone = setup.get("from", "unknown")
-                    print(f"Demo setup — prospect: {caller_phone}")
+                    log.info("ws_setup", caller=caller_phone, route="demo")
 
-            # Load business name from demo_sessions
+            # Load business name from the demo session store
             session = get_demo_session(caller_phone)
             if session:
                 client = {
@@ -260,26 +407,25 @@ try:
                     "plan": "demo",
                     "active": True
                 }
-                print(f"Demo client: {client['business_name']}")
+                log.info("client_loaded", business=client["business_name"], route="demo")
             else:
-                print(f"No demo session for {caller_phone} — using default")
+                log.info("demo_session_missing", caller=caller_phone)
                 client = get_default_client()
 
             from voice_agent import handle_conversation_relay
             handle_conversation_relay(ws, caller_phone, client)
 
         except Exception as e:
-            print(f"demo_ws_sock error: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("ws_error", route="demo", error=e)
         finally:
+            dec("tradie_voice_websockets_active", route="demo")
             if caller_phone != "unknown":
                 delete_demo_session(caller_phone)
 
 
 
 except ImportError:
-    print("flask-sock not installed")
+    log.warning("sock_unavailable")
 
 
 # ── Onboarding ─────────────────────────────────────────────────────────────
@@ -309,16 +455,17 @@ def onboard_client():
             f"Rogers/Bell: dial *21*{data['twilio_number']}#\n"
             f"Telus: dial *62*{data['twilio_number']}#\n\n"
             f"Test it: call your business number and don't answer.\n\n"
-            f"Reply LEADS anytime to see your leads."
+            f"Reply LEADS anytime to see your leads, URGENT for urgent ones, TODAY for today's."
         )
         try:
-            twilio_client.messages.create(
-                body=welcome,
-                from_=data["twilio_number"],
-                to=data["owner_phone"]
-            )
+            with span("twilio"):
+                twilio_client().messages.create(
+                    body=welcome,
+                    from_=data["twilio_number"],
+                    to=data["owner_phone"]
+                )
         except Exception as e:
-            print(f"Welcome SMS error: {e}")
+            log.error("welcome_sms_error", error=e)
 
         return jsonify({"success": True, "client_id": client_id}), 201
 
@@ -329,6 +476,55 @@ def onboard_client():
 
 
 
+# ── Dashboard rendering ────────────────────────────────────────────────────
+
+DASHBOARD_PAGE_SIZE = 50
+DASHBOARD_MAX_PAGE  = 200
+
+def _page_args():
+    """Keyset cursor from ?before=<created_at>&before_id=<id>&limit=N."""
+    try:
+        limit = min(int(request.args.get("limit", DASHBOARD_PAGE_SIZE)), DASHBOARD_MAX_PAGE)
+    except ValueError:
+        limit = DASHBOARD_PAGE_SIZE
+    before = None
+    if request.args.get("before") and request.args.get("before_id", "").isdigit():
+        try:
+            # Parsed, so the backend compares timestamps rather than strings
+            before = (datetime.fromisoformat(request.args["before"]), int(request.args["before_id"]))
+        except ValueError:
+            pass
+    return before, max(limit, 1)
+
+
+def _next_page_link(rows, limit):
+    """'Older' link carrying the keyset cursor of the last row — empty on the last page."""
+    if len(rows) < limit:
+        return ""
+    last = rows[-1]
+    query = urlencode({"before": last["created_at"], "before_id": last["id"], "limit": limit})
+    return f'<a class="more" href="{request.path}?{query}">Older →</a>'
+
+
+def _stream_html(chunks):
+    """Stream generator output as HTML, gzipped on the fly when accepted.
+    Each chunk is sync-flushed so the browser can render the page head and
+    stats tiles while the rows are still being fetched."""
+    if "gzip" not in request.headers.get("Accept-Encoding", ""):
+        return Response(stream_with_context(chunks), mimetype="text/html")
+
+    def _gzip():
+        z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+        for chunk in chunks:
+            yield z.compress(chunk.encode()) + z.flush(zlib.Z_SYNC_FLUSH)
+        yield z.flush()
+
+    resp = Response(stream_with_context(_gzip()), mimetype="text/html")
+    resp.headers["Content-Encoding"] = "gzip"
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
+
 # ── OUTBOUND ROUTES ───────────────────────────────────────────────────────
 
 @app.route("/outbound/add-lead", methods=["POST"])
@@ -374,15 +570,35 @@ def run_followups():
     return jsonify({"processed": processed}), 200
 
 
+@app.route("/outbound/funnel", methods=["GET"])
+def outbound_funnel():
+    """Funnel conversion rates. GET ?group=template|city|cohort|day&days=30"""
+    group_by = request.args.get("group", "template")
+    if group_by not in FUNNEL_GROUPS:
+        return jsonify({"error": f"group must be one of {sorted(FUNNEL_GROUPS)}"}), 400
+    try:
+        days = max(1, min(int(request.args.get("days", 30)), 366))
+    except ValueError:
+        return jsonify({"error": "days must be a number"}), 400
+    return jsonify(get_funnel_report(group_by=group_by, days=days)), 200
+
+
+@app.route("/outbound/timeline", methods=["GET"])
+def outbound_timeline():
+    """Latest 200 events for one prospect, oldest first. GET ?phone=+1xxxxxxxxxx"""
+    phone = request.args.get("phone")
+    if not phone:
+        return jsonify({"error": "Missing phone"}), 400
+    flush_events()  # include events still buffered in this process
+    events = get_outbound_timeline(phone)
+    if events is None:
+        return jsonify({"error": "Database error"}), 500
+    return jsonify({"phone": phone, "events": events})
+
+
 @app.route("/outbound/leads", methods=["GET"])
 def outbound_dashboard():
-    leads     = get_all_outbound_leads()
-    total     = len(leads)
-    contacted = sum(1 for l in leads if l["sms_sent"])
-    responded = sum(1 for l in leads if l["responded"])
-    demoed    = sum(1 for l in leads if l["demo_called"])
-    converted = sum(1 for l in leads if l["trial_activated"])
-    paid      = sum(1 for l in leads if l["paid"])
+    before, limit = _page_args()
 
     status_color = {
         "pending": "#eee", "contacted": "#3498db", "responded": "#f39c12",
@@ -390,122 +606,131 @@ def outbound_dashboard():
         "trial": "#27ae60", "paid": "#2ecc71", "dead": "#bdc3c7"
     }
 
-    html = f"""<!DOCTYPE html>
+    def render():
+        yield """<!DOCTYPE html>
 <html><head>
     <title>Outbound Pipeline</title>
     <meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1">
     <style>
-        body{{font-family:Arial,sans-serif;margin:20px;background:#f5f5f5}}
-        h1{{color:#333}}.stats{{display:flex;gap:15px;margin-bottom:20px;flex-wrap:wrap}}
-        .stat{{background:white;padding:15px 20px;border-radius:8px;text-align:center;box-shadow:0 2px 4px rgba(0,0,0,.1)}}
-        .stat-number{{font-size:28px;font-weight:bold;color:#333}}.stat-label{{color:#888;font-size:12px}}
-        table{{width:100%;border-collapse:collapse;background:white;border-radius:8px;overflow:hidden;box-shadow:0 2px 4px rgba(0,0,0,.1)}}
-        th{{background:#333;color:white;padding:10px;text-align:left;font-size:13px}}
-        td{{padding:10px;border-bottom:1px solid #eee;font-size:13px}}
-        .badge{{display:inline-block;padding:2px 8px;border-radius:4px;font-size:11px;font-weight:bold;color:white}}
+        body{font-family:Arial,sans-serif;margin:20px;background:#f5f5f5}
+        h1{color:#333}.stats{display:flex;gap:15px;margin-bottom:20px;flex-wrap:wrap}
+        .stat{background:white;padding:15px 20px;border-radius:8px;text-align:center;box-shadow:0 2px 4px rgba(0,0,0,.1)}
+        .stat-number{font-size:28px;font-weight:bold;color:#333}.stat-label{color:#888;font-size:12px}
+        table{width:100%;border-collapse:collapse;background:white;border-radius:8px;overflow:hidden;box-shadow:0 2px 4px rgba(0,0,0,.1)}
+        th{background:#333;color:white;padding:10px;text-align:left;font-size:13px}
+        td{padding:10px;border-bottom:1px solid #eee;font-size:13px}
+        .badge{display:inline-block;padding:2px 8px;border-radius:4px;font-size:11px;font-weight:bold;color:white}
+        .more{display:block;margin:20px 0;text-align:center}
     </style>
 </head><body>
-    <h1>📤 Outbound Pipeline</h1>
+    <h1>📤 Outbound Pipeline</h1>"""
+
+        stats = get_outbound_stats()
+        yield f"""
     <div class="stats">
-        <div class="stat"><div class="stat-number">{total}</div><div class="stat-label">Total</div></div>
-        <div class="stat"><div class="stat-number">{contacted}</div><div class="stat-label">SMS Sent</div></div>
-        <div class="stat"><div class="stat-number">{responded}</div><div class="stat-label">YES</div></div>
-        <div class="stat"><div class="stat-number">{demoed}</div><div class="stat-label">Demo</div></div>
-        <div class="stat"><div class="stat-number">{converted}</div><div class="stat-label">Trial</div></div>
-        <div class="stat"><div class="stat-number">{paid}</div><div class="stat-label">💰 Paid</div></div>
+        <div class="stat"><div class="stat-number">{stats['total']}</div><div class="stat-label">Total</div></div>
+        <div class="stat"><div class="stat-number">{stats['contacted']}</div><div class="stat-label">SMS Sent</div></div>
+        <div class="stat"><div class="stat-number">{stats['responded']}</div><div class="stat-label">YES</div></div>
+        <div class="stat"><div class="stat-number">{stats['demoed']}</div><div class="stat-label">Demo</div></div>
+        <div class="stat"><div class="stat-number">{stats['converted']}</div><div class="stat-label">Trial</div></div>
+        <div class="stat"><div class="stat-number">{stats['paid']}</div><div class="stat-label">💰 Paid</div></div>
     </div>
     <table>
         <tr><th>Business</th><th>Owner</th><th>Phone</th><th>City</th><th>Status</th></tr>"""
 
-    for l in leads:
-        color = status_color.get(l["status"], "#eee")
-        text_color = "#333" if l["status"] == "pending" else "white"
-        html += f"""<tr>
+        leads = get_outbound_leads_page(before=before, limit=limit)
+        rows = []
+        for l in leads:
+            color = status_color.get(l["status"], "#eee")
+            text_color = "#333" if l["status"] == "pending" else "white"
+            rows.append(f"""<tr>
             <td>{l['business_name']}</td><td>{l['owner_name'] or '—'}</td>
             <td>{l['phone']}</td><td>{l['city'] or '—'}</td>
             <td><span class="badge" style="background:{color};color:{text_color}">{l['status'].upper()}</span></td>
-        </tr>"""
+        </tr>""")
+        yield "".join(rows)
 
-    html += "</table></body></html>"
-    return html
+        yield "</table>" + _next_page_link(leads, limit) + "</body></html>"
+
+    return _stream_html(render())
 
 
 
 # ── CLIENT API (for dashboard) ─────────────────────────────────────────────
 
-def get_token_client(token):
-    """Lookup client by dashboard token."""
-    import psycopg2
-    conn = psycopg2.connect(os.environ.get("DATABASE_URL"))
-    try:
-        c = conn.cursor()
-        c.execute("""
-            SELECT id, business_name, owner_name, twilio_number, trial_ends_at, plan
-            FROM clients WHERE dashboard_token = %s AND active = TRUE
-        """, (token,))
-        r = c.fetchone()
-        if not r:
-            return None
-        return {
-            "id": r[0], "business_name": r[1], "owner_name": r[2],
-            "twilio_number": r[3], "trial_ends_at": str(r[4]) if r[4] else None,
-            "plan": r[5]
-        }
-    except Exception as e:
-        print(f"get_token_client error: {e}")
+def _render_api_leads(client):
+    """Build the /api/leads JSON body for a client. None on DB error."""
+    leads = get_recent_leads(client["id"], limit=50)
+    if leads is None:
         return None
-    finally:
-        conn.close()
+
+    trial_ends_at = client["trial_ends_at"]
+    days_left = None
+    if trial_ends_at:
+        days_left = max(0, (trial_ends_at - datetime.now(timezone.utc)).days)
+
+    return dumps({
+        "client": {
+            "business_name": client["business_name"],
+            "twilio_number": client["twilio_number"],
+            "trial_ends_at": trial_ends_at,
+            "days_left": days_left,
+            "plan": client["plan"]
+        },
+        "leads": leads
+    })
 
 
 @app.route("/api/leads", methods=["GET"])
 def api_leads():
-    """Dashboard API — returns leads + client info for a token."""
+    """Dashboard API — returns leads + client info for a token.
+    Served from a per-token cache dropped on every lead event for the client;
+    supports If-None-Match so unchanged polls cost a 304 and no DB work."""
     token = request.args.get("token")
     if not token:
         return jsonify({"error": "Missing token"}), 401
 
-    client = get_token_client(token)
-    if not client:
-        return jsonify({"error": "Invalid token"}), 401
+    cached = get_cached(token)
+    if cached:
+        client_id, etag, body = cached
+    else:
+        client = get_client_by_dashboard_token(token)
+        if not client:
+            return jsonify({"error": "Invalid token"}), 401
+        gen = cache_generation(client["id"])
+        body = _render_api_leads(client)
+        if body is None:
+            return jsonify({"error": "Database error"}), 500
+        etag = hashlib.sha1(body.encode()).hexdigest()
+        put_cached(token, client["id"], etag, body, gen)
+
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
+
+
+@app.route("/api/leads/stream", methods=["GET"])
+def api_leads_stream():
+    """Server-Sent Events — pushes lead saves/status changes for a token's client."""
+    token = request.args.get("token")
+    if not token:
+        return jsonify({"error": "Missing token"}), 401
 
-    import psycopg2
-    conn = psycopg2.connect(os.environ.get("DATABASE_URL"))
-    try:
-        c = conn.cursor()
-        c.execute("""
-            SELECT id, name, phone, address, problem, urgent, status, created_at
-            FROM leads WHERE client_id = %s
-            ORDER BY created_at DESC LIMIT 50
-        """, (client["id"],))
-        rows = c.fetchall()
-        leads = [{
-            "id": r[0], "name": r[1], "phone": r[2], "address": r[3],
-            "problem": r[4], "urgent": r[5], "status": r[6],
-            "created_at": str(r[7])
-        } for r in rows]
-
-        # Calculate trial days left
-        days_left = None
-        if client["trial_ends_at"]:
-            from datetime import datetime
-            trial_end = datetime.fromisoformat(client["trial_ends_at"].replace("+00:00", ""))
-            days_left = max(0, (trial_end - datetime.utcnow()).days)
-
-        return jsonify({
-            "client": {
-                "business_name": client["business_name"],
-                "twilio_number": client["twilio_number"],
-                "trial_ends_at": client["trial_ends_at"],
-                "days_left": days_left,
-                "plan": client["plan"]
-            },
-            "leads": leads
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+    cached = get_cached(token)
+    if cached:
+        client_id = cached[0]
+    else:
+        client = get_client_by_dashboard_token(token)
+        if not client:
+            return jsonify({"error": "Invalid token"}), 401
+        client_id = client["id"]
+
+    return Response(
+        stream_with_context(stream_events(client_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.route("/api/lead/done", methods=["POST"])
@@ -516,24 +741,99 @@ def api_lead_done():
     if not token or not lead_id:
         return jsonify({"error": "Missing params"}), 400
 
-    client = get_token_client(token)
+    client = get_client_by_dashboard_token(token)
+    if not client:
+        return jsonify({"error": "Invalid token"}), 401
+
+    update_lead_status(lead_id, "done", client_id=client["id"])
+    return jsonify({"success": True})
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE  = 100
+
+
+@app.route("/api/search", methods=["GET"])
+def api_search():
+    """Ranked search over the client's leads and transcripts.
+    ?q=boiler king st&page=2&limit=20&days=60 — days limits to recent leads.
+    total is null on a page past the last result."""
+    token = request.args.get("token")
+    query = request.args.get("q", "").strip()
+    if not token or not query:
+        return jsonify({"error": "Missing params"}), 400
+
+    client = get_client_by_dashboard_token(token)
     if not client:
         return jsonify({"error": "Invalid token"}), 401
 
-    import psycopg2
-    conn = psycopg2.connect(os.environ.get("DATABASE_URL"))
     try:
-        c = conn.cursor()
-        c.execute("""
-            UPDATE leads SET status='done'
-            WHERE id=%s AND client_id=%s
-        """, (lead_id, client["id"]))
-        conn.commit()
-        return jsonify({"success": True})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+        page  = max(int(request.args.get("page", 1)), 1)
+        limit = min(max(int(request.args.get("limit", SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE)
+        days  = int(request.args["days"]) if request.args.get("days") else None
+    except ValueError:
+        return jsonify({"error": "Invalid page, limit or days"}), 400
+
+    result = search_leads(client["id"], query, limit=limit, offset=(page - 1) * limit, days=days)
+    if result is None:
+        return jsonify({"error": "Database error"}), 500
+    return jsonify({
+        "query": query, "page": page, "limit": limit,
+        "total": result["total"], "results": result["results"]
+    })
+
+
+@app.route("/api/export", methods=["GET"])
+def api_export():
+    """Stream the client's leads, quotes or transcripts as CSV or JSONL.
+    ?dataset=leads&format=csv&since=2026-01-01&until=2026-02-01
+    Resume an interrupted download with &after=<created_at>&after_id=<id>
+    of the last row received."""
+    token   = request.args.get("token")
+    dataset = request.args.get("dataset", "leads")
+    fmt     = request.args.get("format", "csv")
+    if not token:
+        return jsonify({"error": "Missing token"}), 401
+    if dataset not in EXPORT_DATASETS or fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"dataset must be one of {sorted(EXPORT_DATASETS)}, "
+                                 f"format one of {sorted(EXPORT_FORMATS)}"}), 400
+
+    client = get_client_by_dashboard_token(token)
+    if not client:
+        return jsonify({"error": "Invalid token"}), 401
+
+    try:
+        bounds = {
+            "since": parse_time(request.args.get("since")),
+            "until": parse_time(request.args.get("until")),
+            "after": parse_time(request.args.get("after")),
+            "after_id": int(request.args["after_id"]) if request.args.get("after_id") else None,
+        }
+    except ValueError:
+        return jsonify({"error": "since/until/after must be ISO dates, after_id an integer"}), 400
+
+    filename = f"{dataset}-{client['id']}.{fmt}"
+    return Response(
+        stream_with_context(export_chunks(dataset, fmt, client["id"], **bounds)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                 "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route("/api/transcript", methods=["GET"])
+def api_transcript():
+    """Full conversation with one caller, including months already archived to disk."""
+    token = request.args.get("token")
+    phone = request.args.get("phone")
+    if not token or not phone:
+        return jsonify({"error": "Missing params"}), 400
+
+    client = get_client_by_dashboard_token(token)
+    if not client:
+        return jsonify({"error": "Invalid token"}), 401
+
+    return jsonify({"phone": phone, "messages": get_transcript(phone, client_id=client["id"])})
 
 
 
@@ -567,60 +867,124 @@ p{{color:#666;margin-bottom:24px}}
 
 @app.route("/health", methods=["GET"])
 def health():
+    replica = replica_status()
+    if replica:
+        lag = "unreachable" if replica["lag_seconds"] is None else f"{replica['lag_seconds']:.1f}s"
+        return f"Tradie Agent v7 — Multi-client. WS_LIB: {WS_LIB}. Replica lag: {lag}", 200
     return f"Tradie Agent v7 — Multi-client. WS_LIB: {WS_LIB}", 200
 
 
+# ── Admin ──────────────────────────────────────────────────────────────────
+
+def _admin_ok():
+    token = request.headers.get("X-Admin-Token") or request.args.get("token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+@app.route("/admin/profile", methods=["GET"])
+def admin_profile():
+    """Per-route latency histograms with DB/OpenAI/Twilio breakdown, plus
+    the slow requests kept (newest first)."""
+    if not _admin_ok():
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({**profile_report(), "slow_requests": slow_requests(),
+                    "startup": startup_report()})
+
+
+@app.route("/admin/llm", methods=["GET"])
+def admin_llm():
+    """Model chain per task, and per task and model: calls, errors, tokens,
+    USD cost and p50/p95 latency since startup."""
+    if not _admin_ok():
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(llm_report())
+
+
+@app.route("/admin/profile/slow/<int:snapshot_id>", methods=["GET"])
+def admin_slow_request(snapshot_id):
+    """One slow request with its stack samples and cProfile output."""
+    if not _admin_ok():
+        return jsonify({"error": "Not found"}), 404
+    snapshot = slow_request(snapshot_id)
+    if not snapshot:
+        return jsonify({"error": "Unknown snapshot"}), 404
+    if request.args.get("format") == "text":
+        lines = [f"{snapshot['method']} {snapshot['path']} — {snapshot['wall_ms']}ms"]
+        for s in snapshot["stacks"]:
+            lines += [f"\n── seen {s['count']}×", s["stack"]]
+        if snapshot["profile"]:
+            lines += ["\n── cProfile", snapshot["profile"]]
+        return Response("\n".join(lines), mimetype="text/plain")
+    return jsonify(snapshot)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint. Bearer-token protected when METRICS_TOKEN is set."""
+    if METRICS_TOKEN:
+        auth = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+            return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/leads", methods=["GET"])
 def leads_dashboard():
-    leads  = get_all_leads()
-    total  = len(leads)
-    urgent = sum(1 for l in leads if l['urgent'])
-    new    = sum(1 for l in leads if l['status'] == 'new')
+    before, limit = _page_args()
 
-    html = f"""<!DOCTYPE html>
+    def render():
+        yield """<!DOCTYPE html>
 <html><head>
     <title>Tradie Agent Dashboard</title>
     <meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">
     <style>
-        body{{font-family:Arial,sans-serif;margin:20px;background:#f5f5f5}}
-        h1{{color:#333}}.lead{{background:white;padding:15px;margin:10px 0;border-radius:8px;box-shadow:0 2px 4px rgba(0,0,0,.1)}}
-        .urgent{{border-left:4px solid #e74c3c}}.new{{border-left:4px solid #3498db}}.done{{border-left:4px solid #2ecc71;opacity:.7}}
-        .badge{{display:inline-block;padding:3px 8px;border-radius:4px;font-size:12px;font-weight:bold;margin-left:8px}}
-        .badge-urgent{{background:#e74c3c;color:white}}.badge-new{{background:#3498db;color:white}}
-        .badge-done{{background:#2ecc71;color:white}}.badge-voice{{background:#9b59b6;color:white}}
-        .meta{{color:#888;font-size:13px;margin-top:8px}}
-        .stats{{display:flex;gap:20px;margin-bottom:20px;flex-wrap:wrap}}
-        .stat{{background:white;padding:15px 25px;border-radius:8px;text-align:center;box-shadow:0 2px 4px rgba(0,0,0,.1)}}
-        .stat-number{{font-size:32px;font-weight:bold;color:#333}}.stat-label{{color:#888;font-size:13px}}
-        .commands{{background:#fff3cd;padding:15px;border-radius:8px;margin-bottom:20px;font-size:13px}}
-        code{{background:#eee;padding:2px 6px;border-radius:3px}}
+        body{font-family:Arial,sans-serif;margin:20px;background:#f5f5f5}
+        h1{color:#333}.lead{background:white;padding:15px;margin:10px 0;border-radius:8px;box-shadow:0 2px 4px rgba(0,0,0,.1)}
+        .urgent{border-left:4px solid #e74c3c}.new{border-left:4px solid #3498db}.done{border-left:4px solid #2ecc71;opacity:.7}
+        .badge{display:inline-block;padding:3px 8px;border-radius:4px;font-size:12px;font-weight:bold;margin-left:8px}
+        .badge-urgent{background:#e74c3c;color:white}.badge-new{background:#3498db;color:white}
+        .badge-done{background:#2ecc71;color:white}.badge-voice{background:#9b59b6;color:white}
+        .meta{color:#888;font-size:13px;margin-top:8px}
+        .stats{display:flex;gap:20px;margin-bottom:20px;flex-wrap:wrap}
+        .stat{background:white;padding:15px 25px;border-radius:8px;text-align:center;box-shadow:0 2px 4px rgba(0,0,0,.1)}
+        .stat-number{font-size:32px;font-weight:bold;color:#333}.stat-label{color:#888;font-size:13px}
+        .commands{background:#fff3cd;padding:15px;border-radius:8px;margin-bottom:20px;font-size:13px}
+        code{background:#eee;padding:2px 6px;border-radius:3px}
+        .more{display:block;margin:20px 0;text-align:center}
     </style>
 </head><body>
-    <h1>🔧 Tradie Agent Dashboard</h1>
+    <h1>🔧 Tradie Agent Dashboard</h1>"""
+
+        stats = get_lead_stats(all_tenants=True)
+        yield f"""
     <div class="stats">
-        <div class="stat"><div class="stat-number">{total}</div><div class="stat-label">Total Leads</div></div>
-        <div class="stat"><div class="stat-number">{urgent}</div><div class="stat-label">🚨 Urgent</div></div>
-        <div class="stat"><div class="stat-number">{new}</div><div class="stat-label">New</div></div>
+        <div class="stat"><div class="stat-number">{stats['total']}</div><div class="stat-label">Total Leads</div></div>
+        <div class="stat"><div class="stat-number">{stats['urgent']}</div><div class="stat-label">🚨 Urgent</div></div>
+        <div class="stat"><div class="stat-number">{stats['new']}</div><div class="stat-label">New</div></div>
     </div>
     <div class="commands"><strong>SMS Commands:</strong><br>
-        <code>LEADS</code> &nbsp;|&nbsp; <code>APPROVE +1xxx 150 300</code> &nbsp;|&nbsp; <code>DONE +1xxx</code>
+        <code>LEADS</code> &nbsp;|&nbsp; <code>URGENT</code> &nbsp;|&nbsp; <code>TODAY</code> &nbsp;|&nbsp; <code>APPROVE +1xxx 150 300</code> &nbsp;|&nbsp; <code>DONE +1xxx</code>
     </div>"""
 
-    for lead in leads:
-        uc  = "urgent" if lead['urgent'] else ("done" if lead['status'] == 'done' else "new")
-        bc  = "badge-urgent" if lead['urgent'] else ("badge-done" if lead['status'] == 'done' else "badge-new")
-        bt  = "URGENT" if lead['urgent'] else lead['status'].upper()
-        chb = '<span class="badge badge-voice">📞 VOICE</span>' if lead.get('channel') == 'voice' else '<span class="badge badge-new">💬 SMS</span>'
-        html += f"""
+        leads = get_leads_page(before=before, limit=limit, all_tenants=True)
+        rows = []
+        for lead in leads:
+            uc  = "urgent" if lead['urgent'] else ("done" if lead['status'] == 'done' else "new")
+            bc  = "badge-urgent" if lead['urgent'] else ("badge-done" if lead['status'] == 'done' else "badge-new")
+            bt  = "URGENT" if lead['urgent'] else lead['status'].upper()
+            chb = '<span class="badge badge-voice">📞 VOICE</span>' if lead.get('channel') == 'voice' else '<span class="badge badge-new">💬 SMS</span>'
+            rows.append(f"""
     <div class="lead {uc}">
         <strong>{lead['name'] or 'Unknown'}</strong>
         <span class="badge {bc}">{bt}</span>{chb}
         <div style="margin-top:5px">{lead['problem'] or ''}</div>
         <div class="meta">📍 {lead['address'] or 'No address'} &nbsp;|&nbsp; 📞 {lead['contact_phone'] or lead['phone']} &nbsp;|&nbsp; 🕐 {lead['created_at']}</div>
-    </div>"""
+    </div>""")
+        yield "".join(rows)
+
+        yield _next_page_link(leads, limit) + "</body></html>"
 
-    html += "</body></html>"
-    return html
+    return _stream_html(render())
 
 
 @app.route("/test-voice", methods=["GET"])
@@ -634,15 +998,16 @@ def test_voice():
         owner_name    = client["owner_name"]
         owner_phone   = client["owner_phone"]
 
-        call = twilio_client.calls.create(
-            to=owner_phone,
-            from_=TWILIO_PHONE,
-            twiml=f"""<Response><Connect>
-                <ConversationRelay url="{ws_url}" language="en-US" interruptible="true"
-                    hints="furnace,boiler,HVAC,heat pump,thermostat,hot water tank,water heater,sump pump,drain,pipe,leak,flood,no heat"
-                    welcomeGreeting="Thank you for calling {business_name}. You've reached our answering service — {owner_name} is currently on a job. What's your first name please?" />
-            </Connect></Response>"""
-        )
+        with span("twilio"):
+            call = twilio_client().calls.create(
+                to=owner_phone,
+                from_=TWILIO_PHONE,
+                twiml=f"""<Response><Connect>
+                    <ConversationRelay url="{ws_url}" language="en-US" interruptible="true"
+                        hints="furnace,boiler,HVAC,heat pump,thermostat,hot water tank,water heater,sump pump,drain,pipe,leak,flood,no heat"
+                        welcomeGreeting="Thank you for calling {business_name}. You've reached our answering service — {owner_name} is currently on a job. What's your first name please?" />
+                </Connect></Response>"""
+            )
         return f"Test call! SID: {call.sid} — calling as {business_name}", 200
     except Exception as e:
         return f"Error: {e}", 500
@@ -652,8 +1017,7 @@ def test_voice():
 def clear_test():
     """Clear test messages for default Twilio number only."""
     try:
-        import psycopg2
-        conn = psycopg2.connect(os.environ.get("DATABASE_URL"))
+        conn = get_db()
         c = conn.cursor()
         c.execute("DELETE FROM messages WHERE phone = %s", (TWILIO_PHONE,))
         c.execute("DELETE FROM leads WHERE phone = %s", (TWILIO_PHONE,))
@@ -668,8 +1032,7 @@ def clear_test():
 def clear_all():
     """Nuke ALL messages and leads — use only during development."""
     try:
-        import psycopg2
-        conn = psycopg2.connect(os.environ.get("DATABASE_URL"))
+        conn = get_db()
         c = conn.cursor()
         c.execute("DELETE FROM messages")
         c.execute("DELETE FROM leads")
@@ -680,36 +1043,42 @@ def clear_all():
         return f"Error: {e}", 500
 
 
-@app.route("/migrate", methods=["GET"])
-def migrate():
-    try:
-        import psycopg2
-        conn = psycopg2.connect(os.environ.get("DATABASE_URL"))
-        c = conn.cursor()
-        c.execute("ALTER TABLE leads ADD COLUMN IF NOT EXISTS client_id INTEGER")
-        c.execute("ALTER TABLE leads ADD COLUMN IF NOT EXISTS channel TEXT DEFAULT 'sms'")
-        c.execute("ALTER TABLE leads ADD COLUMN IF NOT EXISTS contact_phone TEXT")
-        c.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS dashboard_token TEXT UNIQUE")
-        c.execute("""
-            UPDATE clients SET dashboard_token = md5(random()::text)
-            WHERE dashboard_token IS NULL
-        """)
-        c.execute("""CREATE TABLE IF NOT EXISTS clients (
-            id SERIAL PRIMARY KEY, business_name TEXT NOT NULL,
-            owner_name TEXT, owner_phone TEXT UNIQUE, twilio_number TEXT UNIQUE,
-            province TEXT DEFAULT 'ON', plan TEXT DEFAULT 'trial',
-            trial_ends_at TIMESTAMPTZ, stripe_customer_id TEXT,
-            active BOOLEAN DEFAULT TRUE, created_at TIMESTAMPTZ DEFAULT NOW(),
-            updated_at TIMESTAMPTZ DEFAULT NOW()
-        )""")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_clients_twilio ON clients(twilio_number)")
-        conn.commit()
-        conn.close()
-        return "Migration done", 200
-    except Exception as e:
-        return f"Error: {e}", 500
+mark("routes")
+
+
+# ── App factory ────────────────────────────────────────────────────────────
+
+_created = False
+
+def warm_up():
+    """Pay the first-call costs now: /voice-ws imports voice_agent inside the
+    handler, and the OpenAI/Twilio SDKs load on first use."""
+    import voice_agent  # noqa: F401
+    openai_client()
+    twilio_client()
+
+
+def create_app(background=True, warm=WARM_UP):
+    """The app, ready to serve. Importing app.py does no I/O and starts no
+    threads; this warms up and starts the background workers, once.
+    WSGI servers: gunicorn 'app:create_app()'."""
+    global _created
+    if _created:
+        return app
+    _created = True
+    log.info("app_starting", version="v7")
+    if warm:
+        warm_up()
+        mark("warm_up")
+    if background:
+        start_scheduler()
+        start_usage_sync()
+        start_lead_listener()
+        start_sampler()
+        mark("background")
+    log.info("startup_complete", base_url=BASE_URL, **startup_report())
+    return app
 
 
 if __name__ == "__main__":
-    init_db()
-    app.run(debug=False, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
\ No newline at end of file
+    create_app().run(debug=False, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
\ No newline at end of file
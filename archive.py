@@ -0,0 +1,344 @@
+"""
+Message partition maintenance, archival and retention.
+
+messages is range-partitioned by month (migration 10). This module keeps
+future months created ahead of time, moves months older than the hot window
+to compressed per-tenant JSONL files on local disk, and enforces each
+tenant's retention policy on both the hot table and the archive.
+
+    python archive.py run                           # one maintenance pass
+    python archive.py transcript <client_id> <phone>  # rehydrate a transcript
+
+The scheduler in outbound.py runs `maintain_messages()` every tick.
+"""
+import sys
+import os
+import io
+import re
+import gzip
+from datetime import date, datetime, timezone
+
+from database import get_db, tenant_key, supports
+from logs import get_logger
+from jsoncodec import dumps, loads
+
+log = get_logger("archive")
+
+try:
+    import zstandard
+except ImportError:  # gzip fallback — slower and larger, but always available
+    zstandard = None
+
+# ── Config ─────────────────────────────────────────────────────────────────
+
+ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "archive")
+# Months kept in Postgres, counting the current one
+HOT_MONTHS = int(os.getenv("MESSAGE_HOT_MONTHS", "3"))
+# Months created ahead so inserts never land in messages_default
+MONTHS_AHEAD = 2
+# Default retention for tenants without clients.message_retention_days (0 = keep forever)
+DEFAULT_RETENTION_DAYS = int(os.getenv("MESSAGE_RETENTION_DAYS", "0"))
+
+EXPORT_BATCH = 5000
+ZSTD_LEVEL = 10
+EXTENSION = ".jsonl.zst" if zstandard else ".jsonl.gz"
+
+PARTITION_RE = re.compile(r"^messages_y(\d{4})m(\d{2})$")
+
+
+def _add_months(month, n):
+    y, m = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return date(y, m + 1, 1)
+
+
+def _this_month():
+    today = datetime.now(timezone.utc).date()
+    return today.replace(day=1)
+
+
+# ── Compressed JSONL ───────────────────────────────────────────────────────
+
+def _open_write(path):
+    if path.endswith(".zst"):
+        raw = open(path, "wb")
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw),
+                                encoding="utf-8")
+    return gzip.open(path, "wt", encoding="utf-8")
+
+
+def _open_read(path):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} needs the zstandard package to read")
+        raw = open(path, "rb")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw), encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+
+def _archive_path(month, client_id):
+    return os.path.join(ARCHIVE_DIR, "messages", month.strftime("%Y-%m"),
+                        f"tenant_{client_id}{EXTENSION}")
+
+
+# ── Partitions ─────────────────────────────────────────────────────────────
+
+def ensure_message_partitions():
+    """Create this month's and the next MONTHS_AHEAD monthly partitions."""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        created = []
+        for n in range(MONTHS_AHEAD + 1):
+            month = _add_months(_this_month(), n)
+            c.execute("SELECT create_message_month(%s)", (month,))
+            if c.fetchone()[0]:
+                created.append(month)
+        conn.commit()
+        for month in created:
+            log.info("partition_created", month=f"{month:%Y-%m}")
+        return created
+    except Exception as e:
+        conn.rollback()
+        log.error("archive_error", op="ensure_message_partitions", error=e)
+        return []
+    finally:
+        conn.close()
+
+
+def list_message_partitions():
+    """Monthly partitions currently attached to messages, oldest first."""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'messages'::regclass
+        """)
+        months = []
+        for (name,) in c.fetchall():
+            m = PARTITION_RE.match(name)
+            if m:
+                months.append((date(int(m.group(1)), int(m.group(2)), 1), name))
+        return sorted(months)
+    except Exception as e:
+        log.error("archive_error", op="list_message_partitions", error=e)
+        return []
+    finally:
+        conn.close()
+
+
+# ── Archival ───────────────────────────────────────────────────────────────
+
+def archive_partition(month, name):
+    """Write one month to per-tenant compressed JSONL files, index which
+    callers each file holds, then detach and drop the partition.
+    Files are written to a temp name and renamed, so a failed run can be
+    re-run safely — nothing is dropped until every file is on disk."""
+    os.makedirs(os.path.dirname(_archive_path(month, 0)), exist_ok=True)
+    conn = get_db()
+    try:
+        # Named cursor streams the month instead of loading it into memory
+        c = conn.cursor(name=f"archive_{name}")
+        c.itersize = EXPORT_BATCH
+        c.execute(f"""
+            SELECT client_id, phone, role, content, created_at, id
+            FROM {name} ORDER BY client_id, phone, created_at, id
+        """)
+
+        index = []  # (client_id, phone, path, count)
+        out = tmp = path = None
+        current_client = current_phone = None
+        count = total = 0
+
+        def _close_file():
+            if out:
+                out.close()
+                os.replace(tmp, path)
+
+        for client_id, phone, role, content, created_at, msg_id in c:
+            if client_id != current_client:
+                if current_phone is not None:
+                    index.append((current_client, current_phone, path, count))
+                _close_file()
+                path = _archive_path(month, client_id)
+                tmp = path + ".tmp"
+                out = _open_write(tmp)
+                current_client, current_phone, count = client_id, None, 0
+            if phone != current_phone:
+                if current_phone is not None:
+                    index.append((current_client, current_phone, path, count))
+                current_phone, count = phone, 0
+            out.write(dumps({
+                "id": msg_id, "phone": phone, "role": role, "content": content,
+                "created_at": created_at.isoformat()
+            }) + "\n")
+            count += 1
+            total += 1
+        if current_phone is not None:
+            index.append((current_client, current_phone, path, count))
+        _close_file()
+        c.close()
+
+        w = conn.cursor()
+        for client_id, phone, file_path, n in index:
+            w.execute("""
+                INSERT INTO message_archive_index (client_id, phone, month, path, messages)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (client_id, phone, month) DO UPDATE
+                SET path = EXCLUDED.path, messages = EXCLUDED.messages, archived_at = NOW()
+            """, (client_id, phone, month, file_path, n))
+        w.execute(f"ALTER TABLE messages DETACH PARTITION {name}")
+        w.execute(f"DROP TABLE {name}")
+        conn.commit()
+        log.info("partition_archived", partition=name, messages=total, conversations=len(index))
+        return total
+    except Exception as e:
+        conn.rollback()
+        log.error("archive_error", op="archive_partition", partition=name, error=e)
+        return None
+    finally:
+        conn.close()
+
+
+def archive_old_partitions():
+    """Archive every monthly partition older than the hot window."""
+    cutoff = _add_months(_this_month(), -(HOT_MONTHS - 1))
+    archived = 0
+    for month, name in list_message_partitions():
+        if month < cutoff and archive_partition(month, name) is not None:
+            archived += 1
+    return archived
+
+
+# ── Retention ──────────────────────────────────────────────────────────────
+
+def _retention_policies(c):
+    """{client_id: days} for every tenant with a retention policy."""
+    c.execute("SELECT id, message_retention_days FROM clients WHERE message_retention_days > 0")
+    policies = dict(c.fetchall())
+    if DEFAULT_RETENTION_DAYS > 0:
+        c.execute("SELECT id FROM clients WHERE message_retention_days IS NULL")
+        for (client_id,) in c.fetchall():
+            policies[client_id] = DEFAULT_RETENTION_DAYS
+        policies.setdefault(0, DEFAULT_RETENTION_DAYS)
+    return policies
+
+
+def apply_retention():
+    """Delete messages past each tenant's retention — hot rows first, then
+    whole archived months that fall entirely outside the window."""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        policies = _retention_policies(c)
+        deleted = 0
+        expired_files = set()
+        for client_id, days in policies.items():
+            c.execute(
+                "DELETE FROM messages WHERE client_id = %s AND created_at < NOW() - %s * INTERVAL '1 day'",
+                (client_id, days)
+            )
+            deleted += c.rowcount
+            if not supports("partitions"):
+                continue
+            # An archive file covers a whole month for one tenant, so it goes
+            # only once the month's last day is past the window
+            c.execute("""
+                DELETE FROM message_archive_index
+                WHERE client_id = %s
+                  AND month + INTERVAL '1 month' <= NOW() - %s * INTERVAL '1 day'
+                RETURNING path
+            """, (client_id, days))
+            expired_files.update(r[0] for r in c.fetchall())
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        log.error("archive_error", op="apply_retention", error=e)
+        return None
+    finally:
+        conn.close()
+
+    for path in expired_files:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    if deleted or expired_files:
+        log.info("retention_applied", messages_deleted=deleted, files_deleted=len(expired_files))
+    return deleted
+
+
+def maintain_messages():
+    """One maintenance pass — called from the scheduler. Without partitions
+    (embedded SQLite) only retention applies."""
+    if supports("partitions"):
+        ensure_message_partitions()
+        archive_old_partitions()
+    apply_retention()
+
+
+# ── Rehydration ────────────────────────────────────────────────────────────
+
+def get_archived_conversation(phone, client_id=None):
+    """Archived messages for one caller, oldest first. Only the files the
+    index says contain this caller are opened."""
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        c.execute(
+            "SELECT path FROM message_archive_index WHERE client_id = %s AND phone = %s ORDER BY month",
+            (tenant_key(client_id), phone)
+        )
+        paths = [r[0] for r in c.fetchall()]
+    except Exception as e:
+        log.error("archive_error", op="get_archived_conversation", error=e)
+        return []
+    finally:
+        conn.close()
+
+    messages = []
+    for path in paths:
+        try:
+            with _open_read(path) as f:
+                for line in f:
+                    row = loads(line)
+                    if row["phone"] == phone:
+                        messages.append(row)
+        except Exception as e:
+            log.error("archive_read_error", path=path, error=e)
+    return messages
+
+
+def get_transcript(phone, client_id=None):
+    """Full transcript for one caller — archived months plus the hot table."""
+    messages = get_archived_conversation(phone, client_id)
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT id, role, content, created_at FROM messages
+            WHERE client_id = %s AND phone = %s ORDER BY created_at ASC
+        """, (tenant_key(client_id), phone))
+        for msg_id, role, content, created_at in c.fetchall():
+            messages.append({
+                "id": msg_id, "phone": phone, "role": role, "content": content,
+                "created_at": created_at.isoformat()
+            })
+    except Exception as e:
+        log.error("archive_error", op="get_transcript", error=e)
+    finally:
+        conn.close()
+    return messages
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or args[0] == "run":
+        maintain_messages()
+    elif args[0] == "transcript" and len(args) == 3:
+        for m in get_transcript(args[2], int(args[1])):
+            print(f"{m['created_at']}  {m['role']:9}  {m['content']}")
+    else:
+        print(__doc__)
+        sys.exit(2)
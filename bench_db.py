@@ -0,0 +1,366 @@
+"""
+Micro-benchmarks for the public database.py functions.
+
+Seeds a database with realistic volumes, then times every public function
+with pooled connections and with a new connection per call, reporting
+latency percentiles and round trips (statements plus commits) per call as
+JSON so results can be tracked across releases:
+
+    python bench_db.py                                   # embedded SQLite in a temp dir
+    python bench_db.py --json bench/2026-10.json --iterations 500
+    DATABASE_URL=postgres://... python bench_db.py --pool-size 10
+    python bench_db.py --tenants 50 --messages 100000 --outbound 20000   # quick run
+
+Without DATABASE_URL the run is hermetic: a fresh SQLite file is migrated,
+seeded and thrown away. Against Postgres, point it at a dedicated, migrated
+database — the seed is committed and the timed writes stay. --no-seed
+reuses a database an earlier run already seeded.
+
+"Pooled" is the backend's normal mode (Postgres: a ThreadedConnectionPool of
+--pool-size; SQLite: one long-lived connection per thread); "unpooled" opens
+a new connection for every get_db().
+"""
+import sys
+import os
+import json
+import time
+import random
+import itertools
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SEED_TENANTS  = 500
+SEED_LEADS    = 100000
+SEED_MESSAGES = 1000000
+SEED_OUTBOUND = 200000
+SEED_EVENTS   = 400000
+SEED_DEMOS    = 2000
+
+# Bound parameters per multi-row INSERT while seeding
+SEED_CHUNK_PARAMS = 30000
+
+# Whole-table reads get this fraction of --iterations
+HEAVY_FUNCTIONS = {"get_all_outbound_leads", "refresh_outbound_funnel"}
+HEAVY_FRACTION  = 0.05
+
+
+# ── Seed ───────────────────────────────────────────────────────────────────
+
+def _insert(c, table, columns, rows):
+    per_chunk = max(1, SEED_CHUNK_PARAMS // len(columns))
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    for i in range(0, len(rows), per_chunk):
+        chunk = rows[i:i + per_chunk]
+        c.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([placeholders] * len(chunk)),
+            [v for row in chunk for v in row]
+        )
+
+
+def _month_starts(now, months):
+    first = now.date().replace(day=1)
+    for n in range(months + 1):
+        y, m = divmod(first.year * 12 + first.month - 1 - n, 12)
+        yield first.replace(year=y, month=m + 1)
+
+
+def seed(tenants, leads, messages, outbound, events, demos):
+    """Insert the benchmark data set in one transaction. Synthetic numbers:
+    clients +1800…/+1900…, callers +1700…, prospects +1600…"""
+    import database
+
+    rnd = random.Random(42)
+    now = datetime.now(timezone.utc)
+
+    def ago(days):
+        return now - timedelta(days=days, seconds=rnd.randrange(86400))
+
+    conn = database.get_db()
+    try:
+        c = conn.cursor()
+        if database.supports("partitions"):
+            # A year of monthly partitions so the history doesn't land in messages_default
+            for month in _month_starts(now, 12):
+                c.execute("SELECT create_message_month(%s)", (month,))
+
+        _insert(c, "clients", ["business_name", "owner_name", "owner_phone", "twilio_number",
+                               "plan", "trial_ends_at", "active"],
+                [(f"Biz {g}", f"Owner {g}", f"+1900{g:07d}", f"+1800{g:07d}",
+                  "trial" if g % 10 == 0 else "active", now + timedelta(days=g % 14 - 7), g % 50 != 0)
+                 for g in range(1, tenants + 1)])
+        c.execute("SELECT MIN(id) FROM clients WHERE owner_phone LIKE '+1900%%'")
+        first_client = c.fetchone()[0]
+
+        def tenant(g):
+            return first_client + g % tenants
+
+        problems = ["no heat", "burst pipe", "clogged drain", "water heater leaking",
+                    "frozen pipes", "toilet running", "sump pump failed", "gas smell"]
+        _insert(c, "leads", ["client_id", "phone", "name", "address", "problem", "urgent",
+                             "channel", "status", "created_at"],
+                [(tenant(g), f"+1700{g:07d}", f"Lead {g}", f"{g % 999 + 1} King St W, Toronto ON",
+                  problems[g % len(problems)], g % 20 == 0, "voice" if g % 3 == 0 else "sms",
+                  "new" if g % 4 == 0 else "done", ago(g % 365))
+                 for g in range(1, leads + 1)])
+
+        # Conversations of ~10 messages each with the first leads' callers
+        conversations = max(1, min(messages // 10, leads))
+
+        def caller(g):
+            return g % conversations + 1
+        _insert(c, "messages", ["client_id", "phone", "role", "content", "created_at"],
+                [(tenant(caller(g)), f"+1700{caller(g):07d}", "user" if g % 2 == 0 else "assistant",
+                  f"Message {g} — the {problems[g % len(problems)]} started this morning, can someone come by?",
+                  ago(caller(g) % 365))
+                 for g in range(1, messages + 1)])
+
+        statuses = ["pending", "contacted", "responded", "no_answer", "dead", "trial"]
+        _insert(c, "outbound_leads", ["business_name", "owner_name", "phone", "city", "status",
+                                      "sms_sent", "responded", "demo_called", "demo_answered",
+                                      "follow_up_count", "last_follow_up_at", "next_follow_up_at",
+                                      "created_at"],
+                [(f"Prospect {g}", "Owner", f"+1600{g:07d}", "Toronto", statuses[g % 6],
+                  g % 6 > 0, g % 6 in (2, 3), g % 6 == 3, False, g % 3,
+                  now - timedelta(hours=2), now + timedelta(days=g % 30 - 2), ago(g % 365))
+                 for g in range(1, outbound + 1)])
+
+        event_types = ["sms_initial", "sms_followup_1", "responded_yes", "demo_called"]
+        _insert(c, "outbound_events", ["lead_phone", "event_type", "notes", "created_at"],
+                [(f"+1600{g % max(outbound, 1):07d}", event_types[g % 4], "", ago(g % 365))
+                 for g in range(1, events + 1)])
+
+        _insert(c, "demo_sessions", ["prospect_phone", "business_name", "owner_name"],
+                [(f"+1600{g:07d}", f"Prospect {g}", "Owner") for g in range(1, demos + 1)])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _sample():
+    """Existing rows the benchmarked calls look up."""
+    import database
+
+    conn = database.get_db()
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT l.client_id, l.phone, l.id, cl.twilio_number, cl.owner_phone, cl.dashboard_token
+            FROM leads l JOIN clients cl ON cl.id = l.client_id
+            WHERE l.phone LIKE '+1700%%' AND cl.active ORDER BY l.id LIMIT 1
+        """)
+        r = c.fetchone()
+        if not r:
+            raise SystemExit("No seeded data found — run without --no-seed first")
+        return {"client_id": r[0], "lead_phone": r[1], "lead_id": r[2], "twilio_number": r[3],
+                "owner_phone": r[4], "token": r[5], "prospect_phone": "+16000000003"}
+    finally:
+        conn.close()
+
+
+# ── Calls ──────────────────────────────────────────────────────────────────
+
+# Fresh keys for inserts into tables with unique constraints, across modes
+_keys = itertools.count(1)
+
+
+def benchmark_calls(s):
+    """(name, callable) for every public database.py function benchmarked."""
+    import database as db
+
+    cid, phone, prospect = s["client_id"], s["lead_phone"], s["prospect_phone"]
+    lead = {"name": "Bench Lead", "address": "1 Bench Rd", "problem": "no heat",
+            "urgent": False, "channel": "sms"}
+    return [
+        ("get_client_by_twilio_number", lambda: db.get_client_by_twilio_number(s["twilio_number"])),
+        ("get_client_by_owner_phone",   lambda: db.get_client_by_owner_phone(s["owner_phone"])),
+        ("get_client_by_dashboard_token", lambda: db.get_client_by_dashboard_token(s["token"])),
+        ("save_message",                lambda: db.save_message(phone, "user", "benchmark message", client_id=cid)),
+        ("get_conversation",            lambda: db.get_conversation(phone, client_id=cid)),
+        ("save_lead",                   lambda: db.save_lead(f"+1710{next(_keys):07d}", lead, client_id=cid)),
+        ("get_lead_by_phone",           lambda: db.get_lead_by_phone(phone, client_id=cid)),
+        ("update_lead_status",          lambda: db.update_lead_status(s["lead_id"], "done", client_id=cid)),
+        ("get_all_leads",               lambda: db.get_all_leads(cid)),
+        ("get_leads_page",              lambda: db.get_leads_page(cid)),
+        ("get_lead_stats",              lambda: db.get_lead_stats(cid)),
+        ("get_owner_leads",             lambda: db.get_owner_leads(cid, "new")),
+        ("get_recent_leads",            lambda: db.get_recent_leads(cid)),
+        ("search_leads",                lambda: db.search_leads(cid, "no heat")),
+        ("save_quote",                  lambda: db.save_quote(phone, s["lead_id"], "no heat", 150, 300, "", client_id=cid)),
+        ("create_outbound_lead",        lambda: db.create_outbound_lead("Bench Co", "Owner", f"+1610{next(_keys):07d}", "Toronto")),
+        ("get_outbound_lead_by_phone",  lambda: db.get_outbound_lead_by_phone(prospect)),
+        ("update_outbound_lead",        lambda: db.update_outbound_lead(prospect, status="contacted")),
+        ("insert_outbound_events",      lambda: db.insert_outbound_events([(prospect, "sms_initial", "")] * 50)),
+        ("get_outbound_timeline",       lambda: db.get_outbound_timeline(prospect)),
+        ("get_outbound_leads_page",     lambda: db.get_outbound_leads_page()),
+        ("get_all_outbound_leads",      lambda: db.get_all_outbound_leads()),
+        ("get_outbound_stats",          lambda: db.get_outbound_stats()),
+        ("refresh_outbound_funnel",     lambda: db.refresh_outbound_funnel()),
+        ("get_outbound_funnel",         lambda: db.get_outbound_funnel()),
+        ("get_leads_due_followup",      lambda: db.get_leads_due_followup()),
+        ("get_leads_no_answer_demo",    lambda: db.get_leads_no_answer_demo()),
+        ("create_demo_session",         lambda: db.create_demo_session(f"+1620{next(_keys):07d}", "Bench Co", "Owner")),
+        ("get_demo_session",            lambda: db.get_demo_session(prospect)),
+        ("sweep_demo_sessions",         lambda: db.sweep_demo_sessions()),
+        ("get_trials_ending_soon",      lambda: db.get_trials_ending_soon()),
+        ("get_trial_day5_clients",      lambda: db.get_trial_day5_clients()),
+    ]
+
+
+# ── Measurement ────────────────────────────────────────────────────────────
+
+class _UnpooledSQLite:
+    """SQLite backend that opens a new connection for every get_db()."""
+
+    def __init__(self, path):
+        from storage import SQLiteBackend
+        self._path = path
+        self._base = SQLiteBackend(path)
+
+    def connect(self, readonly=False):
+        from storage import SQLiteBackend
+        return SQLiteBackend(self._path).connect()
+
+    def __getattr__(self, name):
+        return getattr(self._base, name)
+
+
+def _backends(url, pool_size):
+    """{"pooled": backend, "unpooled": backend} for DATABASE_URL."""
+    from storage import PostgresBackend, SQLiteBackend
+
+    if url.startswith("sqlite://"):
+        path = url[len("sqlite:///"):] if url.startswith("sqlite:///") else ""
+        return {"pooled": SQLiteBackend(path), "unpooled": _UnpooledSQLite(path)}
+    return {"pooled": PostgresBackend(url, pool_size=pool_size),
+            "unpooled": PostgresBackend(url, pool_size=0)}
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+
+    def pct(p):
+        return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000, 3)
+    return {"p50_ms": pct(50), "p90_ms": pct(90), "p99_ms": pct(99),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+            "max_ms": round(samples[-1] * 1000, 3)}
+
+
+def measure(name, call, iterations, warmup, counter, mode):
+    for _ in range(warmup):
+        call()
+    timings = []
+    counter.db = counter.connections = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return {
+        "function": name, "mode": mode, "calls": iterations, **_percentiles(timings),
+        "round_trips_per_call": round(counter.db / iterations, 2),
+        "connections_per_call": round(counter.connections / iterations, 2),
+    }
+
+
+def run(iterations, warmup, pool_size, only=None):
+    import database
+    from replay import Counter, CountingConnection
+
+    sample = _sample()
+    counter = Counter()
+    results = []
+    original = database.BACKEND
+    try:
+        for mode, backend in _backends(database.DATABASE_URL, pool_size).items():
+            def get_db(readonly=False, backend=backend, mode=mode):
+                if mode == "unpooled":
+                    counter.connections += 1
+                return CountingConnection(backend.connect(readonly=readonly), counter)
+            database.BACKEND = backend
+            database.get_db = get_db
+            for name, call in benchmark_calls(sample):
+                if only and name not in only:
+                    continue
+                n = max(1, int(iterations * HEAVY_FRACTION)) if name in HEAVY_FUNCTIONS else iterations
+                print(f"{mode:8} {name}")
+                results.append(measure(name, call, n, min(warmup, n), counter, mode))
+    finally:
+        database.BACKEND = original
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the database.py functions.")
+    parser.add_argument("--tenants", type=int, default=SEED_TENANTS)
+    parser.add_argument("--leads", type=int, default=SEED_LEADS)
+    parser.add_argument("--messages", type=int, default=SEED_MESSAGES)
+    parser.add_argument("--outbound", type=int, default=SEED_OUTBOUND)
+    parser.add_argument("--events", type=int, default=SEED_EVENTS)
+    parser.add_argument("--demos", type=int, default=SEED_DEMOS)
+    parser.add_argument("--no-seed", action="store_true", help="reuse an already seeded database")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per function")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=10, help="Postgres pool size in pooled mode")
+    parser.add_argument("--only", help="comma-separated function names to run")
+    parser.add_argument("--json", help="write results here instead of stdout")
+    args = parser.parse_args()
+
+    workdir = None
+    if not os.getenv("DATABASE_URL"):
+        workdir = tempfile.mkdtemp(prefix="bench-db-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["DATABASE_REPLICA_URL"] = ""
+
+    import database
+    import migrations
+
+    try:
+        migrations.migrate()
+        if not args.no_seed:
+            started = time.perf_counter()
+            print(f"Seeding {args.tenants} tenants, {args.messages} messages, {args.outbound} outbound leads...")
+            seed(args.tenants, args.leads, args.messages, args.outbound, args.events, args.demos)
+            print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        results = run(args.iterations, args.warmup, args.pool_size,
+                      set(args.only.split(",")) if args.only else None)
+        report = {
+            "meta": {
+                "revision": _git_revision(),
+                "backend": database.BACKEND.name,
+                "python": platform.python_version(),
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "iterations": args.iterations,
+                "pool_size": args.pool_size,
+                "seed": None if args.no_seed else {
+                    "tenants": args.tenants, "leads": args.leads, "messages": args.messages,
+                    "outbound": args.outbound, "events": args.events, "demos": args.demos},
+            },
+            "results": results,
+        }
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Wrote {len(results)} results to {args.json}")
+        else:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+    finally:
+        if workdir:
+            import shutil
+            shutil.rmtree(workdir, ignore_errors=True)
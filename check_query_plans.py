@@ -0,0 +1,210 @@
+"""
+EXPLAIN-based guard for the hot queries in database.py.
+
+Seeds realistic volumes inside one transaction, ANALYZEs, then calls every
+hot database.py function through a connection whose cursor EXPLAINs each
+statement before running it. Any Seq Scan on a seeded table fails the check.
+Everything is rolled back at the end, so it is safe against a dev database:
+
+    DATABASE_URL=postgres://... python check_query_plans.py
+
+Run `python migrations.py` on that database first. Exit code 1 on failure.
+"""
+import sys
+import json
+import psycopg2
+import psycopg2.extensions
+
+import database
+
+SEED_CLIENTS   = 2000
+SEED_LEADS     = 50000
+SEED_MESSAGES  = 100000
+SEED_OUTBOUND  = 20000
+SEED_EVENTS    = 60000
+SEED_DEMOS     = 2000
+
+SEED_SQL = f"""
+    INSERT INTO clients (business_name, owner_name, owner_phone, twilio_number, plan, trial_ends_at, active)
+    SELECT 'Biz ' || g, 'Owner ' || g, '+1900' || lpad(g::text, 7, '0'), '+1800' || lpad(g::text, 7, '0'),
+           CASE WHEN g % 10 = 0 THEN 'trial' ELSE 'active' END,
+           NOW() + (g % 14 - 7) * INTERVAL '1 day', g % 50 <> 0
+    FROM generate_series(1, {SEED_CLIENTS}) g;
+
+    INSERT INTO leads (phone, client_id, name, address, contact_phone, problem, urgent, channel, status, created_at)
+    SELECT '+1700' || lpad(g::text, 7, '0'),
+           (SELECT MIN(id) FROM clients) + g % {SEED_CLIENTS},
+           'Lead ' || g, g || ' King St, Toronto ON', NULL, 'no heat', g % 20 = 0,
+           CASE WHEN g % 3 = 0 THEN 'voice' ELSE 'sms' END,
+           CASE WHEN g % 4 = 0 THEN 'new' ELSE 'done' END,
+           NOW() - (g % 365) * INTERVAL '1 day'
+    FROM generate_series(1, {SEED_LEADS}) g;
+
+    -- A year of monthly partitions so seeded history doesn't all land in messages_default
+    SELECT create_message_month(m::date)
+    FROM generate_series(date_trunc('month', NOW() - INTERVAL '12 months'), date_trunc('month', NOW()),
+                         INTERVAL '1 month') m;
+
+    INSERT INTO messages (client_id, phone, role, content, created_at)
+    SELECT (SELECT MIN(id) FROM clients) + (g % {SEED_LEADS}) % {SEED_CLIENTS},
+           '+1700' || lpad((g % {SEED_LEADS})::text, 7, '0'),
+           CASE WHEN g % 2 = 0 THEN 'user' ELSE 'assistant' END,
+           'message ' || g, NOW() - (g % 365) * INTERVAL '1 day'
+    FROM generate_series(1, {SEED_MESSAGES}) g;
+
+    INSERT INTO outbound_leads (business_name, owner_name, phone, city, status, sms_sent,
+                                responded, demo_called, demo_answered, follow_up_count,
+                                last_follow_up_at, next_follow_up_at, created_at)
+    SELECT 'Prospect ' || g, 'Owner', '+1600' || lpad(g::text, 7, '0'), 'Toronto',
+           (ARRAY['pending','contacted','responded','no_answer','dead','trial'])[g % 6 + 1],
+           g % 6 > 0, g % 6 IN (2, 3), g % 6 = 3, FALSE, g % 3,
+           NOW() - INTERVAL '2 hours', NOW() + (g % 30 - 2) * INTERVAL '1 day',
+           NOW() - (g % 365) * INTERVAL '1 day'
+    FROM generate_series(1, {SEED_OUTBOUND}) g;
+
+    INSERT INTO outbound_events (lead_phone, event_type, created_at)
+    SELECT '+1600' || lpad((g % {SEED_OUTBOUND})::text, 7, '0'),
+           (ARRAY['sms_initial','sms_followup_1','responded_yes','demo_called'])[g % 4 + 1],
+           NOW() - (g % 365) * INTERVAL '1 day'
+    FROM generate_series(1, {SEED_EVENTS}) g;
+
+    INSERT INTO demo_sessions (prospect_phone, business_name, owner_name)
+    SELECT '+1600' || lpad(g::text, 7, '0'), 'Prospect ' || g, 'Owner'
+    FROM generate_series(1, {SEED_DEMOS}) g;
+
+    ANALYZE;
+"""
+
+WATCHED_TABLES = {
+    "clients", "leads", "messages", "quotes", "outbound_leads",
+    "outbound_events", "demo_sessions"
+}
+
+
+def _watched(rel):
+    # Partitions show up under their own names (leads_shared_3, messages_y2026m03_p7)
+    return any(rel == t or rel.startswith(t + "_") for t in WATCHED_TABLES)
+
+
+def _seq_scans(plan):
+    """Yield relation names of every Seq Scan node in an EXPLAIN JSON plan."""
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan.get("Relation Name")
+    for child in plan.get("Plans", []):
+        yield from _seq_scans(child)
+
+
+class ExplainCursor(psycopg2.extensions.cursor):
+    """Runs EXPLAIN on every SELECT/UPDATE/DELETE before executing it."""
+    violations = None
+    current = None
+
+    def execute(self, sql, params=None):
+        head = sql.lstrip().split(None, 1)[0].upper()
+        if head in ("SELECT", "WITH", "UPDATE", "DELETE") and "pg_notify" not in sql:
+            super().execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = self.fetchone()[0]
+            plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+            for rel in _seq_scans(plan):
+                if rel and _watched(rel):
+                    ExplainCursor.violations.append((ExplainCursor.current, rel, " ".join(sql.split())))
+        return super().execute(sql, params)
+
+
+class CheckConnection:
+    """Stands in for database.get_db(): one shared transaction, each call
+    isolated by a savepoint, nothing ever committed."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return self._conn.cursor(cursor_factory=ExplainCursor)
+
+    def commit(self):
+        self._conn.cursor().execute("RELEASE SAVEPOINT fn")
+        self._conn.cursor().execute("SAVEPOINT fn")
+
+    def rollback(self):
+        self._conn.cursor().execute("ROLLBACK TO SAVEPOINT fn")
+
+    def close(self):
+        pass
+
+    def set_isolation_level(self, level):
+        pass
+
+
+def hot_calls(sample):
+    """(label, callable) for every hot-path database.py function."""
+    cid, phone, token = sample["client_id"], sample["lead_phone"], sample["token"]
+    prospect = sample["prospect_phone"]
+    return [
+        ("get_client_by_twilio_number", lambda: database.get_client_by_twilio_number(sample["twilio_number"])),
+        ("get_client_by_owner_phone",   lambda: database.get_client_by_owner_phone(sample["owner_phone"])),
+        ("get_client_by_dashboard_token", lambda: database.get_client_by_dashboard_token(token)),
+        ("get_conversation",            lambda: database.get_conversation(phone, client_id=cid)),
+        ("get_lead_by_phone",           lambda: database.get_lead_by_phone(phone, client_id=cid)),
+        ("get_owner_leads new",         lambda: database.get_owner_leads(cid, "new")),
+        ("get_owner_leads urgent",      lambda: database.get_owner_leads(cid, "urgent")),
+        ("get_owner_leads today",       lambda: database.get_owner_leads(cid, "today")),
+        ("get_leads_page tenant",       lambda: database.get_leads_page(cid)),
+        ("get_leads_page all",          lambda: database.get_leads_page(all_tenants=True)),
+        ("get_recent_leads",            lambda: database.get_recent_leads(cid)),
+        ("search_leads",                lambda: database.search_leads(cid, "no heat")),
+        ("search_leads phone",          lambda: database.search_leads(cid, phone[-6:])),
+        ("update_lead_status",          lambda: database.update_lead_status(sample["lead_id"], "done", client_id=cid)),
+        ("get_outbound_lead_by_phone",  lambda: database.get_outbound_lead_by_phone(prospect)),
+        ("update_outbound_lead",        lambda: database.update_outbound_lead(prospect, status="contacted")),
+        ("get_outbound_leads_page",     lambda: database.get_outbound_leads_page()),
+        ("get_outbound_timeline",       lambda: database.get_outbound_timeline(prospect)),
+        ("get_leads_due_followup",      lambda: database.get_leads_due_followup()),
+        ("get_leads_no_answer_demo",    lambda: database.get_leads_no_answer_demo()),
+        ("get_demo_session",            lambda: database.get_demo_session(prospect)),
+        ("sweep_demo_sessions",         lambda: database.sweep_demo_sessions()),
+        ("get_trials_ending_soon",      lambda: database.get_trials_ending_soon()),
+        ("get_trial_day5_clients",      lambda: database.get_trial_day5_clients()),
+    ]
+
+
+def run_check():
+    conn = psycopg2.connect(database.DATABASE_URL)
+    original_get_db = database.get_db
+    ExplainCursor.violations = []
+    try:
+        c = conn.cursor()
+        print("Seeding...")
+        c.execute(SEED_SQL)
+        c.execute("""
+            SELECT l.client_id, l.phone, l.id, cl.twilio_number, cl.owner_phone, cl.dashboard_token
+            FROM leads l JOIN clients cl ON cl.id = l.client_id
+            WHERE l.phone LIKE '+1700%%' AND cl.active ORDER BY l.id DESC LIMIT 1
+        """)
+        r = c.fetchone()
+        sample = {
+            "client_id": r[0], "lead_phone": r[1], "lead_id": r[2],
+            "twilio_number": r[3], "owner_phone": r[4], "token": r[5],
+            "prospect_phone": "+16000000003"
+        }
+        c.execute("SAVEPOINT fn")
+
+        database.get_db = lambda *args, **kwargs: CheckConnection(conn)
+        for label, call in hot_calls(sample):
+            ExplainCursor.current = label
+            call()
+    finally:
+        database.get_db = original_get_db
+        conn.rollback()
+        conn.close()
+
+    for label, rel, sql in ExplainCursor.violations:
+        print(f"SEQ SCAN on {rel} in {label}: {sql[:160]}")
+    if ExplainCursor.violations:
+        print(f"{len(ExplainCursor.violations)} hot queries fall back to a sequential scan")
+        return False
+    print("All hot queries use indexes")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_check() else 1)
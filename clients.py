@@ -0,0 +1,34 @@
+"""
+OpenAI and Twilio API clients, built on first use.
+
+Importing the SDKs alone costs most of a second (openai is ~0.8s), so no
+module constructs a client — or imports the SDK — at import time. One client
+of each is shared by every thread; both SDKs are safe to use concurrently.
+create_app() builds them during warm-up so the first call doesn't pay.
+"""
+import os
+import threading
+
+_lock   = threading.Lock()
+_openai = None
+_twilio = None
+
+
+def openai_client():
+    global _openai
+    if _openai is None:
+        with _lock:
+            if _openai is None:
+                from openai import OpenAI
+                _openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _openai
+
+
+def twilio_client():
+    global _twilio
+    if _twilio is None:
+        with _lock:
+            if _twilio is None:
+                from twilio.rest import Client
+                _twilio = Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+    return _twilio
@@ -1,87 +1,54 @@
-import sys
-sys.stdout = sys.stderr
-
 import os
-import psycopg2
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from storage import backend_for_url, begin_session, end_session, DATABASE_REPLICA_URL
+from profiling import track_db
+from metrics import register_gauge
+from logs import get_logger
+from jsoncodec import dumps
+
+log = get_logger("database")
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
-def get_db():
-    return psycopg2.connect(DATABASE_URL)
+# Postgres in production, embedded SQLite for sqlite:/// URLs (see storage.py).
+# With DATABASE_REPLICA_URL set, get_db(readonly=True) may use the replica.
+BACKEND = backend_for_url(DATABASE_URL, DATABASE_REPLICA_URL)
 
-def init_db():
-    conn = get_db()
-    try:
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id SERIAL PRIMARY KEY,
-                phone TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                created_at TIMESTAMPTZ DEFAULT NOW()
-            )
-        """)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS leads (
-                id SERIAL PRIMARY KEY,
-                phone TEXT NOT NULL UNIQUE,
-                client_id INTEGER,
-                name TEXT,
-                address TEXT,
-                contact_phone TEXT,
-                problem TEXT,
-                urgent BOOLEAN DEFAULT FALSE,
-                channel TEXT DEFAULT 'sms',
-                status TEXT DEFAULT 'new',
-                created_at TIMESTAMPTZ DEFAULT NOW(),
-                updated_at TIMESTAMPTZ DEFAULT NOW()
-            )
-        """)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS quotes (
-                id SERIAL PRIMARY KEY,
-                lead_id INTEGER REFERENCES leads(id),
-                phone TEXT NOT NULL,
-                problem TEXT,
-                estimate_low INTEGER DEFAULT 0,
-                estimate_high INTEGER DEFAULT 0,
-                details TEXT,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMPTZ DEFAULT NOW()
-            )
-        """)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS clients (
-                id SERIAL PRIMARY KEY,
-                business_name TEXT NOT NULL,
-                owner_name TEXT,
-                owner_phone TEXT UNIQUE,
-                twilio_number TEXT UNIQUE,
-                province TEXT DEFAULT 'ON',
-                plan TEXT DEFAULT 'trial',
-                trial_ends_at TIMESTAMPTZ,
-                stripe_customer_id TEXT,
-                active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMPTZ DEFAULT NOW(),
-                updated_at TIMESTAMPTZ DEFAULT NOW()
-            )
-        """)
-        c.execute("""
-            CREATE INDEX IF NOT EXISTS idx_messages_phone ON messages(phone);
-            CREATE INDEX IF NOT EXISTS idx_leads_phone ON leads(phone);
-            CREATE INDEX IF NOT EXISTS idx_leads_status ON leads(status);
-            CREATE INDEX IF NOT EXISTS idx_clients_twilio_number ON clients(twilio_number);
-            CREATE INDEX IF NOT EXISTS idx_clients_owner_phone ON clients(owner_phone);
-        """)
-        conn.commit()
-        print("Database initialized (PostgreSQL)")
-    except Exception as e:
-        conn.rollback()
-        print(f"DB init error: {e}")
-    finally:
-        conn.close()
+# NOTIFY channel carrying lead changes to dashboards (see live.py)
+LEAD_EVENTS_CHANNEL = "lead_events"
+
+def get_db(readonly=False):
+    """Connection for one call. readonly=True marks reporting reads that can
+    tolerate a few seconds of replica lag — they go to the replica unless it
+    is lagging, unreachable, or this request already wrote (read-your-writes)."""
+    started = time.perf_counter()
+    return track_db(BACKEND.connect(readonly=readonly), started)
+
+def pool_stats():
+    """[{pool, size, in_use, idle}] per Postgres pool; empty without pooling."""
+    return BACKEND.pool_stats()
+
+register_gauge("tradie_db_pool_size", lambda: [({"pool": p["pool"]}, p["size"]) for p in pool_stats()])
+register_gauge("tradie_db_pool_connections", lambda: [
+    ({"pool": p["pool"], "state": state}, p[state]) for p in pool_stats() for state in ("in_use", "idle")
+])
+
+def replica_status():
+    """Routing stats and last measured lag, or None without a replica."""
+    return BACKEND.status() if hasattr(BACKEND, "status") else None
 
+def supports(feature):
+    """True if the storage backend has a Postgres-only feature: notify,
+    partitions, fulltext, server_cursors, advisory_locks, analytics."""
+    return feature in BACKEND.capabilities
+
+def tenant_key(client_id):
+    """leads/messages are keyed and partitioned by tenant. The default
+    (env-configured) client has no clients row — it is tenant 0."""
+    return client_id or 0
 
 # ── Client lookup ──────────────────────────────────────────────────────────
 
@@ -109,7 +76,7 @@ def get_client_by_twilio_number(twilio_number):
             "active": r[7]
         }
     except Exception as e:
-        print(f"get_client_by_twilio_number error: {e}")
+        log.error("db_error", op="get_client_by_twilio_number", error=e)
         return None
     finally:
         conn.close()
@@ -137,7 +104,7 @@ def get_client_by_owner_phone(owner_phone):
             "active": r[7]
         }
     except Exception as e:
-        print(f"get_client_by_owner_phone error: {e}")
+        log.error("db_error", op="get_client_by_owner_phone", error=e)
         return None
     finally:
         conn.close()
@@ -163,7 +130,30 @@ def create_client(business_name, owner_name, owner_phone, twilio_number, provinc
         return client_id
     except Exception as e:
         conn.rollback()
-        print(f"create_client error: {e}")
+        log.error("db_error", op="create_client", error=e)
+        return None
+    finally:
+        conn.close()
+
+
+def get_client_by_dashboard_token(token):
+    """Look up client by dashboard token. trial_ends_at stays a datetime."""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT id, business_name, owner_name, twilio_number, trial_ends_at, plan
+            FROM clients WHERE dashboard_token = %s AND active = TRUE
+        """, (token,))
+        r = c.fetchone()
+        if not r:
+            return None
+        return {
+            "id": r[0], "business_name": r[1], "owner_name": r[2],
+            "twilio_number": r[3], "trial_ends_at": r[4], "plan": r[5]
+        }
+    except Exception as e:
+        log.error("db_error", op="get_client_by_dashboard_token", error=e)
         return None
     finally:
         conn.close()
@@ -171,61 +161,80 @@ def create_client(business_name, owner_name, owner_phone, twilio_number, provinc
 
 # ── Messages ───────────────────────────────────────────────────────────────
 
-def save_message(phone, role, content):
+def save_message(phone, role, content, client_id=None):
     conn = get_db()
     try:
         c = conn.cursor()
         c.execute(
-            "INSERT INTO messages (phone, role, content) VALUES (%s, %s, %s)",
-            (phone, role, content)
+            "INSERT INTO messages (client_id, phone, role, content) VALUES (%s, %s, %s, %s)",
+            (tenant_key(client_id), phone, role, content)
         )
         conn.commit()
     except Exception as e:
         conn.rollback()
-        print(f"save_message error: {e}")
+        log.error("db_error", op="save_message", error=e)
     finally:
         conn.close()
 
-def get_conversation(phone):
+def get_conversation(phone, client_id=None):
     conn = get_db()
     try:
         c = conn.cursor()
         c.execute(
-            "SELECT role, content FROM messages WHERE phone = %s ORDER BY created_at ASC",
-            (phone,)
+            "SELECT role, content FROM messages WHERE client_id = %s AND phone = %s ORDER BY created_at ASC",
+            (tenant_key(client_id), phone)
         )
         rows = c.fetchall()
         return [{"role": r[0], "content": r[1]} for r in rows]
     except Exception as e:
-        print(f"get_conversation error: {e}")
+        log.error("db_error", op="get_conversation", error=e)
         return []
     finally:
         conn.close()
 
+def delete_conversation(phone, client_id=None):
+    """Drop a caller's message history with one tenant (e.g. before a demo)."""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute(
+            "DELETE FROM messages WHERE client_id = %s AND phone = %s",
+            (tenant_key(client_id), phone)
+        )
+        conn.commit()
+        return c.rowcount
+    except Exception as e:
+        conn.rollback()
+        log.error("db_error", op="delete_conversation", error=e)
+        return 0
+    finally:
+        conn.close()
+
 
 # ── Leads ──────────────────────────────────────────────────────────────────
 
 def save_lead(phone, lead_data, client_id=None):
+    """Upsert the lead for (tenant, phone) — the same caller reaching two
+    businesses on the platform gets one lead per business."""
     conn = get_db()
     try:
         c = conn.cursor()
         c.execute("""
             INSERT INTO leads (phone, client_id, name, address, contact_phone, problem, urgent, channel)
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (phone) DO UPDATE SET
+            ON CONFLICT (client_id, phone) DO UPDATE SET
                 name=EXCLUDED.name,
                 address=EXCLUDED.address,
                 contact_phone=EXCLUDED.contact_phone,
                 problem=EXCLUDED.problem,
                 urgent=EXCLUDED.urgent,
                 channel=EXCLUDED.channel,
-                client_id=EXCLUDED.client_id,
                 status='new',
                 updated_at=NOW()
-            RETURNING id
+            RETURNING id, client_id, status, created_at
         """, (
             phone,
-            client_id or lead_data.get("client_id"),
+            tenant_key(client_id or lead_data.get("client_id")),
             lead_data.get("name"),
             lead_data.get("address"),
             lead_data.get("phone"),
@@ -233,25 +242,35 @@ def save_lead(phone, lead_data, client_id=None):
             bool(lead_data.get("urgent")),
             lead_data.get("channel", "sms")
         ))
-        lead_id = c.fetchone()[0]
+        r = c.fetchone()
+        lead_id = r[0]
+        _notify_lead_event(c, "saved", {
+            "id": lead_id, "client_id": r[1], "phone": phone,
+            "name": lead_data.get("name"), "address": lead_data.get("address"),
+            "contact_phone": lead_data.get("phone"),
+            "problem": (lead_data.get("problem") or "")[:500],
+            "urgent": bool(lead_data.get("urgent")), "status": r[2],
+            "channel": lead_data.get("channel", "sms"), "created_at": str(r[3])
+        })
         conn.commit()
         return lead_id
     except Exception as e:
         conn.rollback()
-        print(f"save_lead error: {e}")
+        log.error("db_error", op="save_lead", error=e)
         return None
     finally:
         conn.close()
 
-def get_all_leads(client_id=None):
-    conn = get_db()
+def get_all_leads(client_id=None, all_tenants=False):
+    """The tenant's leads, newest first — every tenant's with all_tenants."""
+    conn = get_db(readonly=True)
     try:
         c = conn.cursor()
-        if client_id:
+        if not all_tenants:
             c.execute("""
                 SELECT id, phone, name, address, contact_phone, problem, urgent, channel, status, created_at
                 FROM leads WHERE client_id = %s ORDER BY created_at DESC
-            """, (client_id,))
+            """, (tenant_key(client_id),))
         else:
             c.execute("""
                 SELECT id, phone, name, address, contact_phone, problem, urgent, channel, status, created_at
@@ -264,19 +283,117 @@ def get_all_leads(client_id=None):
             "channel": r[7], "status": r[8], "created_at": str(r[9])
         } for r in rows]
     except Exception as e:
-        print(f"get_all_leads error: {e}")
+        log.error("db_error", op="get_all_leads", error=e)
         return []
     finally:
         conn.close()
 
-def get_lead_by_phone(phone):
+def get_leads_page(client_id=None, before=None, limit=50, all_tenants=False):
+    """One keyset page of the tenant's leads (every tenant's with
+    all_tenants), newest first.
+    before is (created_at, id) of the last row on the previous page, so every
+    page is an index range scan no matter how deep it is."""
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        where, params = [], []
+        if not all_tenants:
+            where.append("client_id = %s")
+            params.append(tenant_key(client_id))
+        if before:
+            where.append("(created_at, id) < (%s::timestamptz, %s)")
+            params.extend(before)
+        c.execute(f"""
+            SELECT id, phone, name, address, contact_phone, problem, urgent, channel, status, created_at
+            FROM leads {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY created_at DESC, id DESC LIMIT %s
+        """, params + [limit])
+        rows = c.fetchall()
+        return [{
+            "id": r[0], "phone": r[1], "name": r[2], "address": r[3],
+            "contact_phone": r[4], "problem": r[5], "urgent": r[6],
+            "channel": r[7], "status": r[8], "created_at": str(r[9])
+        } for r in rows]
+    except Exception as e:
+        log.error("db_error", op="get_leads_page", error=e)
+        return []
+    finally:
+        conn.close()
+
+def get_lead_stats(client_id=None, all_tenants=False):
+    """Dashboard tiles — total, urgent and new lead counts in one aggregate,
+    for the tenant or, with all_tenants, for every tenant."""
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT COUNT(*),
+                   COUNT(*) FILTER (WHERE urgent),
+                   COUNT(*) FILTER (WHERE status = 'new')
+            FROM leads {"" if all_tenants else "WHERE client_id = %s"}
+        """, () if all_tenants else (tenant_key(client_id),))
+        r = c.fetchone()
+        return {"total": r[0], "urgent": r[1], "new": r[2]}
+    except Exception as e:
+        log.error("db_error", op="get_lead_stats", error=e)
+        return {"total": 0, "urgent": 0, "new": 0}
+    finally:
+        conn.close()
+
+# Owner SMS commands → filter on top of the (client_id, ...) lead indexes
+OWNER_LEAD_FILTERS = {
+    "new":    "status = 'new'",
+    "urgent": "status = 'new' AND urgent = TRUE",
+    "today":  "created_at >= %(today)s",
+}
+OWNER_TIMEZONE = os.environ.get("OWNER_TIMEZONE", "America/Toronto")
+# get_owner_leads counts at most this many matching leads
+OWNER_COUNT_CAP = 100
+
+def get_owner_leads(client_id, kind="new", limit=5):
+    """Count and newest `limit` leads for an owner command.
+    Returns {"count": n, "capped": bool, "leads": [...]} — count covers all
+    matching leads, not just the rows returned, up to OWNER_COUNT_CAP
+    (capped is True when there are at least that many). Both queries stop
+    early, so the cost doesn't grow with the tenant's backlog."""
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        midnight = datetime.now(ZoneInfo(OWNER_TIMEZONE)).replace(hour=0, minute=0, second=0, microsecond=0)
+        params = {"today": midnight, "limit": limit, "cap": OWNER_COUNT_CAP, "client_id": tenant_key(client_id)}
+        where = f"client_id = %(client_id)s AND {OWNER_LEAD_FILTERS[kind]}"
+        c.execute(f"""
+            SELECT id, phone, name, contact_phone, problem, urgent, status, created_at
+            FROM leads WHERE {where}
+            ORDER BY created_at DESC LIMIT %(limit)s
+        """, params)
+        rows = c.fetchall()
+        count = len(rows)
+        if count == limit:
+            c.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM leads WHERE {where} LIMIT %(cap)s) t", params)
+            count = c.fetchone()[0]
+        return {
+            "count": count,
+            "capped": count >= OWNER_COUNT_CAP,
+            "leads": [{
+                "id": r[0], "phone": r[1], "name": r[2], "contact_phone": r[3],
+                "problem": r[4], "urgent": r[5], "status": r[6], "created_at": str(r[7])
+            } for r in rows]
+        }
+    except Exception as e:
+        log.error("db_error", op="get_owner_leads", error=e)
+        return {"count": 0, "capped": False, "leads": []}
+    finally:
+        conn.close()
+
+def get_lead_by_phone(phone, client_id=None):
     conn = get_db()
     try:
         c = conn.cursor()
         c.execute("""
             SELECT id, phone, name, address, contact_phone, problem, urgent, status, client_id
-            FROM leads WHERE phone = %s
-        """, (phone,))
+            FROM leads WHERE client_id = %s AND phone = %s
+        """, (tenant_key(client_id), phone))
         r = c.fetchone()
         if not r:
             return None
@@ -286,99 +403,262 @@ def get_lead_by_phone(phone):
             "status": r[7], "client_id": r[8]
         }
     except Exception as e:
-        print(f"get_lead_by_phone error: {e}")
+        log.error("db_error", op="get_lead_by_phone", error=e)
         return None
     finally:
         conn.close()
 
-def update_lead_status(lead_id, status):
+def update_lead_status(lead_id, status, client_id=None):
+    """Set the status of one of the tenant's leads. Returns True if updated."""
     conn = get_db()
     try:
         c = conn.cursor()
         c.execute(
-            "UPDATE leads SET status=%s, updated_at=NOW() WHERE id=%s",
-            (status, lead_id)
+            "UPDATE leads SET status=%s, updated_at=NOW() WHERE client_id=%s AND id=%s RETURNING client_id",
+            (status, tenant_key(client_id), lead_id)
         )
+        r = c.fetchone()
+        if r:
+            _notify_lead_event(c, "status", {"id": int(lead_id), "client_id": r[0], "status": status})
         conn.commit()
+        return bool(r)
     except Exception as e:
         conn.rollback()
-        print(f"update_lead_status error: {e}")
+        log.error("db_error", op="update_lead_status", error=e)
+        return False
+    finally:
+        conn.close()
+
+def get_recent_leads(client_id, limit=50):
+    """Newest leads for the client dashboard API. Read from the primary: the
+    body is cached until the next lead event, and a lagging replica would
+    pin a body without the lead that event announced."""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT id, name, phone, address, problem, urgent, status, created_at
+            FROM leads WHERE client_id = %s
+            ORDER BY created_at DESC LIMIT %s
+        """, (client_id, limit))
+        rows = c.fetchall()
+        return [{
+            "id": r[0], "name": r[1], "phone": r[2], "address": r[3],
+            "problem": r[4], "urgent": r[5], "status": r[6],
+            "created_at": str(r[7])
+        } for r in rows]
+    except Exception as e:
+        log.error("db_error", op="get_recent_leads", error=e)
+        return None
+    finally:
+        conn.close()
+
+
+# ── Search ─────────────────────────────────────────────────────────────────
+
+# Transcript hits count for less than a match on the lead itself
+SEARCH_MESSAGE_WEIGHT = 0.5
+SEARCH_ADDRESS_WEIGHT = 0.5
+# Queries with at least this many digits also match phone numbers
+SEARCH_MIN_PHONE_DIGITS = 4
+
+def search_leads(client_id, query, limit=20, offset=0, days=None):
+    """Ranked, tenant-scoped lead search. A lead matches on its name, problem
+    or address (full-text), on a fuzzy address or partial phone (trigram), or
+    on anything said in its conversation. Returns {"total": n, "results": [...]};
+    results carry a snippet of the best matching message, if any. The total
+    is counted alongside the page, so a page past the end can't see it:
+    total is None (unknown) there, not 0."""
+    if not supports("fulltext"):
+        return _search_leads_simple(client_id, query, limit, offset, days)
+    digits = "".join(ch for ch in query if ch.isdigit())
+    params = {
+        "client_id": tenant_key(client_id), "q": query.strip(),
+        "phone": f"%{digits}%", "limit": limit, "offset": offset, "days": days,
+        "message_weight": SEARCH_MESSAGE_WEIGHT, "address_weight": SEARCH_ADDRESS_WEIGHT
+    }
+    phone_hits = """
+                UNION ALL
+                SELECT l.id, 1.0, NULL FROM leads l
+                WHERE l.client_id = %(client_id)s
+                  AND (l.phone LIKE %(phone)s OR l.contact_phone LIKE %(phone)s)""" if len(digits) >= SEARCH_MIN_PHONE_DIGITS else ""
+    since = "AND l.created_at >= NOW() - %(days)s * INTERVAL '1 day'" if days else ""
+
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        c.execute(f"""
+            WITH q AS (SELECT websearch_to_tsquery('english', %(q)s) AS tsq),
+            hits AS (
+                SELECT l.id, ts_rank(l.search_vector, q.tsq) AS rank, NULL AS snippet
+                FROM leads l, q
+                WHERE l.client_id = %(client_id)s AND l.search_vector @@ q.tsq
+                UNION ALL
+                SELECT l.id, word_similarity(%(q)s, l.address) * %(address_weight)s, NULL
+                FROM leads l
+                WHERE l.client_id = %(client_id)s AND %(q)s <%% l.address{phone_hits}
+                UNION ALL
+                SELECT l.id, ts_rank(m.search_vector, q.tsq) * %(message_weight)s,
+                       ts_headline('english', m.content, q.tsq, 'MaxWords=15, MinWords=5')
+                FROM messages m CROSS JOIN q
+                JOIN leads l ON l.client_id = m.client_id AND l.phone = m.phone
+                WHERE m.client_id = %(client_id)s AND m.search_vector @@ q.tsq
+            ),
+            ranked AS (
+                SELECT id, MAX(rank) AS rank,
+                       (array_agg(snippet ORDER BY rank DESC) FILTER (WHERE snippet IS NOT NULL))[1] AS snippet
+                FROM hits GROUP BY id
+            )
+            SELECT l.id, l.phone, l.name, l.address, l.contact_phone, l.problem, l.urgent,
+                   l.status, l.created_at, r.rank, r.snippet, COUNT(*) OVER () AS total
+            FROM ranked r
+            JOIN leads l ON l.client_id = %(client_id)s AND l.id = r.id
+            WHERE TRUE {since}
+            ORDER BY r.rank DESC, l.created_at DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+        """, params)
+        rows = c.fetchall()
+        return {
+            "total": rows[0][11] if rows else _empty_page_total(offset),
+            "results": [{
+                "id": r[0], "phone": r[1], "name": r[2], "address": r[3],
+                "contact_phone": r[4], "problem": r[5], "urgent": r[6], "status": r[7],
+                "created_at": str(r[8]), "rank": round(float(r[9]), 4), "snippet": r[10]
+            } for r in rows]
+        }
+    except Exception as e:
+        log.error("db_error", op="search_leads", error=e)
+        return None
     finally:
         conn.close()
 
-def save_quote(phone, lead_id, problem, low, high, details):
+
+def _empty_page_total(offset):
+    # No rows at offset 0 means no matches; past it there may be some
+    return 0 if not offset else None
+
+
+def _search_leads_simple(client_id, query, limit, offset, days):
+    """search_leads for backends without tsvector/pg_trgm: substring match of
+    every term on the lead or its conversation, ranked by terms matched."""
+    terms = [t.lower() for t in query.split()][:8]
+    if not terms:
+        return {"total": 0, "results": []}
+    params = {"client_id": tenant_key(client_id), "limit": limit, "offset": offset, "days": days}
+    scores = []
+    for i, term in enumerate(terms):
+        params[f"t{i}"] = f"%{term}%"
+        scores.append(f"""(CASE WHEN lower(COALESCE(l.name, '') || ' ' || COALESCE(l.problem, '') || ' ' ||
+                                      COALESCE(l.address, '') || ' ' || l.phone || ' ' ||
+                                      COALESCE(l.contact_phone, '')) LIKE %(t{i})s
+                                 OR EXISTS (SELECT 1 FROM messages m WHERE m.client_id = l.client_id
+                                            AND m.phone = l.phone AND lower(m.content) LIKE %(t{i})s)
+                            THEN 1 ELSE 0 END)""")
+    since = "AND l.created_at >= NOW() - %(days)s * INTERVAL '1 day'" if days else ""
+
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT r.*, COUNT(*) OVER () AS total FROM (
+                SELECT l.id, l.phone, l.name, l.address, l.contact_phone, l.problem, l.urgent,
+                       l.status, l.created_at, ({" + ".join(scores)}) AS rank
+                FROM leads l WHERE l.client_id = %(client_id)s {since}
+            ) r
+            WHERE rank > 0
+            ORDER BY rank DESC, created_at DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+        """, params)
+        rows = c.fetchall()
+        return {
+            "total": rows[0][10] if rows else _empty_page_total(offset),
+            "results": [{
+                "id": r[0], "phone": r[1], "name": r[2], "address": r[3],
+                "contact_phone": r[4], "problem": r[5], "urgent": r[6], "status": r[7],
+                "created_at": str(r[8]), "rank": float(r[9]) / len(terms), "snippet": None
+            } for r in rows]
+        }
+    except Exception as e:
+        log.error("db_error", op="search_leads", error=e)
+        return None
+    finally:
+        conn.close()
+
+
+# ── Lead events (LISTEN/NOTIFY) ────────────────────────────────────────────
+
+def _notify_lead_event(cursor, event, lead):
+    """Queue a NOTIFY in the caller's transaction — delivered only on commit."""
+    BACKEND.notify(cursor, LEAD_EVENTS_CHANNEL, dumps({"event": event, "lead": lead}))
+
+def listen_lead_events(callback, poll_timeout=30):
+    """Block calling callback(payload) for every lead event. Returns (or
+    raises) only when the connection is lost."""
+    BACKEND.listen(LEAD_EVENTS_CHANNEL, callback, poll_timeout)
+
+def save_quote(phone, lead_id, problem, low, high, details, client_id=None):
     conn = get_db()
     try:
         c = conn.cursor()
         c.execute("""
-            INSERT INTO quotes (lead_id, phone, problem, estimate_low, estimate_high, details)
-            VALUES (%s, %s, %s, %s, %s, %s) RETURNING id
-        """, (lead_id, phone, problem, low, high, details))
+            INSERT INTO quotes (client_id, lead_id, phone, problem, estimate_low, estimate_high, details)
+            VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id
+        """, (tenant_key(client_id), lead_id, phone, problem, low, high, details))
         quote_id = c.fetchone()[0]
         conn.commit()
         return quote_id
     except Exception as e:
         conn.rollback()
-        print(f"save_quote error: {e}")
+        log.error("db_error", op="save_quote", error=e)
         return None
     finally:
         conn.close()
 
 
 
-# ── Outbound leads ──────────────────────────────────────────────────────────
+# ── Tenant usage ───────────────────────────────────────────────────────────
 
-def init_outbound_tables():
+def flush_tenant_usage(day, deltas):
+    """Add in-process usage deltas for one day and return that day's
+    llm_tokens total per tenant (client_id 0 = default client).
+    deltas: {client_id: {"llm_calls": n, "llm_tokens": n, "llm_rejected": n}}
+    Returns None on error so the caller can retry the deltas."""
     conn = get_db()
     try:
         c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS outbound_leads (
-                id SERIAL PRIMARY KEY,
-                business_name TEXT NOT NULL,
-                owner_name TEXT,
-                phone TEXT UNIQUE NOT NULL,
-                city TEXT,
-                status TEXT DEFAULT 'pending',
-                sms_sent BOOLEAN DEFAULT FALSE,
-                sms_sent_at TIMESTAMPTZ,
-                sms_opened BOOLEAN DEFAULT FALSE,
-                responded BOOLEAN DEFAULT FALSE,
-                responded_at TIMESTAMPTZ,
-                demo_called BOOLEAN DEFAULT FALSE,
-                demo_answered BOOLEAN DEFAULT FALSE,
-                demo_called_at TIMESTAMPTZ,
-                trial_activated BOOLEAN DEFAULT FALSE,
-                trial_activated_at TIMESTAMPTZ,
-                paid BOOLEAN DEFAULT FALSE,
-                follow_up_count INTEGER DEFAULT 0,
-                last_follow_up_at TIMESTAMPTZ,
-                next_follow_up_at TIMESTAMPTZ,
-                notes TEXT,
-                created_at TIMESTAMPTZ DEFAULT NOW(),
-                updated_at TIMESTAMPTZ DEFAULT NOW()
-            )
-        """)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS outbound_events (
-                id SERIAL PRIMARY KEY,
-                lead_phone TEXT NOT NULL,
-                event_type TEXT NOT NULL,
-                notes TEXT,
-                created_at TIMESTAMPTZ DEFAULT NOW()
-            )
-        """)
-        c.execute("CREATE INDEX IF NOT EXISTS idx_outbound_phone ON outbound_leads(phone)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_outbound_status ON outbound_leads(status)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_outbound_next_followup ON outbound_leads(next_follow_up_at)")
+        for client_id, fields in deltas.items():
+            c.execute("""
+                INSERT INTO tenant_usage_daily (day, client_id, llm_calls, llm_tokens, llm_rejected)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (day, client_id) DO UPDATE SET
+                    llm_calls=tenant_usage_daily.llm_calls + EXCLUDED.llm_calls,
+                    llm_tokens=tenant_usage_daily.llm_tokens + EXCLUDED.llm_tokens,
+                    llm_rejected=tenant_usage_daily.llm_rejected + EXCLUDED.llm_rejected,
+                    updated_at=NOW()
+            """, (
+                day, client_id,
+                fields.get("llm_calls", 0),
+                fields.get("llm_tokens", 0),
+                fields.get("llm_rejected", 0)
+            ))
+        c.execute(
+            "SELECT client_id, llm_tokens FROM tenant_usage_daily WHERE day = %s",
+            (day,)
+        )
+        totals = {r[0]: r[1] for r in c.fetchall()}
         conn.commit()
-        print("Outbound tables ready")
+        return totals
     except Exception as e:
         conn.rollback()
-        print(f"init_outbound_tables error: {e}")
+        log.error("db_error", op="flush_tenant_usage", error=e)
+        return None
     finally:
         conn.close()
 
+
+
+# ── Outbound leads ──────────────────────────────────────────────────────────
+
 def create_outbound_lead(business_name, owner_name, phone, city):
     conn = get_db()
     try:
@@ -394,7 +674,7 @@ def create_outbound_lead(business_name, owner_name, phone, city):
         return result[0] if result else None
     except Exception as e:
         conn.rollback()
-        print(f"create_outbound_lead error: {e}")
+        log.error("db_error", op="create_outbound_lead", error=e)
         return None
     finally:
         conn.close()
@@ -420,7 +700,7 @@ def get_outbound_lead_by_phone(phone):
             "follow_up_count": r[12], "next_follow_up_at": r[13]
         }
     except Exception as e:
-        print(f"get_outbound_lead_by_phone error: {e}")
+        log.error("db_error", op="get_outbound_lead_by_phone", error=e)
         return None
     finally:
         conn.close()
@@ -437,27 +717,59 @@ def update_outbound_lead(phone, **kwargs):
         conn.commit()
     except Exception as e:
         conn.rollback()
-        print(f"update_outbound_lead error: {e}")
+        log.error("db_error", op="update_outbound_lead", error=e)
     finally:
         conn.close()
 
-def log_outbound_event(phone, event_type, notes=""):
+# Rows per INSERT statement — 3 params each keeps SQLite under its variable limit
+EVENT_INSERT_CHUNK = 1000
+
+def insert_outbound_events(rows):
+    """Append (lead_phone, event_type, notes) rows with multi-row INSERTs in
+    one transaction. Called by event_sink.py — use event_sink.log_outbound_event.
+    Returns False on error (nothing is written)."""
     conn = get_db()
     try:
         c = conn.cursor()
-        c.execute("""
-            INSERT INTO outbound_events (lead_phone, event_type, notes)
-            VALUES (%s, %s, %s)
-        """, (phone, event_type, notes))
+        for i in range(0, len(rows), EVENT_INSERT_CHUNK):
+            chunk = rows[i:i + EVENT_INSERT_CHUNK]
+            c.execute(
+                "INSERT INTO outbound_events (lead_phone, event_type, notes) VALUES "
+                + ", ".join(["(%s, %s, %s)"] * len(chunk)),
+                [v for row in chunk for v in row]
+            )
         conn.commit()
+        return True
     except Exception as e:
         conn.rollback()
-        print(f"log_outbound_event error: {e}")
+        log.error("db_error", op="insert_outbound_events", error=e)
+        return False
+    finally:
+        conn.close()
+
+def get_outbound_timeline(phone, limit=200):
+    """The prospect's latest `limit` events, oldest first
+    (idx_outbound_events_phone_created, read backwards)."""
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT id, event_type, notes, created_at FROM outbound_events
+            WHERE lead_phone = %s
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        """, (phone, limit))
+        return [{
+            "id": r[0], "event_type": r[1], "notes": r[2], "created_at": str(r[3])
+        } for r in reversed(c.fetchall())]
+    except Exception as e:
+        log.error("db_error", op="get_outbound_timeline", error=e)
+        return None
     finally:
         conn.close()
 
 def get_all_outbound_leads():
-    conn = get_db()
+    conn = get_db(readonly=True)
     try:
         c = conn.cursor()
         c.execute("""
@@ -477,14 +789,199 @@ def get_all_outbound_leads():
             "created_at": str(r[14])
         } for r in rows]
     except Exception as e:
-        print(f"get_all_outbound_leads error: {e}")
+        log.error("db_error", op="get_all_outbound_leads", error=e)
+        return []
+    finally:
+        conn.close()
+
+def get_outbound_leads_page(before=None, limit=50):
+    """One keyset page of outbound prospects, newest first — see get_leads_page."""
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        where, params = "", []
+        if before:
+            where = "WHERE (created_at, id) < (%s::timestamptz, %s)"
+            params.extend(before)
+        c.execute(f"""
+            SELECT id, business_name, owner_name, phone, city, status, created_at
+            FROM outbound_leads {where}
+            ORDER BY created_at DESC, id DESC LIMIT %s
+        """, params + [limit])
+        rows = c.fetchall()
+        return [{
+            "id": r[0], "business_name": r[1], "owner_name": r[2],
+            "phone": r[3], "city": r[4], "status": r[5], "created_at": str(r[6])
+        } for r in rows]
+    except Exception as e:
+        log.error("db_error", op="get_outbound_leads_page", error=e)
+        return []
+    finally:
+        conn.close()
+
+def get_outbound_stats():
+    """Live outbound pipeline counts, from the trigger-kept
+    outbound_lead_counts — a few rows per status, whatever the number of
+    leads. Returns the dashboard tiles plus a per-status breakdown."""
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        c.execute("""
+            SELECT status,
+                   SUM(leads),
+                   SUM(CASE WHEN sms_sent THEN leads ELSE 0 END),
+                   SUM(CASE WHEN responded THEN leads ELSE 0 END),
+                   SUM(CASE WHEN demo_called THEN leads ELSE 0 END),
+                   SUM(CASE WHEN trial_activated THEN leads ELSE 0 END),
+                   SUM(CASE WHEN paid THEN leads ELSE 0 END)
+            FROM outbound_lead_counts GROUP BY status
+            HAVING SUM(leads) > 0
+        """)
+        rows = c.fetchall()
+        return {
+            "total": sum(r[1] for r in rows),
+            "contacted": sum(r[2] for r in rows),
+            "responded": sum(r[3] for r in rows),
+            "demoed": sum(r[4] for r in rows),
+            "converted": sum(r[5] for r in rows),
+            "paid": sum(r[6] for r in rows),
+            "by_status": {r[0]: r[1] for r in rows}
+        }
+    except Exception as e:
+        log.error("db_error", op="get_outbound_stats", error=e)
+        return {"total": 0, "contacted": 0, "responded": 0, "demoed": 0,
+                "converted": 0, "paid": 0, "by_status": {}}
+    finally:
+        conn.close()
+
+# Outbound SMS templates — each send is logged as an event of this type
+FUNNEL_TEMPLATES = ("sms_initial", "sms_followup_1", "sms_followup_2")
+
+# The watermark trails the newest event by this much, so every refresh
+# re-reads the last hour: a transaction that took a lower id but committed
+# late is still rolled up. The rollup is idempotent, so re-reading is safe.
+FUNNEL_ROLLUP_RESCAN = "1 hour"
+
+def refresh_outbound_funnel():
+    """Fold outbound_events into the funnel rollup, in two tables:
+    outbound_funnel_prospects holds one row per prospect and event type, for
+    its first such event — the dedupe set; outbound_funnel_daily counts those
+    first events per day, template, city, cohort week and event type — what
+    the funnel reads. A row is attributed to the last template SMS the
+    prospect got before that event, the prospect's city, and the week the
+    prospect was added (cohort). A counter moves only when a prospect row is
+    inserted, or replaced by an earlier event that committed late.
+    Incremental — cost is proportional to events above the watermark (new
+    ones plus the last FUNNEL_ROLLUP_RESCAN), not to history. Run by the
+    scheduler tick. Returns the number of events read."""
+    if not supports("analytics"):
+        return 0
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO rollup_watermarks (name) VALUES ('outbound_funnel')
+            ON CONFLICT (name) DO NOTHING
+        """)
+        c.execute("SELECT last_id FROM rollup_watermarks WHERE name = 'outbound_funnel' FOR UPDATE")
+        last_id = c.fetchone()[0]
+        c.execute(f"""
+            SELECT COUNT(*), MAX(id) FILTER (WHERE created_at < NOW() - INTERVAL '{FUNNEL_ROLLUP_RESCAN}')
+            FROM outbound_events WHERE id > %s
+        """, (last_id,))
+        count, settled_id = c.fetchone()
+        if count:
+            c.execute("""
+                WITH firsts AS (
+                    SELECT e.lead_phone, e.event_type, e.id AS event_id,
+                           (e.created_at AT TIME ZONE 'UTC')::date AS day,
+                           COALESCE(t.event_type, 'none') AS template,
+                           COALESCE(NULLIF(l.city, ''), 'unknown') AS city,
+                           date_trunc('week', COALESCE(l.created_at, e.created_at) AT TIME ZONE 'UTC')::date AS cohort_week
+                    FROM (
+                        SELECT DISTINCT ON (lead_phone, event_type) id, lead_phone, event_type, created_at
+                        FROM outbound_events WHERE id > %s
+                        ORDER BY lead_phone, event_type, id
+                    ) e
+                    LEFT JOIN outbound_leads l ON l.phone = e.lead_phone
+                    LEFT JOIN LATERAL (
+                        SELECT s.event_type FROM outbound_events s
+                        WHERE s.lead_phone = e.lead_phone AND s.id <= e.id
+                        AND s.event_type = ANY(%s)
+                        ORDER BY s.id DESC LIMIT 1
+                    ) t ON TRUE
+                ),
+                -- Rows as they were before this statement (CTEs share one snapshot)
+                previous AS (
+                    SELECT p.* FROM outbound_funnel_prospects p
+                    JOIN firsts f ON f.lead_phone = p.lead_phone AND f.event_type = p.event_type
+                ),
+                changed AS (
+                    INSERT INTO outbound_funnel_prospects
+                        (lead_phone, event_type, event_id, day, template, city, cohort_week)
+                    SELECT * FROM firsts
+                    ON CONFLICT (lead_phone, event_type) DO UPDATE SET
+                        event_id = EXCLUDED.event_id, day = EXCLUDED.day, template = EXCLUDED.template,
+                        city = EXCLUDED.city, cohort_week = EXCLUDED.cohort_week
+                    -- Only an earlier event (a late commit) replaces the row
+                    WHERE EXCLUDED.event_id < outbound_funnel_prospects.event_id
+                    RETURNING lead_phone, event_type, day, template, city, cohort_week
+                ),
+                deltas AS (
+                    SELECT day, template, city, cohort_week, event_type, 1 AS n FROM changed
+                    UNION ALL
+                    -- A replaced row moves its prospect out of the old counter
+                    SELECT p.day, p.template, p.city, p.cohort_week, p.event_type, -1
+                    FROM previous p
+                    JOIN changed ch ON ch.lead_phone = p.lead_phone AND ch.event_type = p.event_type
+                )
+                INSERT INTO outbound_funnel_daily (day, template, city, cohort_week, event_type, prospects)
+                SELECT day, template, city, cohort_week, event_type, SUM(n)
+                FROM deltas GROUP BY 1, 2, 3, 4, 5
+                ON CONFLICT (day, template, city, cohort_week, event_type) DO UPDATE SET
+                    prospects = outbound_funnel_daily.prospects + EXCLUDED.prospects
+            """, (last_id, list(FUNNEL_TEMPLATES)))
+        if settled_id:
+            c.execute("""
+                UPDATE rollup_watermarks SET last_id = %s, updated_at = NOW()
+                WHERE name = 'outbound_funnel'
+            """, (settled_id,))
+        conn.commit()
+        return count
+    except Exception as e:
+        conn.rollback()
+        log.error("db_error", op="refresh_outbound_funnel", error=e)
+        return 0
+    finally:
+        conn.close()
+
+FUNNEL_GROUPS = {"template": "template", "city": "city", "cohort": "cohort_week", "day": "day"}
+
+def get_outbound_funnel(group_by="template", days=30):
+    """Prospects per group and event type from the daily counters — each
+    prospect counted once per event type. Reads at most days × groups rows,
+    never outbound_events or the per-prospect rows."""
+    column = FUNNEL_GROUPS[group_by]
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT {column}, event_type, SUM(prospects)
+            FROM outbound_funnel_daily
+            WHERE day >= %s
+            GROUP BY 1, 2
+            HAVING SUM(prospects) > 0
+        """, (datetime.now(timezone.utc).date() - timedelta(days=days),))
+        return [{"group": str(r[0]), "event_type": r[1], "prospects": int(r[2])} for r in c.fetchall()]
+    except Exception as e:
+        log.error("db_error", op="get_outbound_funnel", error=e)
         return []
     finally:
         conn.close()
 
 def get_leads_due_followup():
     """Get leads that need a follow-up right now."""
-    conn = get_db()
+    conn = get_db(readonly=True)
     try:
         c = conn.cursor()
         c.execute("""
@@ -501,14 +998,14 @@ def get_leads_due_followup():
             "phone": r[3], "city": r[4], "status": r[5], "follow_up_count": r[6]
         } for r in rows]
     except Exception as e:
-        print(f"get_leads_due_followup error: {e}")
+        log.error("db_error", op="get_leads_due_followup", error=e)
         return []
     finally:
         conn.close()
 
 def get_leads_no_answer_demo():
     """Get leads that said YES but didn't answer the demo call — retry."""
-    conn = get_db()
+    conn = get_db(readonly=True)
     try:
         c = conn.cursor()
         c.execute("""
@@ -526,7 +1023,7 @@ def get_leads_no_answer_demo():
             "phone": r[3], "city": r[4]
         } for r in rows]
     except Exception as e:
-        print(f"get_leads_no_answer_demo error: {e}")
+        log.error("db_error", op="get_leads_no_answer_demo", error=e)
         return []
     finally:
         conn.close()
@@ -534,35 +1031,26 @@ def get_leads_no_answer_demo():
 
 # ── Demo sessions ──────────────────────────────────────────────────────────
 
-def create_demo_session(prospect_phone, business_name, owner_name):
-    """Register a pending demo call so the agent knows which business to simulate."""
+def create_demo_session(prospect_phone, business_name, owner_name, ttl_seconds=1800):
+    """Register a pending demo call so the agent knows which business to simulate.
+    It expires ttl_seconds from now (demo_sessions.DEMO_SESSION_TTL)."""
     conn = get_db()
     try:
         c = conn.cursor()
         c.execute("""
-            CREATE TABLE IF NOT EXISTS demo_sessions (
-                id SERIAL PRIMARY KEY,
-                prospect_phone TEXT UNIQUE NOT NULL,
-                business_name TEXT NOT NULL,
-                owner_name TEXT,
-                created_at TIMESTAMPTZ DEFAULT NOW(),
-                expires_at TIMESTAMPTZ DEFAULT NOW() + INTERVAL '30 minutes'
-            )
-        """)
-        c.execute("""
-            INSERT INTO demo_sessions (prospect_phone, business_name, owner_name)
-            VALUES (%s, %s, %s)
+            INSERT INTO demo_sessions (prospect_phone, business_name, owner_name, expires_at)
+            VALUES (%s, %s, %s, NOW() + %s * INTERVAL '1 minute')
             ON CONFLICT (prospect_phone) DO UPDATE SET
                 business_name=EXCLUDED.business_name,
                 owner_name=EXCLUDED.owner_name,
                 created_at=NOW(),
-                expires_at=NOW() + INTERVAL '30 minutes'
-        """, (prospect_phone, business_name, owner_name))
+                expires_at=EXCLUDED.expires_at
+        """, (prospect_phone, business_name, owner_name, ttl_seconds / 60))
         conn.commit()
-        print(f"Demo session created: {prospect_phone} → {business_name}")
+        log.info("demo_session_created", prospect=prospect_phone, business=business_name)
     except Exception as e:
         conn.rollback()
-        print(f"create_demo_session error: {e}")
+        log.error("db_error", op="create_demo_session", error=e)
     finally:
         conn.close()
 
@@ -580,7 +1068,7 @@ def get_demo_session(prospect_phone):
             return None
         return {"business_name": r[0], "owner_name": r[1]}
     except Exception as e:
-        print(f"get_demo_session error: {e}")
+        log.error("db_error", op="get_demo_session", error=e)
         return None
     finally:
         conn.close()
@@ -594,7 +1082,22 @@ def delete_demo_session(prospect_phone):
         conn.commit()
     except Exception as e:
         conn.rollback()
-        print(f"delete_demo_session error: {e}")
+        log.error("db_error", op="delete_demo_session", error=e)
+    finally:
+        conn.close()
+
+def sweep_demo_sessions():
+    """Delete expired demo sessions (idx_demo_sessions_expires). Returns the count."""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute("DELETE FROM demo_sessions WHERE expires_at <= NOW()")
+        conn.commit()
+        return c.rowcount
+    except Exception as e:
+        conn.rollback()
+        log.error("db_error", op="sweep_demo_sessions", error=e)
+        return 0
     finally:
         conn.close()
 
@@ -609,12 +1112,12 @@ def activate_trial(client_id, days=7):
         c = conn.cursor()
         c.execute("""
             UPDATE clients
-            SET trial_ends_at = NOW() + INTERVAL '%s days',
+            SET trial_ends_at = NOW() + %s * INTERVAL '1 day',
                 plan = 'trial',
                 updated_at = NOW()
             WHERE id = %s
             RETURNING dashboard_token, business_name, owner_name, owner_phone, twilio_number
-        """ % (days,), (client_id,))
+        """, (days, client_id))
         r = c.fetchone()
         conn.commit()
         if not r:
@@ -628,14 +1131,14 @@ def activate_trial(client_id, days=7):
         }
     except Exception as e:
         conn.rollback()
-        print(f"activate_trial error: {e}")
+        log.error("db_error", op="activate_trial", error=e)
         return None
     finally:
         conn.close()
 
 def get_trials_ending_soon(days=2):
     """Get clients whose trial ends within X days."""
-    conn = get_db()
+    conn = get_db(readonly=True)
     try:
         c = conn.cursor()
         c.execute("""
@@ -644,8 +1147,8 @@ def get_trials_ending_soon(days=2):
             FROM clients
             WHERE plan = 'trial'
             AND active = TRUE
-            AND trial_ends_at BETWEEN NOW() AND NOW() + INTERVAL '%s days'
-        """ % days)
+            AND trial_ends_at BETWEEN NOW() AND NOW() + %s * INTERVAL '1 day'
+        """, (days,))
         rows = c.fetchall()
         return [{
             "id": r[0], "business_name": r[1], "owner_name": r[2],
@@ -653,14 +1156,14 @@ def get_trials_ending_soon(days=2):
             "dashboard_token": r[5], "trial_ends_at": str(r[6])
         } for r in rows]
     except Exception as e:
-        print(f"get_trials_ending_soon error: {e}")
+        log.error("db_error", op="get_trials_ending_soon", error=e)
         return []
     finally:
         conn.close()
 
 def get_trial_day5_clients():
     """Get clients on day 5 of trial — send reminder."""
-    conn = get_db()
+    conn = get_db(readonly=True)
     try:
         c = conn.cursor()
         c.execute("""
@@ -678,10 +1181,7 @@ def get_trial_day5_clients():
             "dashboard_token": r[5], "trial_ends_at": str(r[6])
         } for r in rows]
     except Exception as e:
-        print(f"get_trial_day5_clients error: {e}")
+        log.error("db_error", op="get_trial_day5_clients", error=e)
         return []
     finally:
         conn.close()
-
-
-init_outbound_tables()
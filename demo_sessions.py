@@ -0,0 +1,102 @@
+import os
+import heapq
+import threading
+import time
+
+from logs import get_logger
+
+log = get_logger("demo_sessions")
+
+# memory   — TTL map in this process (one web process runs both the scheduler
+#            that places demo calls and the /demo-ws socket that answers them)
+# postgres — demo_sessions table, for several nodes behind a load balancer
+DEMO_SESSION_STORE = os.getenv("DEMO_SESSION_STORE", "memory")
+DEMO_SESSION_TTL   = int(os.getenv("DEMO_SESSION_TTL", "1800"))  # 30 minutes
+
+
+class MemoryDemoSessions:
+    """phone → session with a TTL. A min-heap of (expires_at, phone) is the
+    expiry index, so a sweep only touches sessions that actually expired."""
+
+    def __init__(self, ttl=DEMO_SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}  # phone → (expires_at, session)
+        self._expiry = []    # heap of (expires_at, phone); stale entries skipped
+        self._lock = threading.Lock()
+
+    def create(self, prospect_phone, business_name, owner_name):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._sessions[prospect_phone] = (
+                expires_at, {"business_name": business_name, "owner_name": owner_name}
+            )
+            heapq.heappush(self._expiry, (expires_at, prospect_phone))
+        log.info("demo_session_created", prospect=prospect_phone, business=business_name)
+
+    def get(self, prospect_phone):
+        entry = self._sessions.get(prospect_phone)
+        if not entry or entry[0] <= time.monotonic():
+            return None
+        return dict(entry[1])
+
+    def delete(self, prospect_phone):
+        with self._lock:
+            self._sessions.pop(prospect_phone, None)
+
+    def sweep(self):
+        """Drop expired sessions. Returns how many were removed."""
+        now, removed = time.monotonic(), 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, phone = heapq.heappop(self._expiry)
+                entry = self._sessions.get(phone)
+                # Skip heap entries superseded by a newer create() for the phone
+                if entry and entry[0] == expires_at:
+                    del self._sessions[phone]
+                    removed += 1
+        return removed
+
+
+class PostgresDemoSessions:
+    """demo_sessions table; expired rows are removed by sweep()."""
+
+    def create(self, prospect_phone, business_name, owner_name):
+        from database import create_demo_session
+        create_demo_session(prospect_phone, business_name, owner_name, ttl_seconds=DEMO_SESSION_TTL)
+
+    def get(self, prospect_phone):
+        from database import get_demo_session
+        return get_demo_session(prospect_phone)
+
+    def delete(self, prospect_phone):
+        from database import delete_demo_session
+        delete_demo_session(prospect_phone)
+
+    def sweep(self):
+        from database import sweep_demo_sessions
+        return sweep_demo_sessions()
+
+
+_store = PostgresDemoSessions() if DEMO_SESSION_STORE == "postgres" else MemoryDemoSessions()
+
+
+def create_demo_session(prospect_phone, business_name, owner_name):
+    """Register a pending demo call so the agent knows which business to simulate."""
+    _store.create(prospect_phone, business_name, owner_name)
+
+
+def get_demo_session(prospect_phone):
+    """{"business_name", "owner_name"} for a live demo session, or None."""
+    return _store.get(prospect_phone)
+
+
+def delete_demo_session(prospect_phone):
+    _store.delete(prospect_phone)
+
+
+def sweep_demo_sessions():
+    """Remove expired sessions — run from the scheduler tick."""
+    removed = _store.sweep()
+    if removed:
+        log.info("demo_sessions_expired", removed=removed)
+    return removed
@@ -0,0 +1,84 @@
+import os
+import atexit
+import threading
+
+from metrics import register_gauge
+from logs import get_logger
+
+log = get_logger("event_sink")
+
+# Events are buffered and written as multi-row INSERTs: a flush happens every
+# EVENT_FLUSH_SECONDS, or as soon as EVENT_BATCH_SIZE events are waiting
+EVENT_BATCH_SIZE    = int(os.getenv("EVENT_BATCH_SIZE", "500"))
+EVENT_FLUSH_SECONDS = float(os.getenv("EVENT_FLUSH_SECONDS", "2"))
+# If Postgres is down, keep at most this many events and drop the oldest
+EVENT_BUFFER_MAX    = int(os.getenv("EVENT_BUFFER_MAX", "50000"))
+
+_buffer  = []
+_cond    = threading.Condition()
+_flusher = None
+# Serialises flushes so events reach the table in the order they were logged
+_flush_lock = threading.Lock()
+
+
+def log_outbound_event(phone, event_type, notes=""):
+    """Queue one outbound event. Written within EVENT_FLUSH_SECONDS; call
+    flush() first when the caller needs to read it back immediately."""
+    with _cond:
+        _buffer.append((phone, event_type, notes))
+        if len(_buffer) >= EVENT_BATCH_SIZE:
+            _cond.notify()
+    _ensure_flusher()
+
+
+def flush():
+    """Write everything buffered so far. Returns the number of events written;
+    on failure the events go back to the front of the buffer."""
+    from database import insert_outbound_events
+
+    with _flush_lock:
+        with _cond:
+            rows = _buffer[:]
+            del _buffer[:]
+        if not rows:
+            return 0
+        if insert_outbound_events(rows):
+            return len(rows)
+        with _cond:
+            _buffer[:0] = rows
+            overflow = len(_buffer) - EVENT_BUFFER_MAX
+            if overflow > 0:
+                del _buffer[:overflow]
+                log.warning("event_buffer_full", dropped=overflow)
+        return 0
+
+
+def pending():
+    return len(_buffer)
+
+
+register_gauge("tradie_event_buffer_pending", lambda: [({}, len(_buffer))])
+
+
+def _run():
+    while True:
+        with _cond:
+            if len(_buffer) < EVENT_BATCH_SIZE:
+                _cond.wait(EVENT_FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            log.error("event_sink_error", error=e)
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None:
+        with _flush_lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_run, daemon=True)
+                _flusher.start()
+
+
+# Daemon threads die with the process — write what is left on a clean exit
+atexit.register(flush)
@@ -0,0 +1,131 @@
+"""
+Streaming, tenant-scoped exports of leads, quotes and transcripts.
+
+Rows are read through a named (server-side) cursor in fixed-size batches
+and formatted batch by batch, so memory stays flat however many rows an
+export covers. Rows come out in (created_at, id) order; an interrupted
+export resumes from the last row received via after/after_id.
+
+    python export.py leads --client 42 --format csv --since 2026-01-01 > leads.csv
+    python export.py transcripts --client 42 --format jsonl --after 2026-03-01T10:00:00+00:00 --after-id 981
+
+Transcripts cover the hot messages table only — months already archived
+to disk are read with `python archive.py transcript`.
+"""
+import sys
+import os
+import io
+import csv
+import argparse
+from datetime import datetime
+
+from database import get_db, tenant_key
+from logs import get_logger
+from jsoncodec import dumps
+
+log = get_logger("export")
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+# dataset → (table, exported columns)
+DATASETS = {
+    "leads": ("leads", ["id", "phone", "name", "address", "contact_phone", "problem",
+                        "urgent", "channel", "status", "created_at", "updated_at"]),
+    "quotes": ("quotes", ["id", "lead_id", "phone", "problem", "estimate_low",
+                          "estimate_high", "details", "status", "created_at"]),
+    "transcripts": ("messages", ["id", "phone", "role", "content", "created_at"]),
+}
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def parse_time(value):
+    """ISO date/datetime from a query arg or CLI flag; None if empty.
+    Raises ValueError on anything else."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _value(v):
+    return v.isoformat() if isinstance(v, datetime) else v
+
+
+def export_batches(dataset, client_id, since=None, until=None, after=None, after_id=None):
+    """Yield lists of row dicts, EXPORT_BATCH_SIZE at a time.
+    since/until bound created_at (until is exclusive); after/after_id is the
+    (created_at, id) of the last row already received."""
+    table, columns = DATASETS[dataset]
+    where  = ["client_id = %(client_id)s"]
+    params = {"client_id": tenant_key(client_id), "since": since, "until": until,
+              "after": after, "after_id": after_id}
+    if since:
+        where.append("created_at >= %(since)s")
+    if until:
+        where.append("created_at < %(until)s")
+    if after and after_id is not None:
+        where.append("(created_at, id) > (%(after)s, %(after_id)s)")
+
+    conn = get_db(readonly=True)
+    try:
+        # A named cursor keeps the result set on the server; only one batch
+        # is ever held here
+        c = conn.cursor(name=f"export_{dataset}")
+        c.itersize = EXPORT_BATCH_SIZE
+        c.execute(f"""
+            SELECT {", ".join(columns)} FROM {table}
+            WHERE {" AND ".join(where)}
+            ORDER BY created_at, id
+        """, params)
+        while True:
+            rows = c.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield [{col: _value(v) for col, v in zip(columns, r)} for r in rows]
+        c.close()
+    except Exception as e:
+        log.error("export_error", dataset=dataset, error=e)
+        raise
+    finally:
+        conn.close()
+
+
+def export_chunks(dataset, fmt, client_id, **bounds):
+    """Yield the export as text chunks (one per batch) in csv or jsonl."""
+    columns = DATASETS[dataset][1]
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=columns)
+        writer.writeheader()
+        for batch in export_batches(dataset, client_id, **bounds):
+            writer.writerows(batch)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+    else:
+        for batch in export_batches(dataset, client_id, **bounds):
+            yield "".join(dumps(row) + "\n" for row in batch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a tenant export to stdout or a file.")
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("--client", type=int, default=0, help="client id (0 = default client)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--since", type=parse_time)
+    parser.add_argument("--until", type=parse_time)
+    parser.add_argument("--after", type=parse_time, help="created_at of the last row already exported")
+    parser.add_argument("--after-id", type=int, help="id of the last row already exported")
+    parser.add_argument("-o", "--output", help="write here instead of stdout")
+    args = parser.parse_args()
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for chunk in export_chunks(args.dataset, args.format, args.client,
+                                   since=args.since, until=args.until,
+                                   after=args.after, after_id=args.after_id):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
@@ -0,0 +1,177 @@
+"""
+JSON encoding for the ConversationRelay socket, the JSON APIs, SSE,
+notifications, exports and logs.
+
+    from jsoncodec import dumps, loads, text_frame, END_FRAME
+    ws.send(text_frame(token))                  # {"type":"text","token":…,"last":false}
+    data = loads(raw)
+
+orjson is used when it is installed; JSON_CODEC=json forces the standard
+library. Both produce compact UTF-8 output and encode datetimes and dates
+natively as ISO 8601, Decimals as floats and sets as lists. Anything else
+falls back to str(). dumps() returns str; dumps_bytes() skips the decode
+for byte sinks.
+
+Outbound text frames are pre-encoded constant fragments around the token,
+which is escaped by the json module's C string encoder — cheaper than any
+full dumps() call. install(app) makes jsonify() and request.get_json() use
+the same codec.
+
+    python jsoncodec.py          # per-frame benchmark, both codecs
+"""
+import sys
+import os
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from json.encoder import encode_basestring
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback — slower, same output
+    orjson = None
+
+JSON_CODEC = os.getenv("JSON_CODEC", "orjson" if orjson else "json")
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+class StdlibCodec:
+    name = "json"
+    _encoder = json.JSONEncoder(default=_default, separators=(",", ":"), ensure_ascii=False)
+    _decoder = json.JSONDecoder()
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj)
+
+    def dumps_bytes(self, obj):
+        return self._encoder.encode(obj).encode()
+
+    def loads(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode()
+        return self._decoder.decode(data)
+
+
+class OrjsonCodec:
+    name = "orjson"
+    # Non-str dict keys (ints from GROUP BYs) are stringified like json does
+    OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=_default, option=self.OPTIONS).decode()
+
+    def dumps_bytes(self, obj):
+        return orjson.dumps(obj, default=_default, option=self.OPTIONS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+CODECS = {"json": StdlibCodec}
+if orjson:
+    CODECS["orjson"] = OrjsonCodec
+
+codec = CODECS.get(JSON_CODEC, StdlibCodec)()
+dumps = codec.dumps
+dumps_bytes = codec.dumps_bytes
+loads = codec.loads
+
+
+# ── ConversationRelay frames ──────────────────────────────────────────────
+
+END_FRAME = '{"type":"end"}'
+_TEXT_PREFIX = '{"type":"text","token":'
+_TEXT_MORE = ',"last":false}'
+_TEXT_LAST = ',"last":true}'
+
+
+def text_frame(token, last=False):
+    """A ConversationRelay text frame — only the token is encoded."""
+    return _TEXT_PREFIX + encode_basestring(token) + (_TEXT_LAST if last else _TEXT_MORE)
+
+
+# ── Flask ─────────────────────────────────────────────────────────────────
+
+def install(app):
+    """Route jsonify() and request.get_json() through this codec."""
+    from flask.json.provider import DefaultJSONProvider
+
+    class CodecJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            return dumps(obj)
+
+        def loads(self, s, **kwargs):
+            return loads(s)
+
+    app.json = CodecJSONProvider(app)
+
+
+# ── Benchmark ─────────────────────────────────────────────────────────────
+
+def _bench(fn, n):
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(n):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return best / n * 1e9
+
+
+def benchmark(n=20000):
+    """ns per operation: one inbound prompt event, one token frame (a dict
+    through dumps), one /api/leads body — for each codec and for the plain
+    json.dumps/json.loads calls they replace — plus one text_frame()."""
+    prompt = json.dumps({"type": "prompt", "voicePrompt": "Hi, my furnace stopped working last night",
+                         "lang": "en-US", "last": True})
+    lead = {"id": 1, "name": "Sam Taylor", "phone": "+14165550123", "address": "12 King St W",
+            "problem": "No heat, furnace making a clicking noise", "urgent": True, "channel": "voice",
+            "status": "new", "created_at": datetime(2026, 10, 19, 7, 30)}
+    api_body = {"client": {"business_name": "Mike's Emergency Plumbing", "plan": "trial",
+                           "trial_ends_at": datetime(2026, 10, 26)}, "leads": [lead] * 50}
+    token = " furnace,"
+
+    # Before this module: json.loads/json.dumps with default separators
+    results = {"baseline": {
+        "parse_prompt_ns": _bench(lambda: json.loads(prompt), n),
+        "frame_ns": _bench(lambda: json.dumps({"type": "text", "token": token, "last": False}), n),
+        "api_leads_50_ns": _bench(lambda: json.dumps(api_body, default=str), max(n // 50, 100)),
+    }}
+    for name, cls in CODECS.items():
+        c = cls()
+        results[name] = {
+            "parse_prompt_ns": _bench(lambda: c.loads(prompt), n),
+            "frame_ns": _bench(lambda: c.dumps({"type": "text", "token": token, "last": False}), n),
+            "api_leads_50_ns": _bench(lambda: c.dumps(api_body), max(n // 50, 100)),
+        }
+    results["text_frame"] = {"frame_ns": _bench(lambda: text_frame(token), n)}
+    return results
+
+
+def main():
+    results = benchmark()
+    base = results["baseline"]
+    out = sys.stdout
+    out.write(f"{'':11} {'parse prompt':>13} {'token frame':>12} {'/api/leads ×50':>15}\n")
+    for name, r in results.items():
+        parse = f"{r['parse_prompt_ns']:.0f} ns" if "parse_prompt_ns" in r else "—"
+        body = f"{r['api_leads_50_ns'] / 1000:.1f} µs" if "api_leads_50_ns" in r else "—"
+        out.write(f"{name:11} {parse:>13} {r['frame_ns']:>9.0f} ns {body:>15}\n")
+    frame_saved = base["frame_ns"] - results["text_frame"]["frame_ns"]
+    parse_saved = base["parse_prompt_ns"] - results[codec.name]["parse_prompt_ns"]
+    out.write(f"\nPer frame: {frame_saved:.0f} ns saved ({base['frame_ns'] / results['text_frame']['frame_ns']:.1f}× faster); "
+              f"per prompt event: {parse_saved:.0f} ns saved with {codec.name}\n")
+
+
+if __name__ == "__main__":
+    main()
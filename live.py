@@ -0,0 +1,147 @@
+import os
+import queue
+import threading
+import time
+
+from logs import get_logger
+from jsoncodec import dumps
+
+log = get_logger("live")
+
+# Upper bound on staleness if a NOTIFY is ever missed (listener reconnecting)
+CACHE_TTL_SECONDS = int(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+SSE_KEEPALIVE_SECONDS = 15
+SSE_QUEUE_SIZE = 100
+
+
+# ── Response cache ─────────────────────────────────────────────────────────
+
+# token → (client_id, etag, body, expires_at)
+_cache = {}
+# client_id → {token, ...} so one lead event drops every token of the tenant
+_tokens_by_client = {}
+# client_id → count of invalidations; _epoch counts full clears
+_generations = {}
+_epoch = 0
+_subscribers = {}
+_lock = threading.Lock()
+
+
+def get_cached(token):
+    """Cached (client_id, etag, body) for a dashboard token, or None."""
+    entry = _cache.get(token)
+    if not entry or entry[3] < time.monotonic():
+        return None
+    return entry[:3]
+
+
+def generation(client_id):
+    """Read before rendering a body; hand it to put_cached()."""
+    return (_epoch, _generations.get(client_id, 0))
+
+
+def put_cached(token, client_id, etag, body, gen):
+    """Cache a body rendered at generation gen — unless a lead event arrived
+    since, in which case the body may already be stale and is not kept."""
+    with _lock:
+        if gen != generation(client_id):
+            return
+        _cache[token] = (client_id, etag, body, time.monotonic() + CACHE_TTL_SECONDS)
+        _tokens_by_client.setdefault(client_id, set()).add(token)
+
+
+def invalidate(client_id):
+    with _lock:
+        _generations[client_id] = _generations.get(client_id, 0) + 1
+        for token in _tokens_by_client.pop(client_id, ()):
+            _cache.pop(token, None)
+
+
+def clear():
+    """Drop every cached body, including ones still being rendered."""
+    global _epoch
+    with _lock:
+        _epoch += 1
+        _cache.clear()
+        _tokens_by_client.clear()
+
+
+# ── SSE subscribers ────────────────────────────────────────────────────────
+
+def subscribe(client_id):
+    """Register a queue that receives every lead event for client_id."""
+    q = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(client_id, set()).add(q)
+    return q
+
+
+def unsubscribe(client_id, q):
+    with _lock:
+        subs = _subscribers.get(client_id)
+        if subs:
+            subs.discard(q)
+            if not subs:
+                del _subscribers[client_id]
+
+
+def _publish(client_id, payload):
+    with _lock:
+        subs = list(_subscribers.get(client_id, ()))
+    for q in subs:
+        try:
+            q.put_nowait(payload)
+        except queue.Full:
+            # Slow consumer — drop the event, the next poll/reconnect catches up
+            pass
+
+
+def on_lead_event(payload):
+    """NOTIFY callback — drop the tenant's cached responses and push the event."""
+    lead = payload.get("lead") or {}
+    client_id = lead.get("client_id")
+    if client_id is None:
+        return
+    invalidate(client_id)
+    _publish(client_id, payload)
+
+
+def stream_events(client_id):
+    """SSE generator for one dashboard connection. Sends a comment line as
+    keepalive so proxies don't close idle connections."""
+    q = subscribe(client_id)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                payload = q.get(timeout=SSE_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {payload.get('event', 'lead')}\ndata: {dumps(payload['lead'])}\n\n"
+    finally:
+        unsubscribe(client_id, q)
+
+
+# ── Listener ───────────────────────────────────────────────────────────────
+
+def start_lead_listener():
+    """Background thread — LISTENs for lead events, reconnecting on failure."""
+    from database import listen_lead_events
+
+    def _run():
+        backoff = 1
+        while True:
+            started = time.monotonic()
+            try:
+                listen_lead_events(on_lead_event)
+            except Exception as e:
+                log.error("lead_listener_error", error=e)
+            # Anything cached while we were disconnected may have missed events
+            clear()
+            backoff = 1 if time.monotonic() - started > 60 else min(backoff * 2, 60)
+            time.sleep(backoff)
+
+    t = threading.Thread(target=_run, daemon=True)
+    t.start()
+    log.info("lead_listener_started")
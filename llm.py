@@ -0,0 +1,251 @@
+"""
+Model routing: every LLM call names its task, and the task picks the model.
+
+    reply = complete("sms_turn", messages, client_id=7, temperature=0.7, max_tokens=150)
+    for delta in stream("voice_turn", messages, client_id=7, max_tokens=200): ...
+    lead  = complete_json("extraction", messages, client_id=7, schema=LEAD_SCHEMA)
+
+Each task has a chain of models, tried in order: when a model errors — or a
+stream fails before its first token — the call moves on to the next one.
+Chains are set per task with LLM_MODELS_<TASK>, e.g.
+LLM_MODELS_EXTRACTION="gpt-4o-mini,gpt-4o". Extraction defaults to
+gpt-4o-mini: it runs at temperature 0 against a fixed schema, and it sits
+between the caller hanging up and the owner's lead SMS
+(tradie_owner_notify_seconds), so a faster model there is the owner's win.
+
+complete_json() asks for structured output — a strict JSON schema when one
+is given, JSON mode otherwise — so the reply parses as it comes.
+
+Every call is charged to the tenant's daily token budget (admission), counted
+by task and model in Prometheus (requests, errors, fallbacks, tokens, USD
+cost from PRICES, latency, time to first token) and kept in report() —
+/admin/llm — with p50/p95 latency over the last LATENCY_SAMPLES calls.
+"""
+import os
+import time
+import threading
+from collections import deque
+from types import SimpleNamespace
+
+from clients import openai_client
+from jsoncodec import loads
+from admission import record_llm_tokens
+from metrics import inc, observe, llm_request, llm_tokens
+from profiling import span
+from logs import get_logger
+
+log = get_logger("llm")
+
+# task → (default model chain, request timeout in seconds)
+TASKS = {
+    "voice_turn":    ("gpt-4o", 10),
+    "sms_turn":      ("gpt-4o", 20),
+    "extraction":    ("gpt-4o-mini,gpt-4o", 30),
+    "summarization": ("gpt-4o-mini,gpt-4o", 30),
+}
+
+# model → (USD per 1M prompt tokens, USD per 1M completion tokens)
+PRICES = {
+    "gpt-4o":       (2.50, 10.00),
+    "gpt-4o-mini":  (0.15, 0.60),
+    "gpt-4.1":      (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+# Latencies kept per task and model for report()
+LATENCY_SAMPLES = 500
+
+
+def _chain(task, default):
+    return [m.strip() for m in (os.getenv(f"LLM_MODELS_{task.upper()}") or default).split(",") if m.strip()]
+
+
+CHAINS   = {task: _chain(task, models) for task, (models, _) in TASKS.items()}
+TIMEOUTS = {task: float(os.getenv(f"LLM_TIMEOUT_{task.upper()}", timeout)) for task, (_, timeout) in TASKS.items()}
+
+_stats = {}   # (task, model) → running totals, see _record
+_stats_lock = threading.Lock()
+
+
+def cost(model, prompt_tokens, completion_tokens):
+    """USD for one call; 0 for models missing from PRICES."""
+    prompt_price, completion_price = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+# ── Calls ──────────────────────────────────────────────────────────────────
+
+def _client(chain, i):
+    """The shared client — without its own retries when the chain has a next
+    model, so a failing model costs one timeout before the fallback is tried."""
+    client = openai_client()
+    return client.with_options(max_retries=0) if i < len(chain) - 1 else client
+
+
+def complete(task, messages, client_id=None, **params):
+    """Reply text from the first model in the task's chain that answers.
+    Raises the last model's error when none does."""
+    chain = CHAINS[task]
+    for i, model in enumerate(chain):
+        started = time.perf_counter()
+        try:
+            with span("openai"):
+                response = _client(chain, i).chat.completions.create(
+                    model=model, messages=messages, timeout=TIMEOUTS[task], **params
+                )
+        except Exception as e:
+            _failed(task, model, client_id, e, fallback=i < len(chain) - 1)
+            if i == len(chain) - 1:
+                raise
+            continue
+        _record(task, model, client_id, time.perf_counter() - started, response.usage)
+        return (response.choices[0].message.content or "").strip()
+
+
+def complete_json(task, messages, client_id=None, schema=None, **params):
+    """The reply parsed as a JSON object. schema ({"name", "schema"}) makes it
+    strict structured output; without one the model is put in JSON mode."""
+    if schema:
+        response_format = {"type": "json_schema", "json_schema": {**schema, "strict": True}}
+    else:
+        response_format = {"type": "json_object"}
+    return loads(complete(task, messages, client_id, response_format=response_format, **params))
+
+
+def stream(task, messages, client_id=None, **params):
+    """Yield reply text as it is generated. A model that fails before its
+    first token is skipped for the next in the chain; once text has been
+    yielded, an error is raised to the caller. Usage is recorded even when
+    the caller stops reading early or the stream fails part-way (the tokens
+    are billed all the same) — estimated when the stream's usage chunk never
+    arrived. A failed stream is counted as an error, not also as a call."""
+    chain = CHAINS[task]
+    for i, model in enumerate(chain):
+        started = time.perf_counter()
+        first_token = None
+        usage = None
+        deltas = 0
+        chunks = None
+        failed = False
+        try:
+            with span("openai"):
+                chunks = _client(chain, i).chat.completions.create(
+                    model=model, messages=messages, timeout=TIMEOUTS[task],
+                    stream=True, stream_options={"include_usage": True}, **params
+                )
+                for chunk in chunks:
+                    # The usage-only chunk at the end of the stream has no choices
+                    if not chunk.choices:
+                        usage = chunk.usage or usage
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta is None:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    deltas += 1
+                    yield delta
+        except Exception as e:
+            failed = True
+            retry = first_token is None and i < len(chain) - 1
+            _failed(task, model, client_id, e, fallback=retry)
+            if not retry:
+                raise
+            continue
+        finally:
+            # Also runs on GeneratorExit, when the caller stopped reading
+            if hasattr(chunks, "close"):
+                chunks.close()
+            if usage is not None or first_token is not None:
+                _record(task, model, client_id, time.perf_counter() - started,
+                        usage or _estimate_usage(messages, deltas), first_token, error=failed)
+        return
+
+
+# ── Accounting ─────────────────────────────────────────────────────────────
+
+def _failed(task, model, client_id, error, fallback):
+    llm_request(task, model, client_id, error=True)
+    with _stats_lock:
+        _entry(task, model)["errors"] += 1
+    if fallback:
+        inc("tradie_llm_fallbacks_total", task=task, model=model)
+        log.warning("llm_fallback", task=task, model=model, client_id=client_id, error=error)
+
+
+def _estimate_usage(messages, deltas):
+    """Stand-in for a cut-short stream's usage: ~4 characters per prompt
+    token, one token per streamed delta."""
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return SimpleNamespace(prompt_tokens=(chars + 3) // 4, completion_tokens=deltas)
+
+
+def _record(task, model, client_id, seconds, usage, first_token=None, error=False):
+    """Bill a call's tokens. error: the call already counted as failed
+    (_failed) — its tokens are billed, but it is not a call and its latency
+    is not sampled."""
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    usd = cost(model, prompt_tokens, completion_tokens)
+    record_llm_tokens(client_id, prompt_tokens + completion_tokens)
+    if error:
+        llm_tokens(task, model, client_id, prompt_tokens, completion_tokens, usd)
+    else:
+        llm_request(task, model, client_id, seconds, prompt_tokens, completion_tokens, usd)
+        if first_token is not None:
+            observe("tradie_llm_first_token_seconds", first_token, task=task, model=model)
+    with _stats_lock:
+        entry = _entry(task, model)
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+        entry["cost_usd"] += usd
+        if error:
+            return
+        entry["calls"] += 1
+        entry["latencies"].append(seconds)
+        if first_token is not None:
+            entry["first_tokens"].append(first_token)
+
+
+def _entry(task, model):
+    entry = _stats.get((task, model))
+    if entry is None:
+        entry = _stats[(task, model)] = {
+            "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+            "latencies": deque(maxlen=LATENCY_SAMPLES), "first_tokens": deque(maxlen=LATENCY_SAMPLES),
+        }
+    return entry
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 1)
+
+
+def report():
+    """{chains, tasks: [{task, model, calls, errors, tokens, cost, latency}]}
+    since startup, by task then model."""
+    with _stats_lock:
+        items = [(key, {**entry, "latencies": list(entry["latencies"]),
+                        "first_tokens": list(entry["first_tokens"])})
+                 for key, entry in sorted(_stats.items())]
+    tasks = []
+    for (task, model), entry in items:
+        calls = entry["calls"]
+        tasks.append({
+            "task": task,
+            "model": model,
+            "calls": calls,
+            "errors": entry["errors"],
+            "prompt_tokens": entry["prompt_tokens"],
+            "completion_tokens": entry["completion_tokens"],
+            "cost_usd": round(entry["cost_usd"], 6),
+            "cost_per_call_usd": round(entry["cost_usd"] / calls, 6) if calls else None,
+            "p50_ms": _percentile(entry["latencies"], 0.5),
+            "p95_ms": _percentile(entry["latencies"], 0.95),
+            "first_token_p50_ms": _percentile(entry["first_tokens"], 0.5),
+        })
+    return {"chains": CHAINS, "tasks": tasks}
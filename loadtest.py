@@ -0,0 +1,358 @@
+"""
+Concurrent-call load test for the /voice-ws ConversationRelay handler.
+
+Three parts, all offline:
+
+  * a fake OpenAI server that streams chat completions at a configurable
+    token rate with jitter (and answers the post-call extractor),
+  * a simulated Twilio ConversationRelay client that opens N /voice-ws
+    sockets and plays setup → prompt … → end on scripted timings,
+  * a report of throughput and latency percentiles at each concurrency level.
+
+By default the app is started as a subprocess (`python app.py`) on a free
+port against a throwaway SQLite database, with OPENAI_BASE_URL pointed at
+the fake server:
+
+    python loadtest.py                                  # levels 1,5,10,25,50
+    python loadtest.py --levels 1,10,100 --turns 6 --token-rate 30 --jitter 0.5
+    python loadtest.py --url ws://localhost:5000 --json results.json
+
+Time to first token is measured from sending a prompt to the first `text`
+frame; turn latency runs to the frame marked `last`. Owner SMS at the end of
+each call goes to Twilio and fails offline — that is logged by the app and
+happens after the socket closes, so it does not affect the numbers.
+"""
+import sys
+import os
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# What simulated callers say, turn by turn — none of it ends the call early
+CALLER_SCRIPT = [
+    "Hi, my basement is flooding, water everywhere.",
+    "It's coming from the water heater I think.",
+    "My name is Sam Taylor.",
+    "42 King Street West, Toronto.",
+    "Yes, this number is fine.",
+    "No, that's everything.",
+]
+
+# What the fake model streams back, one word per token with the leading
+# space attached, the way OpenAI tokens arrive
+AGENT_REPLY = ("Okay, I'm sorry to hear that — can you turn off the main water valve "
+               "for me? It's usually near the meter. And what's your name, please?")
+
+EXTRACTOR_REPLY = json.dumps({
+    "lead_captured": False, "name": None, "problem": "flooding basement",
+    "address": None, "phone": None, "urgent": True,
+})
+
+
+# ── Fake OpenAI ────────────────────────────────────────────────────────────
+
+class FakeOpenAI:
+    """Chat-completions server on 127.0.0.1. Streams AGENT_REPLY one token
+    every 1/token_rate seconds (± jitter, as a fraction) after first_token
+    seconds; non-streaming requests get EXTRACTOR_REPLY."""
+
+    def __init__(self, token_rate=40.0, jitter=0.3, first_token=0.3, port=0):
+        self.token_rate = token_rate
+        self.jitter = jitter
+        self.first_token = first_token
+        self.requests = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                fake.requests += 1
+                if body.get("stream"):
+                    fake._stream(self, body)
+                else:
+                    fake._complete(self, body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.base_url = f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _delay(self, base):
+        return max(0.0, base * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def _stream(self, handler, body):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+
+        def event(payload):
+            handler.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+            handler.wfile.flush()
+
+        chunk = {"id": "chatcmpl-loadtest", "object": "chat.completion.chunk",
+                 "created": int(time.time()), "model": body.get("model", "gpt-4o")}
+        words = AGENT_REPLY.split(" ")
+        tokens = words[:1] + [" " + w for w in words[1:]]
+        time.sleep(self._delay(self.first_token))
+        try:
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(self._delay(1 / self.token_rate))
+                event({**chunk, "choices": [{"index": 0, "delta": {"content": token},
+                                             "finish_reason": None}]})
+            event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+            event({**chunk, "choices": [], "usage": {
+                "prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens)}})
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _complete(self, handler, body):
+        time.sleep(self._delay(self.first_token))
+        payload = json.dumps({
+            "id": "chatcmpl-loadtest", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": EXTRACTOR_REPLY}}],
+            "usage": {"prompt_tokens": 200, "completion_tokens": 40, "total_tokens": 240},
+        }).encode()
+        try:
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+# ── Simulated ConversationRelay ────────────────────────────────────────────
+
+def simulate_call(ws_url, caller_phone, turns, think, timeout=30):
+    """One call: setup, `turns` prompts with `think` seconds between them,
+    then end. Returns {"ttft": [...], "turn": [...], "error": str|None}."""
+    from simple_websocket import Client
+
+    result = {"ttft": [], "turn": [], "error": None}
+    ws = None
+    try:
+        ws = Client.connect(f"{ws_url}/voice-ws")
+        ws.send(json.dumps({
+            "type": "setup", "sessionId": f"VX{caller_phone[1:]}", "callSid": f"CA{caller_phone[1:]}",
+            "from": caller_phone, "to": "", "direction": "inbound",
+        }))
+        for n in range(turns):
+            if n:
+                time.sleep(think)
+            sent = time.perf_counter()
+            ws.send(json.dumps({"type": "prompt", "lang": "en-US", "last": True,
+                                "voicePrompt": CALLER_SCRIPT[n % len(CALLER_SCRIPT)]}))
+            first = None
+            while True:
+                raw = ws.receive(timeout=timeout)
+                if raw is None:
+                    raise TimeoutError(f"no reply within {timeout}s on turn {n + 1}")
+                frame = json.loads(raw)
+                if frame.get("type") == "end":
+                    raise RuntimeError(f"agent ended the call on turn {n + 1}")
+                if frame.get("type") != "text":
+                    continue
+                if first is None:
+                    first = time.perf_counter()
+                    result["ttft"].append(first - sent)
+                if frame.get("last"):
+                    result["turn"].append(time.perf_counter() - sent)
+                    break
+        ws.send(json.dumps({"type": "end", "reason": "caller hung up"}))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+    return result
+
+
+def run_level(ws_url, concurrency, turns, think, ramp):
+    """`concurrency` simultaneous calls, started `ramp` seconds apart in total."""
+    results = [None] * concurrency
+    phone_base = random.randint(1000000, 8999999)
+
+    def call(i):
+        time.sleep(ramp * i / max(concurrency, 1))
+        results[i] = simulate_call(ws_url, f"+1555{phone_base + i:07d}", turns, think)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=call, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    ttft = sorted(x for r in results for x in r["ttft"])
+    turn = sorted(x for r in results for x in r["turn"])
+    errors = [r["error"] for r in results if r["error"]]
+    return {
+        "concurrency": concurrency,
+        "calls": concurrency,
+        "failed_calls": len(errors),
+        "errors": sorted(set(errors))[:5],
+        "turns": len(turn),
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(len(turn) / elapsed, 2) if elapsed else 0.0,
+        "ttft_ms": _percentiles(ttft),
+        "turn_ms": _percentiles(turn),
+    }
+
+
+# ── Report ─────────────────────────────────────────────────────────────────
+
+def _percentiles(samples):
+    if not samples:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+
+    def pct(p):
+        return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000, 1)
+    return {"p50": pct(50), "p90": pct(90), "p99": pct(99), "max": round(samples[-1] * 1000, 1)}
+
+
+def print_report(levels, out):
+    header = (f"{'calls':>6} {'failed':>6} {'turns/s':>8} "
+              f"{'ttft p50':>9} {'p90':>7} {'p99':>7} {'turn p50':>9} {'p90':>7} {'p99':>7}")
+    out.write(header + "\n" + "─" * len(header) + "\n")
+
+    def ms(v):
+        return f"{v:.0f}" if v is not None else "-"
+    for r in levels:
+        t, u = r["ttft_ms"], r["turn_ms"]
+        out.write(f"{r['calls']:>6} {r['failed_calls']:>6} {r['turns_per_s']:>8.2f} "
+                  f"{ms(t['p50']):>9} {ms(t['p90']):>7} {ms(t['p99']):>7} "
+                  f"{ms(u['p50']):>9} {ms(u['p90']):>7} {ms(u['p99']):>7}\n")
+        for e in r["errors"]:
+            out.write(f"{'':>6} ! {e}\n")
+    out.flush()
+
+
+# ── App under test ─────────────────────────────────────────────────────────
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(openai_base_url, workdir, log):
+    """Run migrations and `python app.py` against a fresh SQLite database.
+    Returns (process, ws_url) once /health answers."""
+    port = _free_port()
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        "DATABASE_REPLICA_URL": "",
+        "OPENAI_API_KEY": "sk-loadtest",
+        "OPENAI_BASE_URL": openai_base_url,
+        "TWILIO_ACCOUNT_SID": os.getenv("TWILIO_ACCOUNT_SID", "AC" + "0" * 32),
+        "TWILIO_AUTH_TOKEN": os.getenv("TWILIO_AUTH_TOKEN", "loadtest"),
+        # Callers are simulated from one address — keep admission out of the way
+        "RATE_LIMIT_GLOBAL_PER_MIN": "1000000", "RATE_LIMIT_GLOBAL_BURST": "1000000",
+        "LLM_DAILY_TOKEN_BUDGET": "1000000000",
+        "MESSAGE_ARCHIVE_DIR": os.path.join(workdir, "archive"),
+    }
+    subprocess.run([sys.executable, os.path.join(ROOT, "migrations.py")],
+                   env=env, cwd=workdir, stdout=log, stderr=log, check=True)
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "app.py")],
+                            env=env, cwd=workdir, stdout=log, stderr=log)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"app.py exited with {proc.returncode} — see {log.name}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1)
+            return proc, f"ws://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"app.py did not answer /health within 30s — see {log.name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent ConversationRelay load test.")
+    parser.add_argument("--levels", default="1,5,10,25,50",
+                        help="comma-separated concurrency levels (default 1,5,10,25,50)")
+    parser.add_argument("--turns", type=int, default=4, help="prompts per call")
+    parser.add_argument("--think", type=float, default=1.0,
+                        help="seconds between the end of a reply and the next prompt")
+    parser.add_argument("--ramp", type=float, default=1.0,
+                        help="seconds over which each level's calls are started")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="fake model tokens per second")
+    parser.add_argument("--jitter", type=float, default=0.3,
+                        help="± fraction applied to every fake model delay")
+    parser.add_argument("--first-token", type=float, default=0.3,
+                        help="fake model seconds before the first token")
+    parser.add_argument("--url", help="ws:// base of an already running app — skips starting one "
+                                      "(it must already point OPENAI_BASE_URL somewhere)")
+    parser.add_argument("--openai-port", type=int, default=0,
+                        help="port for the fake OpenAI server (default: any free port)")
+    parser.add_argument("--json", help="also write the results here as JSON")
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.levels.split(",") if n.strip()]
+    fake = FakeOpenAI(args.token_rate, args.jitter, args.first_token, args.openai_port).start()
+    print(f"Fake OpenAI at {fake.base_url}")
+
+    proc = None
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    log = open(os.path.join(workdir, "app.log"), "w")
+    try:
+        if args.url:
+            ws_url = args.url.rstrip("/")
+        else:
+            proc, ws_url = start_app(fake.base_url, workdir, log)
+            print(f"App at {ws_url} (log: {log.name})")
+
+        results = []
+        for n in levels:
+            print(f"Running {n} concurrent calls × {args.turns} turns...")
+            results.append(run_level(ws_url, n, args.turns, args.think, args.ramp))
+
+        print_report(results, sys.stdout)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({
+                    "settings": {k: v for k, v in vars(args).items() if k != "json"},
+                    "levels": results,
+                    "llm_requests": fake.requests,
+                }, f, indent=2)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+        log.close()
+        fake.stop()
@@ -0,0 +1,235 @@
+"""
+Structured logging: one JSON object per line on stderr, written by a
+background thread so a log call never waits on I/O.
+
+    log = get_logger("agent_sms")
+    log.info("sms_received", sender=from_number, to=to_number)
+    log.error("db_error", op="save_message", error=e)
+    log.exception("relay_error")          # adds the traceback
+
+Levels: LOG_LEVEL for everything (default INFO), overridden per module by
+LOG_LEVELS="voice_agent=DEBUG,storage=WARNING".
+
+Sampling: LOG_SAMPLE="ws_event=0.05,sms_received=0.5" keeps that fraction of
+an event's records (SAMPLE_DEFAULTS covers per-frame voice events and
+rate-limit floods). Warnings and errors are never sampled.
+
+Redaction (LOG_REDACT, on by default): phone numbers keep their last four
+digits and street addresses are replaced, in fields and free text alike.
+
+The caller only builds a LogRecord and puts it on a bounded queue
+(LOG_QUEUE_MAX); rendering, redaction and the write happen on the writer
+thread, started by the first record. When the queue is full the record is
+dropped and counted in tradie_log_dropped_total.
+"""
+import sys
+import os
+import re
+import queue
+import atexit
+import random
+import logging
+import threading
+import traceback
+from datetime import datetime, timezone
+
+from jsoncodec import dumps
+
+LOG_LEVEL     = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS    = os.getenv("LOG_LEVELS", "")
+LOG_SAMPLE    = os.getenv("LOG_SAMPLE", "")
+LOG_FORMAT    = os.getenv("LOG_FORMAT", "json")   # json | text
+LOG_REDACT    = os.getenv("LOG_REDACT", "1") == "1"
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+
+# event → fraction kept, for events logged on every call frame or during floods
+SAMPLE_DEFAULTS = {"ws_event": 0.02, "rate_limited": 0.05}
+
+# Records written per write() call
+WRITE_BATCH = 500
+
+# Field names whose values are always phone numbers / addresses
+PHONE_FIELDS   = frozenset({"phone", "caller", "sender", "to", "from_", "owner_phone", "prospect"})
+ADDRESS_FIELDS = frozenset({"address"})
+
+_PHONE_RE = re.compile(r"(?<![\w+])\+?\d[\d\s().-]{7,}\d(?!\w)")
+_ADDRESS_RE = re.compile(
+    r"\b\d{1,6}[A-Za-z]?\s+(?:[A-Za-z.'-]+\s+){0,4}"
+    r"(?:street|st|road|rd|avenue|ave|drive|dr|crescent|cres|court|ct|lane|ln|boulevard|blvd|"
+    r"way|place|pl|parade|pde|highway|hwy|terrace|tce|close|cl)\b\.?",
+    re.IGNORECASE,
+)
+
+
+def _pairs(spec):
+    return {k.strip(): v.strip() for k, _, v in (p.partition("=") for p in spec.split(",")) if v}
+
+
+_samples = {**SAMPLE_DEFAULTS, **{k: float(v) for k, v in _pairs(LOG_SAMPLE).items()}}
+_levels  = {k: v.upper() for k, v in _pairs(LOG_LEVELS).items()}
+
+_queue  = queue.Queue(maxsize=LOG_QUEUE_MAX)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+# ── Redaction ──────────────────────────────────────────────────────────────
+
+def _mask_phone(match):
+    text = match.group(0)
+    digits = [c for c in text if c.isdigit()]
+    if len(digits) < 10:
+        return text   # dates, amounts, short ids
+    return ("+" if text.startswith("+") else "") + "*" * (len(digits) - 4) + "".join(digits[-4:])
+
+
+def redact(text):
+    """Mask phone numbers and addresses in free text."""
+    return _ADDRESS_RE.sub("[address]", _PHONE_RE.sub(_mask_phone, text))
+
+
+def _clean(key, value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, dict):
+        return {k: _clean(k, v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_clean(key, v) for v in value]
+    text = value if isinstance(value, str) else str(value)
+    if not LOG_REDACT:
+        return text
+    if key in ADDRESS_FIELDS:
+        return "[address]" if text else text
+    if key in PHONE_FIELDS:
+        return _PHONE_RE.sub(_mask_phone, text)
+    return redact(text)
+
+
+# ── Rendering and writing (writer thread) ─────────────────────────────────
+
+def _render(record):
+    out = {
+        "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+        "level": record.levelname.lower(),
+        "logger": record.name[len("tradie."):],
+        "event": record.msg,
+    }
+    for key, value in getattr(record, "fields", {}).items():
+        out[key] = _clean(key, value)
+    if record.exc_info:
+        tb = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+        out["traceback"] = redact(tb) if LOG_REDACT else tb
+    if LOG_FORMAT == "text":
+        extra = " ".join(f"{k}={v}" for k, v in out.items() if k not in ("ts", "level", "logger", "event", "traceback"))
+        line = f"{out['ts']} {out['level'].upper():7} {out['logger']} {out['event']} {extra}".rstrip()
+        return line + ("\n" + out["traceback"] if "traceback" in out else "") + "\n"
+    return dumps(out) + "\n"
+
+
+def _write_loop():
+    stream = sys.__stderr__
+    while True:
+        batch = [_queue.get()]
+        while len(batch) < WRITE_BATCH:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        stop = None in batch
+        lines = []
+        for record in batch:
+            if record is None:
+                continue
+            try:
+                lines.append(_render(record))
+            except Exception as e:
+                lines.append(dumps({"level": "error", "logger": "logs",
+                                         "event": "render_error", "error": str(e)}) + "\n")
+        try:
+            stream.write("".join(lines))
+            stream.flush()
+        except Exception:
+            pass
+        if stop:
+            return
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, daemon=True)
+            _writer.start()
+            atexit.register(_stop_writer)
+
+
+def _stop_writer():
+    """Flush what is queued before the interpreter exits."""
+    try:
+        _queue.put(None, timeout=1)
+        _writer.join(timeout=2)
+    except Exception:
+        pass
+
+
+class _QueueHandler(logging.Handler):
+    """Hands records to the writer thread; never blocks the caller."""
+
+    def emit(self, record):
+        if _writer is None:
+            _start_writer()
+        try:
+            _queue.put_nowait(record)
+        except queue.Full:
+            from metrics import inc
+            inc("tradie_log_dropped_total")
+
+
+_root = logging.getLogger("tradie")
+_root.setLevel(LOG_LEVEL)
+_root.addHandler(_QueueHandler())
+_root.propagate = False
+
+
+# ── Loggers ────────────────────────────────────────────────────────────────
+
+class EventLogger:
+    """Logs an event name plus keyword fields. Fields are rendered on the
+    writer thread, so pass values — don't pre-format strings."""
+
+    def __init__(self, name):
+        self.name = name
+        self._logger = logging.getLogger(f"tradie.{name}")
+        if name in _levels:
+            self._logger.setLevel(_levels[name])
+
+    def _log(self, level, event, fields, exc_info=None):
+        if not self._logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING:
+            rate = _samples.get(event)
+            if rate is not None and random.random() >= rate:
+                return
+        # makeRecord + handle skips Logger.log's caller lookup (a stack walk)
+        record = self._logger.makeRecord(self._logger.name, level, "", 0, event, None, exc_info)
+        record.fields = fields
+        self._logger.handle(record)
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=sys.exc_info())
+
+
+def get_logger(name):
+    return EventLogger(name)
@@ -0,0 +1,221 @@
+"""
+Prometheus metrics, served as text at /metrics.
+
+Counters and histograms are sharded per thread: every thread writes only to
+its own dict, so the hot paths take no lock and never contend. A scrape sums
+the shards; shards of finished threads are folded into one retired shard.
+Gauges that describe state rather than events (pool usage, buffered events,
+thread count) are read by callbacks at scrape time.
+
+    inc("tradie_messages_processed_total", channel="sms")
+    observe("tradie_scheduler_tick_seconds", elapsed)
+    register_gauge("tradie_threads", lambda: [({}, threading.active_count())])
+"""
+import os
+import math
+import threading
+
+from logs import get_logger
+
+log = get_logger("metrics")
+
+# Bearer token required on /metrics when set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Histogram bucket upper bounds, seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# name → (type, help). Only metrics listed here are exported.
+METRICS = {
+    "tradie_voice_websockets_active": ("gauge", "Open ConversationRelay websockets"),
+    "tradie_voice_call_slots": ("gauge", "Voice call slots held, live or reserved at /voice"),
+    "tradie_voice_calls_rejected_total": ("counter", "Calls sent to voicemail because a concurrency cap was hit"),
+    "tradie_voicemails_total": ("counter", "Voicemails received, by transcription status"),
+    "tradie_messages_processed_total": ("counter", "Inbound caller messages handled, by channel"),
+    "tradie_llm_requests_total": ("counter", "LLM requests by task, model and tenant"),
+    "tradie_llm_tokens_total": ("counter", "LLM tokens by task, model, tenant and kind (prompt, completion)"),
+    "tradie_llm_cost_usd_total": ("counter", "LLM spend in USD by task, model and tenant (llm.PRICES)"),
+    "tradie_llm_errors_total": ("counter", "Failed LLM requests by task and model"),
+    "tradie_llm_fallbacks_total": ("counter", "LLM requests retried on the next model in the task's chain, by failed model"),
+    "tradie_llm_request_seconds": ("histogram", "LLM request latency by task and model (streams: until the last token)"),
+    "tradie_llm_first_token_seconds": ("histogram", "Time to the first streamed token by task and model"),
+    "tradie_owner_notify_seconds": ("histogram", "From call end to the owner's lead SMS, by lead kind (full, partial)"),
+    "tradie_external_requests_total": ("counter", "Calls to external APIs (openai, twilio) by service"),
+    "tradie_external_errors_total": ("counter", "Failed calls to external APIs by service"),
+    "tradie_external_request_seconds": ("histogram", "External API call latency by service"),
+    "tradie_scheduler_tick_seconds": ("histogram", "Duration of one outbound scheduler tick"),
+    "tradie_scheduler_followups_due": ("gauge", "Outbound leads due a follow-up at the last tick"),
+    "tradie_db_pool_connections": ("gauge", "Postgres pool connections by pool and state"),
+    "tradie_db_pool_size": ("gauge", "Postgres pool capacity by pool"),
+    "tradie_event_buffer_pending": ("gauge", "Outbound events waiting to be written"),
+    "tradie_threads": ("gauge", "Live Python threads"),
+    "tradie_log_dropped_total": ("counter", "Log records dropped because the log queue was full"),
+}
+
+_local = threading.local()
+_shards = []        # (thread, shard) for every thread that has recorded something
+_retired = {}       # totals from threads that have exited
+_shards_lock = threading.Lock()
+_gauges = {}        # name → callback returning [(labels, value)]
+_set_values = {}    # name → {label key: value} for gauges set directly
+
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _retire_dead()
+            _shards.append((threading.current_thread(), shard))
+    return shard
+
+
+def _merge(into, shard):
+    # dict() copies in one C call — safe while the owning thread writes
+    for key, v in dict(shard).items():
+        if isinstance(v, list):
+            acc = into.get(key)
+            into[key] = list(v) if acc is None else [a + b for a, b in zip(acc, v)]
+        else:
+            into[key] = into.get(key, 0) + v
+
+
+def _retire_dead():
+    """Fold shards of exited threads into _retired. Caller holds _shards_lock."""
+    live = []
+    for thread, shard in _shards:
+        if thread.is_alive():
+            live.append((thread, shard))
+        else:
+            _merge(_retired, shard)
+    _shards[:] = live
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+def inc(name, value=1, **labels):
+    """Add to a counter (or move an event-driven gauge) — this thread's shard only."""
+    shard = _shard()
+    key = _key(name, labels)
+    shard[key] = shard.get(key, 0) + value
+
+
+def dec(name, value=1, **labels):
+    inc(name, -value, **labels)
+
+
+def observe(name, value, **labels):
+    """Record one histogram sample."""
+    shard = _shard()
+    key = _key(name, labels)
+    h = shard.get(key)
+    if h is None:
+        h = shard[key] = [0] * (len(BUCKETS) + 2)  # buckets…, count, sum
+    for i, bound in enumerate(BUCKETS):
+        if value <= bound:
+            h[i] += 1
+            break
+    h[-2] += 1
+    h[-1] += value
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to an absolute value (last writer wins)."""
+    _set_values.setdefault(name, {})[_key(name, labels)[1]] = value
+
+
+def register_gauge(name, callback):
+    """callback() → [(labels dict, value)], evaluated on every scrape."""
+    _gauges[name] = callback
+
+
+def llm_request(task, model, client_id, seconds=0, prompt_tokens=0, completion_tokens=0, cost=0.0, error=False):
+    """One LLM call: count, tokens, cost and latency by task, model and tenant."""
+    if error:
+        inc("tradie_llm_errors_total", task=task, model=model)
+        return
+    inc("tradie_llm_requests_total", task=task, model=model, tenant=str(client_id or 0))
+    llm_tokens(task, model, client_id, prompt_tokens, completion_tokens, cost)
+    observe("tradie_llm_request_seconds", seconds, task=task, model=model)
+
+
+def llm_tokens(task, model, client_id, prompt_tokens=0, completion_tokens=0, cost=0.0):
+    """Tokens and cost of one LLM call — billed whether or not it succeeded."""
+    tenant = str(client_id or 0)
+    if prompt_tokens:
+        inc("tradie_llm_tokens_total", prompt_tokens, task=task, model=model, tenant=tenant, kind="prompt")
+    if completion_tokens:
+        inc("tradie_llm_tokens_total", completion_tokens, task=task, model=model, tenant=tenant, kind="completion")
+    if cost:
+        inc("tradie_llm_cost_usd_total", cost, task=task, model=model, tenant=tenant)
+
+
+# ── Exposition ─────────────────────────────────────────────────────────────
+
+def _labels(pairs, extra=()):
+    pairs = tuple(pairs) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(v):
+    if isinstance(v, float):
+        if math.isinf(v):
+            return "+Inf" if v > 0 else "-Inf"
+        return repr(v)
+    return str(v)
+
+
+def collect():
+    """{name: {label pairs: value or histogram list}} summed over all shards."""
+    flat = {}
+    with _shards_lock:
+        _retire_dead()
+        _merge(flat, _retired)
+        for _, shard in _shards:
+            _merge(flat, shard)
+    totals = {}
+    for (name, labels), v in flat.items():
+        totals.setdefault(name, {})[labels] = v
+    for name, values in list(_set_values.items()):
+        totals.setdefault(name, {}).update(values)
+    for name, callback in list(_gauges.items()):
+        try:
+            totals[name] = {_key(name, labels)[1]: value for labels, value in callback()}
+        except Exception as e:
+            log.error("gauge_error", metric=name, error=e)
+    return totals
+
+
+def render():
+    """Prometheus text exposition format (0.0.4)."""
+    totals = collect()
+    out = []
+    for name, (kind, help_text) in METRICS.items():
+        series = totals.get(name)
+        if not series:
+            continue
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        for labels, v in sorted(series.items()):
+            if kind != "histogram":
+                out.append(f"{name}{_labels(labels)} {_number(v)}")
+                continue
+            cumulative = 0
+            for bound, n in zip(BUCKETS, v):
+                cumulative += n
+                out.append(f"{name}_bucket{_labels(labels, [('le', _number(float(bound)))])} {cumulative}")
+            out.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {v[-2]}")
+            out.append(f"{name}_count{_labels(labels)} {v[-2]}")
+            out.append(f"{name}_sum{_labels(labels)} {_number(float(v[-1]))}")
+    return "\n".join(out) + "\n"
+
+
+register_gauge("tradie_threads", lambda: [({}, threading.active_count())])
@@ -0,0 +1,907 @@
+"""
+Versioned schema migrations.
+
+Run once per deploy, never from import or request paths:
+
+    python migrations.py            # apply pending migrations
+    python migrations.py status     # list applied / pending versions
+    python migrations.py isolate-tenant 42   # give one tenant its own partition
+
+Every migration runs in its own transaction and is recorded in
+schema_version together with how long it took. Migrations are append-only:
+never edit one that has shipped, add a new version instead.
+
+An embedded SQLite database (DATABASE_URL=sqlite:///...) starts from
+SQLITE_SCHEMA — the Postgres schema as of SQLITE_SCHEMA_VERSION, minus
+partitioning and search — and then applies SQLITE_MIGRATIONS. A new Postgres
+migration that changes tables or columns needs a SQLite twin there.
+"""
+import sys
+import time
+import database
+from database import get_db, supports
+
+# Arbitrary constant — serialises concurrent runners (two deploys at once)
+MIGRATION_LOCK_ID = 72417001
+
+
+MIGRATIONS = [
+    (1, "base schema", """
+        CREATE TABLE IF NOT EXISTS messages (
+            id SERIAL PRIMARY KEY,
+            phone TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        );
+        CREATE TABLE IF NOT EXISTS leads (
+            id SERIAL PRIMARY KEY,
+            phone TEXT NOT NULL UNIQUE,
+            client_id INTEGER,
+            name TEXT,
+            address TEXT,
+            contact_phone TEXT,
+            problem TEXT,
+            urgent BOOLEAN DEFAULT FALSE,
+            channel TEXT DEFAULT 'sms',
+            status TEXT DEFAULT 'new',
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        );
+        CREATE TABLE IF NOT EXISTS quotes (
+            id SERIAL PRIMARY KEY,
+            lead_id INTEGER REFERENCES leads(id),
+            phone TEXT NOT NULL,
+            problem TEXT,
+            estimate_low INTEGER DEFAULT 0,
+            estimate_high INTEGER DEFAULT 0,
+            details TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        );
+        CREATE TABLE IF NOT EXISTS clients (
+            id SERIAL PRIMARY KEY,
+            business_name TEXT NOT NULL,
+            owner_name TEXT,
+            owner_phone TEXT UNIQUE,
+            twilio_number TEXT UNIQUE,
+            province TEXT DEFAULT 'ON',
+            plan TEXT DEFAULT 'trial',
+            trial_ends_at TIMESTAMPTZ,
+            stripe_customer_id TEXT,
+            active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        );
+        -- Columns added after the first deploys (was GET /migrate)
+        ALTER TABLE leads ADD COLUMN IF NOT EXISTS client_id INTEGER;
+        ALTER TABLE leads ADD COLUMN IF NOT EXISTS channel TEXT DEFAULT 'sms';
+        ALTER TABLE leads ADD COLUMN IF NOT EXISTS contact_phone TEXT;
+        CREATE INDEX IF NOT EXISTS idx_messages_phone ON messages(phone);
+        CREATE INDEX IF NOT EXISTS idx_leads_phone ON leads(phone);
+        CREATE INDEX IF NOT EXISTS idx_leads_status ON leads(status);
+        CREATE INDEX IF NOT EXISTS idx_clients_twilio_number ON clients(twilio_number);
+        CREATE INDEX IF NOT EXISTS idx_clients_owner_phone ON clients(owner_phone);
+    """),
+
+    (2, "outbound tables", """
+        CREATE TABLE IF NOT EXISTS outbound_leads (
+            id SERIAL PRIMARY KEY,
+            business_name TEXT NOT NULL,
+            owner_name TEXT,
+            phone TEXT UNIQUE NOT NULL,
+            city TEXT,
+            status TEXT DEFAULT 'pending',
+            sms_sent BOOLEAN DEFAULT FALSE,
+            sms_sent_at TIMESTAMPTZ,
+            sms_opened BOOLEAN DEFAULT FALSE,
+            responded BOOLEAN DEFAULT FALSE,
+            responded_at TIMESTAMPTZ,
+            demo_called BOOLEAN DEFAULT FALSE,
+            demo_answered BOOLEAN DEFAULT FALSE,
+            demo_called_at TIMESTAMPTZ,
+            trial_activated BOOLEAN DEFAULT FALSE,
+            trial_activated_at TIMESTAMPTZ,
+            paid BOOLEAN DEFAULT FALSE,
+            follow_up_count INTEGER DEFAULT 0,
+            last_follow_up_at TIMESTAMPTZ,
+            next_follow_up_at TIMESTAMPTZ,
+            notes TEXT,
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        );
+        CREATE TABLE IF NOT EXISTS outbound_events (
+            id SERIAL PRIMARY KEY,
+            lead_phone TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            notes TEXT,
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS idx_outbound_phone ON outbound_leads(phone);
+        CREATE INDEX IF NOT EXISTS idx_outbound_status ON outbound_leads(status);
+        CREATE INDEX IF NOT EXISTS idx_outbound_next_followup ON outbound_leads(next_follow_up_at);
+    """),
+
+    (3, "client dashboard tokens", """
+        ALTER TABLE clients ADD COLUMN IF NOT EXISTS dashboard_token TEXT UNIQUE;
+        -- New clients get a token on insert instead of waiting for a manual backfill
+        ALTER TABLE clients ALTER COLUMN dashboard_token SET DEFAULT md5(random()::text);
+        UPDATE clients SET dashboard_token = md5(random()::text) WHERE dashboard_token IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_clients_twilio ON clients(twilio_number);
+    """),
+
+    (4, "demo sessions", """
+        CREATE TABLE IF NOT EXISTS demo_sessions (
+            id SERIAL PRIMARY KEY,
+            prospect_phone TEXT UNIQUE NOT NULL,
+            business_name TEXT NOT NULL,
+            owner_name TEXT,
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            expires_at TIMESTAMPTZ DEFAULT NOW() + INTERVAL '30 minutes'
+        );
+    """),
+
+    (5, "tenant usage counters", """
+        CREATE TABLE IF NOT EXISTS tenant_usage_daily (
+            day DATE NOT NULL,
+            client_id INTEGER NOT NULL DEFAULT 0,
+            llm_calls INTEGER DEFAULT 0,
+            llm_tokens BIGINT DEFAULT 0,
+            llm_rejected INTEGER DEFAULT 0,
+            updated_at TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (day, client_id)
+        );
+    """),
+
+    (6, "lead dashboard and owner command indexes", """
+        CREATE INDEX IF NOT EXISTS idx_leads_client_status_created ON leads(client_id, status, created_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_leads_client_created ON leads(client_id, created_at DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_leads_created ON leads(created_at DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_leads_client_urgent_new ON leads(client_id, created_at DESC)
+            WHERE urgent = TRUE AND status = 'new';
+        CREATE INDEX IF NOT EXISTS idx_outbound_created ON outbound_leads(created_at DESC, id DESC);
+    """),
+
+    (7, "outbound funnel rollup", """
+        CREATE INDEX IF NOT EXISTS idx_outbound_events_phone_id ON outbound_events(lead_phone, id);
+        CREATE TABLE IF NOT EXISTS outbound_funnel_daily (
+            day DATE NOT NULL,
+            template TEXT NOT NULL,
+            city TEXT NOT NULL,
+            cohort_week DATE NOT NULL,
+            event_type TEXT NOT NULL,
+            events INTEGER DEFAULT 0,
+            PRIMARY KEY (day, template, city, cohort_week, event_type)
+        );
+        CREATE TABLE IF NOT EXISTS rollup_watermarks (
+            name TEXT PRIMARY KEY,
+            last_id BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """),
+
+    (8, "indexes matched to query shapes", """
+        -- get_conversation: phone filter + created_at sort in one index
+        CREATE INDEX IF NOT EXISTS idx_messages_phone_created ON messages(phone, created_at);
+        DROP INDEX IF EXISTS idx_messages_phone;
+
+        -- get_leads_due_followup: only prospects still in the follow-up sequence
+        CREATE INDEX IF NOT EXISTS idx_outbound_followup_due ON outbound_leads(next_follow_up_at)
+            WHERE follow_up_count < 2 AND status NOT IN ('paid', 'dead', 'trial', 'demo_done');
+        DROP INDEX IF EXISTS idx_outbound_next_followup;
+
+        -- get_leads_no_answer_demo: prospects waiting on a demo retry
+        CREATE INDEX IF NOT EXISTS idx_outbound_no_answer ON outbound_leads(last_follow_up_at)
+            WHERE status = 'no_answer' AND responded = TRUE
+            AND demo_called = TRUE AND demo_answered = FALSE;
+
+        -- get_trials_ending_soon / get_trial_day5_clients: active trials by end date
+        CREATE INDEX IF NOT EXISTS idx_clients_active_trial_ends ON clients(trial_ends_at)
+            WHERE plan = 'trial' AND active = TRUE;
+
+        -- demo_sessions expiry sweep
+        CREATE INDEX IF NOT EXISTS idx_demo_sessions_expires ON demo_sessions(expires_at);
+
+        -- Duplicates of the UNIQUE constraint indexes, or too unselective to use
+        -- (dashboard_token, leads.phone, outbound phone, owner_phone and
+        -- twilio_number are all served by their UNIQUE indexes)
+        DROP INDEX IF EXISTS idx_leads_phone;
+        DROP INDEX IF EXISTS idx_leads_status;
+        DROP INDEX IF EXISTS idx_outbound_phone;
+        DROP INDEX IF EXISTS idx_outbound_status;
+        DROP INDEX IF EXISTS idx_clients_twilio;
+        DROP INDEX IF EXISTS idx_clients_twilio_number;
+        DROP INDEX IF EXISTS idx_clients_owner_phone;
+    """),
+
+    (9, "tenant-scoped leads and messages, partitioned by tenant", """
+        -- Tenant key is client_id; 0 is the default (env-configured) client.
+        -- leads:    LIST (client_id) — big tenants get their own partition
+        --           (python migrations.py isolate-tenant <id>), everyone else
+        --           lands in leads_shared, hash-partitioned 16 ways.
+        -- messages: HASH (client_id), 16 ways.
+        -- Rows are copied with their ids; the id sequences are carried over.
+
+        ALTER TABLE quotes DROP CONSTRAINT IF EXISTS quotes_lead_id_fkey;
+        DROP INDEX IF EXISTS idx_leads_client_status_created;
+        DROP INDEX IF EXISTS idx_leads_client_created;
+        DROP INDEX IF EXISTS idx_leads_created;
+        DROP INDEX IF EXISTS idx_leads_client_urgent_new;
+        DROP INDEX IF EXISTS idx_messages_phone_created;
+
+        ALTER TABLE leads RENAME TO leads_legacy;
+        ALTER TABLE leads_legacy RENAME CONSTRAINT leads_pkey TO leads_legacy_pkey;
+        ALTER TABLE leads_legacy RENAME CONSTRAINT leads_phone_key TO leads_legacy_phone_key;
+        ALTER SEQUENCE leads_id_seq OWNED BY NONE;
+        ALTER TABLE messages RENAME TO messages_legacy;
+        ALTER TABLE messages_legacy RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey;
+        ALTER SEQUENCE messages_id_seq OWNED BY NONE;
+
+        CREATE TABLE leads (
+            id INTEGER NOT NULL DEFAULT nextval('leads_id_seq'),
+            client_id INTEGER NOT NULL DEFAULT 0,
+            phone TEXT NOT NULL,
+            name TEXT,
+            address TEXT,
+            contact_phone TEXT,
+            problem TEXT,
+            urgent BOOLEAN DEFAULT FALSE,
+            channel TEXT DEFAULT 'sms',
+            status TEXT DEFAULT 'new',
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            updated_at TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (client_id, id),
+            UNIQUE (client_id, phone)
+        ) PARTITION BY LIST (client_id);
+        CREATE TABLE leads_shared PARTITION OF leads DEFAULT PARTITION BY HASH (client_id);
+
+        CREATE TABLE messages (
+            id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+            client_id INTEGER NOT NULL DEFAULT 0,
+            phone TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (client_id, id)
+        ) PARTITION BY HASH (client_id);
+
+        DO $$
+        BEGIN
+            FOR i IN 0..15 LOOP
+                EXECUTE format('CREATE TABLE leads_shared_%s PARTITION OF leads_shared '
+                               'FOR VALUES WITH (MODULUS 16, REMAINDER %s)', i, i);
+                EXECUTE format('CREATE TABLE messages_%s PARTITION OF messages '
+                               'FOR VALUES WITH (MODULUS 16, REMAINDER %s)', i, i);
+            END LOOP;
+        END $$;
+
+        INSERT INTO leads (id, client_id, phone, name, address, contact_phone, problem,
+                           urgent, channel, status, created_at, updated_at)
+        SELECT id, COALESCE(client_id, 0), phone, name, address, contact_phone, problem,
+               urgent, channel, status, created_at, updated_at
+        FROM leads_legacy;
+
+        -- Old messages carry no tenant: take it from the lead with that phone
+        INSERT INTO messages (id, client_id, phone, role, content, created_at)
+        SELECT m.id, COALESCE(l.client_id, 0), m.phone, m.role, m.content, m.created_at
+        FROM messages_legacy m LEFT JOIN leads_legacy l ON l.phone = m.phone;
+
+        ALTER TABLE quotes ADD COLUMN IF NOT EXISTS client_id INTEGER NOT NULL DEFAULT 0;
+        UPDATE quotes q SET client_id = COALESCE(l.client_id, 0)
+        FROM leads_legacy l WHERE l.id = q.lead_id;
+
+        DROP TABLE leads_legacy;
+        DROP TABLE messages_legacy;
+        ALTER SEQUENCE leads_id_seq OWNED BY leads.id;
+        ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+
+        CREATE INDEX idx_leads_client_status_created ON leads(client_id, status, created_at DESC);
+        CREATE INDEX idx_leads_client_created ON leads(client_id, created_at DESC, id DESC);
+        CREATE INDEX idx_leads_created ON leads(created_at DESC, id DESC);
+        CREATE INDEX idx_leads_client_urgent_new ON leads(client_id, created_at DESC)
+            WHERE urgent = TRUE AND status = 'new';
+        CREATE INDEX idx_messages_client_phone_created ON messages(client_id, phone, created_at);
+        CREATE INDEX IF NOT EXISTS idx_quotes_client_lead ON quotes(client_id, lead_id);
+    """),
+
+    (10, "messages partitioned by month, then by tenant", """
+        -- messages: RANGE (created_at) monthly → HASH (client_id) 8 ways.
+        -- Old months are archived to disk and dropped (archive.py), so the
+        -- hot table stays bounded; per-tenant lookups still prune by hash.
+        CREATE OR REPLACE FUNCTION create_message_month(month DATE) RETURNS BOOLEAN AS $$
+        DECLARE
+            part TEXT := 'messages_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM');
+        BEGIN
+            IF to_regclass(part) IS NOT NULL THEN
+                RETURN FALSE;
+            END IF;
+            EXECUTE format('CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L) '
+                           'PARTITION BY HASH (client_id)',
+                           part, month, (month + INTERVAL '1 month')::date);
+            FOR i IN 0..7 LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES WITH (MODULUS 8, REMAINDER %s)',
+                               part || '_p' || i, part, i);
+            END LOOP;
+            RETURN TRUE;
+        END $$ LANGUAGE plpgsql;
+
+        ALTER TABLE messages RENAME TO messages_by_tenant;
+        ALTER TABLE messages_by_tenant RENAME CONSTRAINT messages_pkey TO messages_by_tenant_pkey;
+        ALTER SEQUENCE messages_id_seq OWNED BY NONE;
+
+        CREATE TABLE messages (
+            id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+            client_id INTEGER NOT NULL DEFAULT 0,
+            phone TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (client_id, created_at, id)
+        ) PARTITION BY RANGE (created_at);
+        CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+
+        SELECT create_message_month(m::date)
+        FROM generate_series(
+            date_trunc('month', COALESCE((SELECT MIN(created_at) FROM messages_by_tenant), NOW())),
+            date_trunc('month', NOW()) + INTERVAL '2 months',
+            INTERVAL '1 month'
+        ) m;
+
+        INSERT INTO messages (id, client_id, phone, role, content, created_at)
+        SELECT id, client_id, phone, role, content, COALESCE(created_at, NOW())
+        FROM messages_by_tenant;
+
+        DROP TABLE messages_by_tenant;
+        ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+        CREATE INDEX idx_messages_client_phone_created ON messages(client_id, phone, created_at);
+
+        -- Per-tenant retention (NULL = MESSAGE_RETENTION_DAYS env default)
+        ALTER TABLE clients ADD COLUMN IF NOT EXISTS message_retention_days INTEGER;
+
+        -- Which archive file holds which caller's messages, for rehydration
+        CREATE TABLE IF NOT EXISTS message_archive_index (
+            client_id INTEGER NOT NULL,
+            phone TEXT NOT NULL,
+            month DATE NOT NULL,
+            path TEXT NOT NULL,
+            messages INTEGER NOT NULL,
+            archived_at TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (client_id, phone, month)
+        );
+        CREATE INDEX IF NOT EXISTS idx_message_archive_month ON message_archive_index(month);
+    """),
+
+    (11, "full-text and trigram search", """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        -- btree_gin lets client_id lead each GIN index, so searches stay per-tenant
+        CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+        ALTER TABLE leads ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(problem, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(address, '')), 'C')
+        ) STORED;
+        ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
+
+        CREATE INDEX IF NOT EXISTS idx_leads_search ON leads USING GIN (client_id, search_vector);
+        CREATE INDEX IF NOT EXISTS idx_leads_address_trgm ON leads USING GIN (client_id, address gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_leads_phone_trgm
+            ON leads USING GIN (client_id, phone gin_trgm_ops, contact_phone gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_messages_search ON messages USING GIN (client_id, search_vector);
+    """),
+
+    (12, "quotes export index", """
+        -- Keyset order for export.py; leads and messages already have one
+        CREATE INDEX IF NOT EXISTS idx_quotes_client_created ON quotes(client_id, created_at, id);
+    """),
+
+    (13, "outbound event timeline and analytics indexes", """
+        -- Per-prospect timeline; the (lead_phone, id) index stays for the funnel rollup
+        CREATE INDEX IF NOT EXISTS idx_outbound_events_phone_created ON outbound_events(lead_phone, created_at);
+        CREATE INDEX IF NOT EXISTS idx_outbound_events_type_created ON outbound_events(event_type, created_at);
+    """),
+
+    (14, "outbound funnel counts prospects", """
+        -- One row per prospect and event type (its first such event), so funnel
+        -- stages count distinct prospects rather than events
+        CREATE TABLE IF NOT EXISTS outbound_funnel_prospects (
+            lead_phone TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            event_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            template TEXT NOT NULL,
+            city TEXT NOT NULL,
+            cohort_week DATE NOT NULL,
+            PRIMARY KEY (lead_phone, event_type)
+        );
+        CREATE INDEX IF NOT EXISTS idx_outbound_funnel_prospects_day ON outbound_funnel_prospects(day);
+        DROP TABLE IF EXISTS outbound_funnel_daily;
+        -- Rebuilt from the first event on the next refresh
+        DELETE FROM rollup_watermarks WHERE name = 'outbound_funnel';
+    """),
+
+    (15, "outbound funnel daily counters", """
+        -- Prospects per day and group whose first event of a type it was; kept
+        -- in step with outbound_funnel_prospects by refresh_outbound_funnel, so
+        -- funnel reads cost O(days × groups)
+        CREATE TABLE IF NOT EXISTS outbound_funnel_daily (
+            day DATE NOT NULL,
+            template TEXT NOT NULL,
+            city TEXT NOT NULL,
+            cohort_week DATE NOT NULL,
+            event_type TEXT NOT NULL,
+            prospects INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, template, city, cohort_week, event_type)
+        );
+        INSERT INTO outbound_funnel_daily (day, template, city, cohort_week, event_type, prospects)
+        SELECT day, template, city, cohort_week, event_type, COUNT(*)
+        FROM outbound_funnel_prospects GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT DO NOTHING;
+    """),
+
+    (16, "outbound lead counters", """
+        -- Leads per status and pipeline flags, kept by triggers on
+        -- outbound_leads, so the live pipeline tiles read a handful of rows
+        -- instead of grouping every lead
+        CREATE TABLE IF NOT EXISTS outbound_lead_counts (
+            status TEXT NOT NULL,
+            sms_sent BOOLEAN NOT NULL,
+            responded BOOLEAN NOT NULL,
+            demo_called BOOLEAN NOT NULL,
+            trial_activated BOOLEAN NOT NULL,
+            paid BOOLEAN NOT NULL,
+            leads INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (status, sms_sent, responded, demo_called, trial_activated, paid)
+        );
+
+        CREATE OR REPLACE FUNCTION count_outbound_lead() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                INSERT INTO outbound_lead_counts VALUES (
+                    COALESCE(OLD.status, 'unknown'), COALESCE(OLD.sms_sent, FALSE),
+                    COALESCE(OLD.responded, FALSE), COALESCE(OLD.demo_called, FALSE),
+                    COALESCE(OLD.trial_activated, FALSE), COALESCE(OLD.paid, FALSE), -1)
+                ON CONFLICT (status, sms_sent, responded, demo_called, trial_activated, paid)
+                DO UPDATE SET leads = outbound_lead_counts.leads + EXCLUDED.leads;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO outbound_lead_counts VALUES (
+                    COALESCE(NEW.status, 'unknown'), COALESCE(NEW.sms_sent, FALSE),
+                    COALESCE(NEW.responded, FALSE), COALESCE(NEW.demo_called, FALSE),
+                    COALESCE(NEW.trial_activated, FALSE), COALESCE(NEW.paid, FALSE), 1)
+                ON CONFLICT (status, sms_sent, responded, demo_called, trial_activated, paid)
+                DO UPDATE SET leads = outbound_lead_counts.leads + EXCLUDED.leads;
+            END IF;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+
+        -- No writes slip in between the backfill and the triggers
+        LOCK TABLE outbound_leads IN SHARE ROW EXCLUSIVE MODE;
+        DELETE FROM outbound_lead_counts;
+        INSERT INTO outbound_lead_counts
+        SELECT COALESCE(status, 'unknown'), COALESCE(sms_sent, FALSE), COALESCE(responded, FALSE),
+               COALESCE(demo_called, FALSE), COALESCE(trial_activated, FALSE), COALESCE(paid, FALSE),
+               COUNT(*)
+        FROM outbound_leads GROUP BY 1, 2, 3, 4, 5, 6;
+
+        DROP TRIGGER IF EXISTS outbound_leads_count_rows ON outbound_leads;
+        CREATE TRIGGER outbound_leads_count_rows
+            AFTER INSERT OR DELETE ON outbound_leads
+            FOR EACH ROW EXECUTE FUNCTION count_outbound_lead();
+        -- Follow-up bookkeeping updates leave the counters alone
+        DROP TRIGGER IF EXISTS outbound_leads_count_changes ON outbound_leads;
+        CREATE TRIGGER outbound_leads_count_changes
+            AFTER UPDATE OF status, sms_sent, responded, demo_called, trial_activated, paid ON outbound_leads
+            FOR EACH ROW
+            WHEN ((OLD.status, OLD.sms_sent, OLD.responded, OLD.demo_called, OLD.trial_activated, OLD.paid)
+                  IS DISTINCT FROM
+                  (NEW.status, NEW.sms_sent, NEW.responded, NEW.demo_called, NEW.trial_activated, NEW.paid))
+            EXECUTE FUNCTION count_outbound_lead();
+    """),
+]
+
+
+# ── Embedded SQLite ────────────────────────────────────────────────────────
+
+# Timestamps are UTC text in one sortable format (storage.py writes the same)
+_TS_NOW = "(strftime('%Y-%m-%d %H:%M:%f', 'now'))"
+
+SQLITE_SCHEMA_VERSION = 12
+SQLITE_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS clients (
+        id INTEGER PRIMARY KEY,
+        business_name TEXT NOT NULL,
+        owner_name TEXT,
+        owner_phone TEXT UNIQUE,
+        twilio_number TEXT UNIQUE,
+        province TEXT DEFAULT 'ON',
+        plan TEXT DEFAULT 'trial',
+        trial_ends_at TIMESTAMPTZ,
+        stripe_customer_id TEXT,
+        active BOOLEAN DEFAULT TRUE,
+        dashboard_token TEXT UNIQUE DEFAULT (lower(hex(randomblob(16)))),
+        message_retention_days INTEGER,
+        created_at TIMESTAMPTZ DEFAULT {_TS_NOW},
+        updated_at TIMESTAMPTZ DEFAULT {_TS_NOW}
+    );
+    CREATE INDEX IF NOT EXISTS idx_clients_active_trial_ends ON clients(trial_ends_at)
+        WHERE plan = 'trial' AND active = TRUE;
+
+    CREATE TABLE IF NOT EXISTS leads (
+        id INTEGER PRIMARY KEY,
+        client_id INTEGER NOT NULL DEFAULT 0,
+        phone TEXT NOT NULL,
+        name TEXT,
+        address TEXT,
+        contact_phone TEXT,
+        problem TEXT,
+        urgent BOOLEAN DEFAULT FALSE,
+        channel TEXT DEFAULT 'sms',
+        status TEXT DEFAULT 'new',
+        created_at TIMESTAMPTZ DEFAULT {_TS_NOW},
+        updated_at TIMESTAMPTZ DEFAULT {_TS_NOW},
+        UNIQUE (client_id, phone)
+    );
+    CREATE INDEX IF NOT EXISTS idx_leads_client_status_created ON leads(client_id, status, created_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_leads_client_created ON leads(client_id, created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS idx_leads_created ON leads(created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS idx_leads_client_urgent_new ON leads(client_id, created_at DESC)
+        WHERE urgent = TRUE AND status = 'new';
+
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY,
+        client_id INTEGER NOT NULL DEFAULT 0,
+        phone TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT {_TS_NOW}
+    );
+    CREATE INDEX IF NOT EXISTS idx_messages_client_phone_created ON messages(client_id, phone, created_at);
+    CREATE INDEX IF NOT EXISTS idx_messages_client_created ON messages(client_id, created_at, id);
+
+    CREATE TABLE IF NOT EXISTS quotes (
+        id INTEGER PRIMARY KEY,
+        client_id INTEGER NOT NULL DEFAULT 0,
+        lead_id INTEGER,
+        phone TEXT NOT NULL,
+        problem TEXT,
+        estimate_low INTEGER DEFAULT 0,
+        estimate_high INTEGER DEFAULT 0,
+        details TEXT,
+        status TEXT DEFAULT 'pending',
+        created_at TIMESTAMPTZ DEFAULT {_TS_NOW}
+    );
+    CREATE INDEX IF NOT EXISTS idx_quotes_client_lead ON quotes(client_id, lead_id);
+    CREATE INDEX IF NOT EXISTS idx_quotes_client_created ON quotes(client_id, created_at, id);
+
+    CREATE TABLE IF NOT EXISTS outbound_leads (
+        id INTEGER PRIMARY KEY,
+        business_name TEXT NOT NULL,
+        owner_name TEXT,
+        phone TEXT UNIQUE NOT NULL,
+        city TEXT,
+        status TEXT DEFAULT 'pending',
+        sms_sent BOOLEAN DEFAULT FALSE,
+        sms_sent_at TIMESTAMPTZ,
+        sms_opened BOOLEAN DEFAULT FALSE,
+        responded BOOLEAN DEFAULT FALSE,
+        responded_at TIMESTAMPTZ,
+        demo_called BOOLEAN DEFAULT FALSE,
+        demo_answered BOOLEAN DEFAULT FALSE,
+        demo_called_at TIMESTAMPTZ,
+        trial_activated BOOLEAN DEFAULT FALSE,
+        trial_activated_at TIMESTAMPTZ,
+        paid BOOLEAN DEFAULT FALSE,
+        follow_up_count INTEGER DEFAULT 0,
+        last_follow_up_at TIMESTAMPTZ,
+        next_follow_up_at TIMESTAMPTZ,
+        notes TEXT,
+        created_at TIMESTAMPTZ DEFAULT {_TS_NOW},
+        updated_at TIMESTAMPTZ DEFAULT {_TS_NOW}
+    );
+    CREATE INDEX IF NOT EXISTS idx_outbound_created ON outbound_leads(created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS idx_outbound_followup_due ON outbound_leads(next_follow_up_at)
+        WHERE follow_up_count < 2 AND status NOT IN ('paid', 'dead', 'trial', 'demo_done');
+    CREATE INDEX IF NOT EXISTS idx_outbound_no_answer ON outbound_leads(last_follow_up_at)
+        WHERE status = 'no_answer' AND responded = TRUE
+        AND demo_called = TRUE AND demo_answered = FALSE;
+
+    CREATE TABLE IF NOT EXISTS outbound_events (
+        id INTEGER PRIMARY KEY,
+        lead_phone TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        notes TEXT,
+        created_at TIMESTAMPTZ DEFAULT {_TS_NOW}
+    );
+    CREATE INDEX IF NOT EXISTS idx_outbound_events_phone_id ON outbound_events(lead_phone, id);
+
+    CREATE TABLE IF NOT EXISTS demo_sessions (
+        id INTEGER PRIMARY KEY,
+        prospect_phone TEXT UNIQUE NOT NULL,
+        business_name TEXT NOT NULL,
+        owner_name TEXT,
+        created_at TIMESTAMPTZ DEFAULT {_TS_NOW},
+        expires_at TIMESTAMPTZ DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', '+30 minutes'))
+    );
+    CREATE INDEX IF NOT EXISTS idx_demo_sessions_expires ON demo_sessions(expires_at);
+
+    CREATE TABLE IF NOT EXISTS tenant_usage_daily (
+        day DATE NOT NULL,
+        client_id INTEGER NOT NULL DEFAULT 0,
+        llm_calls INTEGER DEFAULT 0,
+        llm_tokens INTEGER DEFAULT 0,
+        llm_rejected INTEGER DEFAULT 0,
+        updated_at TIMESTAMPTZ DEFAULT {_TS_NOW},
+        PRIMARY KEY (day, client_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS outbound_funnel_daily (
+        day DATE NOT NULL,
+        template TEXT NOT NULL,
+        city TEXT NOT NULL,
+        cohort_week DATE NOT NULL,
+        event_type TEXT NOT NULL,
+        events INTEGER DEFAULT 0,
+        PRIMARY KEY (day, template, city, cohort_week, event_type)
+    );
+    CREATE TABLE IF NOT EXISTS rollup_watermarks (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ DEFAULT {_TS_NOW}
+    );
+
+    CREATE TABLE IF NOT EXISTS message_archive_index (
+        client_id INTEGER NOT NULL,
+        phone TEXT NOT NULL,
+        month DATE NOT NULL,
+        path TEXT NOT NULL,
+        messages INTEGER NOT NULL,
+        archived_at TIMESTAMPTZ DEFAULT {_TS_NOW},
+        PRIMARY KEY (client_id, phone, month)
+    );
+"""
+
+# (version, name, sql) applied on top of SQLITE_SCHEMA — same numbering as MIGRATIONS
+SQLITE_MIGRATIONS = [
+    (13, "outbound event timeline and analytics indexes", """
+        CREATE INDEX IF NOT EXISTS idx_outbound_events_phone_created ON outbound_events(lead_phone, created_at);
+        CREATE INDEX IF NOT EXISTS idx_outbound_events_type_created ON outbound_events(event_type, created_at);
+    """),
+    (14, "outbound funnel counts prospects", """
+        CREATE TABLE IF NOT EXISTS outbound_funnel_prospects (
+            lead_phone TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            event_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            template TEXT NOT NULL,
+            city TEXT NOT NULL,
+            cohort_week DATE NOT NULL,
+            PRIMARY KEY (lead_phone, event_type)
+        );
+        CREATE INDEX IF NOT EXISTS idx_outbound_funnel_prospects_day ON outbound_funnel_prospects(day);
+        DROP TABLE IF EXISTS outbound_funnel_daily;
+        DELETE FROM rollup_watermarks WHERE name = 'outbound_funnel';
+    """),
+    (15, "outbound funnel daily counters", """
+        CREATE TABLE IF NOT EXISTS outbound_funnel_daily (
+            day DATE NOT NULL,
+            template TEXT NOT NULL,
+            city TEXT NOT NULL,
+            cohort_week DATE NOT NULL,
+            event_type TEXT NOT NULL,
+            prospects INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, template, city, cohort_week, event_type)
+        );
+    """),
+    (16, "outbound lead counters", """
+        CREATE TABLE IF NOT EXISTS outbound_lead_counts (
+            status TEXT NOT NULL,
+            sms_sent BOOLEAN NOT NULL,
+            responded BOOLEAN NOT NULL,
+            demo_called BOOLEAN NOT NULL,
+            trial_activated BOOLEAN NOT NULL,
+            paid BOOLEAN NOT NULL,
+            leads INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (status, sms_sent, responded, demo_called, trial_activated, paid)
+        );
+        DELETE FROM outbound_lead_counts;
+        INSERT INTO outbound_lead_counts
+        SELECT COALESCE(status, 'unknown'), COALESCE(sms_sent, 0), COALESCE(responded, 0),
+               COALESCE(demo_called, 0), COALESCE(trial_activated, 0), COALESCE(paid, 0), COUNT(*)
+        FROM outbound_leads GROUP BY 1, 2, 3, 4, 5, 6;
+        CREATE TRIGGER IF NOT EXISTS outbound_leads_count_insert AFTER INSERT ON outbound_leads
+        BEGIN
+            INSERT INTO outbound_lead_counts VALUES (
+                COALESCE(NEW.status, 'unknown'), COALESCE(NEW.sms_sent, 0), COALESCE(NEW.responded, 0),
+                COALESCE(NEW.demo_called, 0), COALESCE(NEW.trial_activated, 0), COALESCE(NEW.paid, 0), 1)
+            ON CONFLICT (status, sms_sent, responded, demo_called, trial_activated, paid)
+            DO UPDATE SET leads = leads + excluded.leads;
+        END;
+        CREATE TRIGGER IF NOT EXISTS outbound_leads_count_delete AFTER DELETE ON outbound_leads
+        BEGIN
+            INSERT INTO outbound_lead_counts VALUES (
+                COALESCE(OLD.status, 'unknown'), COALESCE(OLD.sms_sent, 0), COALESCE(OLD.responded, 0),
+                COALESCE(OLD.demo_called, 0), COALESCE(OLD.trial_activated, 0), COALESCE(OLD.paid, 0), -1)
+            ON CONFLICT (status, sms_sent, responded, demo_called, trial_activated, paid)
+            DO UPDATE SET leads = leads + excluded.leads;
+        END;
+        CREATE TRIGGER IF NOT EXISTS outbound_leads_count_update
+        AFTER UPDATE OF status, sms_sent, responded, demo_called, trial_activated, paid ON outbound_leads
+        WHEN (OLD.status, OLD.sms_sent, OLD.responded, OLD.demo_called, OLD.trial_activated, OLD.paid)
+             IS NOT (NEW.status, NEW.sms_sent, NEW.responded, NEW.demo_called, NEW.trial_activated, NEW.paid)
+        BEGIN
+            INSERT INTO outbound_lead_counts VALUES (
+                COALESCE(OLD.status, 'unknown'), COALESCE(OLD.sms_sent, 0), COALESCE(OLD.responded, 0),
+                COALESCE(OLD.demo_called, 0), COALESCE(OLD.trial_activated, 0), COALESCE(OLD.paid, 0), -1)
+            ON CONFLICT (status, sms_sent, responded, demo_called, trial_activated, paid)
+            DO UPDATE SET leads = leads + excluded.leads;
+            INSERT INTO outbound_lead_counts VALUES (
+                COALESCE(NEW.status, 'unknown'), COALESCE(NEW.sms_sent, 0), COALESCE(NEW.responded, 0),
+                COALESCE(NEW.demo_called, 0), COALESCE(NEW.trial_activated, 0), COALESCE(NEW.paid, 0), 1)
+            ON CONFLICT (status, sms_sent, responded, demo_called, trial_activated, paid)
+            DO UPDATE SET leads = leads + excluded.leads;
+        END;
+    """),
+]
+
+
+def _migrations():
+    if database.BACKEND.name == "sqlite":
+        return [(SQLITE_SCHEMA_VERSION, "sqlite schema", SQLITE_SCHEMA)] + SQLITE_MIGRATIONS
+    return MIGRATIONS
+
+
+def _run_sql(c, sql):
+    if database.BACKEND.name == "sqlite":
+        # sqlite3 runs one statement per execute(); executescript takes many
+        # but commits first, so the transaction is opened inside the script
+        c.connection.raw.executescript("BEGIN IMMEDIATE;\n" + sql)
+    else:
+        c.execute(sql)
+
+
+# ── Runner ─────────────────────────────────────────────────────────────────
+
+def _ensure_version_table(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INTEGER
+        )
+    """)
+
+
+def get_applied_versions():
+    """{version: (name, applied_at, duration_ms)} for every applied migration."""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        _ensure_version_table(c)
+        conn.commit()
+        c.execute("SELECT version, name, applied_at, duration_ms FROM schema_version")
+        return {r[0]: (r[1], r[2], r[3]) for r in c.fetchall()}
+    finally:
+        conn.close()
+
+
+def migrate(target=None):
+    """Apply pending migrations up to target (default: latest), in order.
+    Returns the list of (version, name, duration_ms) applied in this run."""
+    applied_now = []
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        _ensure_version_table(c)
+        conn.commit()
+
+        if supports("advisory_locks"):
+            c.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        c.execute("SELECT version FROM schema_version")
+        applied = {r[0] for r in c.fetchall()}
+        conn.commit()
+
+        for version, name, sql in _migrations():
+            if version in applied or (target is not None and version > target):
+                continue
+            print(f"Applying migration {version}: {name}")
+            started = time.monotonic()
+            try:
+                _run_sql(c, sql)
+                duration_ms = int((time.monotonic() - started) * 1000)
+                c.execute(
+                    "INSERT INTO schema_version (version, name, duration_ms) VALUES (%s, %s, %s)",
+                    (version, name, duration_ms)
+                )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"Migration {version} failed: {e}")
+                raise
+            print(f"Migration {version} done in {duration_ms} ms")
+            applied_now.append((version, name, duration_ms))
+
+        if not applied_now:
+            print("Schema up to date")
+        return applied_now
+    finally:
+        try:
+            conn.rollback()
+            if supports("advisory_locks"):
+                conn.cursor().execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+                conn.commit()
+        finally:
+            conn.close()
+
+
+def isolate_tenant(client_id):
+    """Move one tenant's leads out of leads_shared into a dedicated LIST
+    partition, so a very busy tenant no longer shares pages, indexes or
+    vacuum work with everyone else. Takes a short exclusive lock on leads."""
+    if not supports("partitions"):
+        print(f"isolate-tenant needs PostgreSQL partitioning ({database.BACKEND.name} has none)")
+        return
+    client_id = int(client_id)
+    partition = f"leads_t{client_id}"
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        # INCLUDING ALL keeps search_vector a generated column — ATTACH requires it
+        c.execute(f"CREATE TABLE {partition} (LIKE leads INCLUDING ALL)")
+        c.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_name = 'leads' AND table_schema = current_schema() AND is_generated = 'NEVER' "
+            "ORDER BY ordinal_position"
+        )
+        columns = ", ".join(r[0] for r in c.fetchall())
+        # Generated columns are recomputed on insert, never copied
+        c.execute(f"INSERT INTO {partition} ({columns}) SELECT {columns} FROM leads_shared WHERE client_id = %s",
+                  (client_id,))
+        moved = c.rowcount
+        c.execute("DELETE FROM leads_shared WHERE client_id = %s", (client_id,))
+        c.execute(f"ALTER TABLE leads ATTACH PARTITION {partition} FOR VALUES IN (%s)", (client_id,))
+        conn.commit()
+        print(f"Tenant {client_id} isolated in {partition} ({moved} leads moved)")
+    except Exception as e:
+        conn.rollback()
+        print(f"isolate_tenant error: {e}")
+        raise
+    finally:
+        conn.close()
+
+
+def status():
+    applied = get_applied_versions()
+    for version, name, _ in _migrations():
+        if version in applied:
+            _, applied_at, duration_ms = applied[version]
+            print(f"  {version:>3}  applied  {applied_at:%Y-%m-%d %H:%M}  {duration_ms:>6} ms  {name}")
+        else:
+            print(f"  {version:>3}  pending  {'':16}  {'':>9}  {name}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tradie Agent schema migrations")
+    parser.add_argument("command", nargs="?", default="up", choices=["up", "status", "isolate-tenant"])
+    parser.add_argument("client_id", nargs="?", type=int, help="tenant for isolate-tenant")
+    parser.add_argument("--target", type=int, help="stop after this version")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        status()
+    elif args.command == "isolate-tenant":
+        if args.client_id is None:
+            parser.error("isolate-tenant needs a client_id")
+        try:
+            isolate_tenant(args.client_id)
+        except Exception:
+            sys.exit(1)
+    else:
+        try:
+            migrate(target=args.target)
+        except Exception:
+            sys.exit(1)
@@ -1,22 +1,26 @@
-import sys
-sys.stdout = sys.stderr
-
 import os
 import threading
 import time
 from datetime import datetime, timedelta
-from twilio.rest import Client as TwilioClient
+from clients import twilio_client
+from archive import maintain_messages
+from demo_sessions import create_demo_session, delete_demo_session, sweep_demo_sessions
+from event_sink import log_outbound_event
+from profiling import span
+from metrics import observe, set_gauge
+from logs import get_logger
 from database import (
     get_all_outbound_leads, get_leads_due_followup,
-    get_leads_no_answer_demo, update_outbound_lead, log_outbound_event,
-    create_demo_session, delete_demo_session,
-    activate_trial, get_trials_ending_soon, get_trial_day5_clients
+    get_leads_no_answer_demo, update_outbound_lead, delete_conversation,
+    activate_trial, get_trials_ending_soon, get_trial_day5_clients,
+    get_outbound_stats, refresh_outbound_funnel, get_outbound_funnel, FUNNEL_TEMPLATES
 )
 
-twilio = TwilioClient(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
 OUTBOUND_NUMBER = os.getenv("TWILIO_PHONE_NUMBER", "")
 BASE_URL = os.getenv("BASE_URL", "")
 
+log = get_logger("outbound")
+
 # ── SMS Templates ──────────────────────────────────────────────────────────
 
 SMS_INITIAL = (
@@ -102,11 +106,12 @@ SMS_TRIAL_EXPIRING = (
 
 def send_sms(to, body):
     try:
-        result = twilio.messages.create(body=body, from_=OUTBOUND_NUMBER, to=to)
-        print(f"SMS sent to {to}: {result.sid}")
+        with span("twilio"):
+            result = twilio_client().messages.create(body=body, from_=OUTBOUND_NUMBER, to=to)
+        log.info("sms_sent", to=to, sid=result.sid)
         return result.sid
     except Exception as e:
-        print(f"SMS error to {to}: {e}")
+        log.error("sms_error", to=to, error=e)
         return None
 
 
@@ -195,17 +200,9 @@ def _make_demo_call(lead):
     time.sleep(4)  # SMS arrives first
 
     # Clear any previous messages for this prospect phone
-    # so the demo agent starts fresh with no history
-    try:
-        import psycopg2
-        conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-        c = conn.cursor()
-        c.execute("DELETE FROM messages WHERE phone = %s", (lead["phone"],))
-        conn.commit()
-        conn.close()
-        print(f"Cleared history for {lead['phone']}")
-    except Exception as e:
-        print(f"Clear history error: {e}")
+    # so the demo agent starts fresh with no history (demo calls run as tenant 0)
+    delete_conversation(lead["phone"])
+    log.info("history_cleared", phone=lead["phone"])
 
     ws_url = (BASE_URL.replace("https://", "wss://") + "/demo-ws") if BASE_URL else "wss://tradie-agent.onrender.com/demo-ws"
     business_name = lead["business_name"]
@@ -222,15 +219,16 @@ def _make_demo_call(lead):
     )
 
     try:
-        call = twilio.calls.create(
-            to=lead["phone"],
-            from_=OUTBOUND_NUMBER,
-            twiml=f"""<Response><Connect>
-                <ConversationRelay url="{ws_url}" language="en-US" interruptible="true"
-                    hints="furnace,boiler,HVAC,heat pump,thermostat,hot water tank,no heat,frozen pipes"
-                    welcomeGreeting="{welcome}" />
-            </Connect></Response>"""
-        )
+        with span("twilio"):
+            call = twilio_client().calls.create(
+                to=lead["phone"],
+                from_=OUTBOUND_NUMBER,
+                twiml=f"""<Response><Connect>
+                    <ConversationRelay url="{ws_url}" language="en-US" interruptible="true"
+                        hints="furnace,boiler,HVAC,heat pump,thermostat,hot water tank,no heat,frozen pipes"
+                        welcomeGreeting="{welcome}" />
+                </Connect></Response>"""
+            )
         update_outbound_lead(
             lead["phone"],
             demo_called=True,
@@ -238,7 +236,7 @@ def _make_demo_call(lead):
             status="demo_called"
         )
         log_outbound_event(lead["phone"], "demo_called", f"SID: {call.sid}")
-        print(f"Demo call to {business_name} ({lead['phone']}): {call.sid}")
+        log.info("demo_call_placed", business=business_name, phone=lead["phone"], sid=call.sid)
 
         # Wait for call to complete then send after-demo SMS
         time.sleep(180)  # Wait 3 min
@@ -246,7 +244,7 @@ def _make_demo_call(lead):
         _send_after_demo_sms(lead)
 
     except Exception as e:
-        print(f"Demo call error: {e}")
+        log.error("demo_call_error", error=e)
         update_outbound_lead(lead["phone"], status="responded")
 
 
@@ -291,19 +289,20 @@ def send_batch(limit=20):
             sent += 1
             time.sleep(1)  # 1 second between sends — avoid carrier spam flags
 
-    print(f"Batch sent: {sent}/{len(pending)}")
+    log.info("batch_sent", sent=sent, pending=len(pending))
     return sent
 
 
 def process_followups():
     """Send follow-up SMS to leads due for one."""
     due = get_leads_due_followup()
+    set_gauge("tradie_scheduler_followups_due", len(due))
     processed = 0
     for lead in due:
         if send_followup(lead):
             processed += 1
             time.sleep(1)
-    print(f"Follow-ups processed: {processed}")
+    log.info("followups_processed", processed=processed)
     return processed
 
 
@@ -337,7 +336,7 @@ def activate_client_trial(client_id):
         twilio_number=result["twilio_number"]
     )
     send_sms(result["owner_phone"], msg)
-    print(f"Trial activated: {result['business_name']} → {dashboard_url}")
+    log.info("trial_activated", business=result["business_name"], client_id=client_id)
     return True
 
 
@@ -356,7 +355,7 @@ def process_trial_reminders():
             dashboard_url=dashboard_url
         )
         send_sms(c["owner_phone"], msg)
-        print(f"Day 5 reminder sent: {c['business_name']}")
+        log.info("trial_day5_sent", business=c["business_name"])
 
     # Expiry SMS
     expiring = get_trials_ending_soon(days=1)
@@ -368,12 +367,59 @@ def process_trial_reminders():
             stripe_link=stripe_link
         )
         send_sms(c["owner_phone"], msg)
-        print(f"Expiry SMS sent: {c['business_name']}")
+        log.info("trial_expiry_sent", business=c["business_name"])
 
     return len(day5_clients) + len(expiring)
 
 
-# ── Scheduler ─────────────────────────────────────────────────────────────
+# ── Funnel stats ──────────────────────────────────────────────────────────
+
+# Funnel stage → event type that counts for it. Every contacted prospect gets
+# sms_initial first, so it alone counts "sent" — adding the follow-ups would
+# count a prospect once per SMS. Grouped by template, each template's own
+# sends are its "sent" instead.
+FUNNEL_STAGES = {
+    "sent":       ("sms_initial",),
+    "yes":        ("responded_yes",),
+    "demo":       ("demo_called",),
+    "answered":   ("demo_answered",),
+    "trial":      ("trial_activated",),
+}
+
+
+def _rate(num, den):
+    return round(num / den, 4) if den else None
+
+
+def get_funnel_report(group_by="template", days=30):
+    """Conversion funnel per template, city, cohort week or day, in distinct
+    prospects per stage. Reads the rollup the scheduler tick refreshes."""
+    stages = dict(FUNNEL_STAGES, sent=FUNNEL_TEMPLATES) if group_by == "template" else FUNNEL_STAGES
+    groups = {}
+    for row in get_outbound_funnel(group_by=group_by, days=days):
+        counts = groups.setdefault(row["group"], dict.fromkeys(stages, 0))
+        for stage, event_types in stages.items():
+            if row["event_type"] in event_types:
+                counts[stage] += row["prospects"]
+
+    rows = []
+    for key, s in sorted(groups.items()):
+        rows.append({
+            group_by: key,
+            **s,
+            "reply_rate": _rate(s["yes"], s["sent"]),
+            "demo_rate":  _rate(s["demo"], s["yes"]),
+            "answer_rate": _rate(s["answered"], s["demo"]),
+            "trial_rate": _rate(s["trial"], s["demo"]),
+        })
+
+    return {
+        "group_by": group_by,
+        "days": days,
+        "live": get_outbound_stats(),
+        "rows": rows
+    }
+
 
 # ── Scheduler ─────────────────────────────────────────────────────────────
 
@@ -381,15 +427,20 @@ def start_scheduler():
     """Background scheduler — runs every 30 minutes."""
     def _run():
         while True:
+            started = time.monotonic()
             try:
-                print("Scheduler tick — processing follow-ups and trials")
+                log.info("scheduler_tick")
                 process_followups()
                 retry_no_answers()
                 process_trial_reminders()
+                refresh_outbound_funnel()
+                maintain_messages()
+                sweep_demo_sessions()
             except Exception as e:
-                print(f"Scheduler error: {e}")
+                log.exception("scheduler_error", error=e)
+            observe("tradie_scheduler_tick_seconds", time.monotonic() - started)
             time.sleep(1800)  # 30 minutes
 
     t = threading.Thread(target=_run, daemon=True)
     t.start()
-    print("Outbound scheduler started")
\ No newline at end of file
+    log.info("scheduler_started")
\ No newline at end of file
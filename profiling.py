@@ -0,0 +1,388 @@
+"""
+Per-request profiling for the Flask app.
+
+For every request: route, wall time, time in DB calls (connect, execute,
+fetch, commit), DB connections and queries, and time in OpenAI and Twilio.
+Results go into per-route histograms over a rolling window. Requests slower
+than PROFILE_SLOW_MS are kept as snapshots with stack samples taken while
+they were still running, plus a cProfile dump for the sampled fraction of
+requests that ran under the profiler.
+
+app.py calls install(app) at import and start_sampler() in create_app(), and
+serves the report at /admin/profile.
+database.get_db() passes every connection through track_db(); calls to
+OpenAI and Twilio are wrapped in `with span("openai"):` / `span("twilio")`,
+which also feeds the external-call metrics. Outside a request (scheduler,
+websockets) only those metrics are recorded.
+"""
+import sys
+import os
+import io
+import time
+import random
+import pstats
+import cProfile
+import itertools
+import threading
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+import metrics
+from logs import get_logger
+
+log = get_logger("profiling")
+
+PROFILING = os.getenv("PROFILING", "1") == "1"
+# Requests at least this slow are kept as snapshots
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "2000"))
+# Fraction of requests run under cProfile (one at a time)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_WINDOW_MINUTES = int(os.getenv("PROFILE_WINDOW_MINUTES", "15"))
+# While a request is past PROFILE_SLOW_MS its stack is sampled this often
+PROFILE_STACK_INTERVAL = 0.5
+PROFILE_MAX_STACKS = 40
+
+# Long-lived connections — their wall time is call or stream length, not latency
+PROFILE_EXCLUDE = {"/voice-ws", "/demo-ws", "/api/leads/stream", "/metrics"}
+
+# Histogram bucket upper bounds, ms
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+SPANS = ("openai", "twilio")
+
+_current = ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    __slots__ = ("route", "method", "path", "status", "started", "started_at", "thread_id",
+                 "db_ms", "db_queries", "db_connections", "spans", "stacks", "profiler")
+
+    def __init__(self, method, path):
+        self.route = None
+        self.method = method
+        self.path = path
+        self.status = None
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        self.thread_id = threading.get_ident()
+        self.db_ms = 0.0
+        self.db_queries = 0
+        self.db_connections = 0
+        self.spans = dict.fromkeys(SPANS, 0.0)
+        self.stacks = []  # [stack text, times seen]
+        self.profiler = None
+
+
+# ── DB tracking ────────────────────────────────────────────────────────────
+
+class _TimedCursor:
+    def __init__(self, cursor, profile):
+        self._cursor, self._profile = cursor, profile
+
+    def _timed(self, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._profile.db_ms += (time.perf_counter() - started) * 1000
+
+    def execute(self, *args, **kwargs):
+        self._profile.db_queries += 1
+        return self._timed(self._cursor.execute, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._profile.db_queries += 1
+        return self._timed(self._cursor.executemany, *args, **kwargs)
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._timed(self._cursor.fetchmany, *args, **kwargs)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _TimedConnection:
+    def __init__(self, conn, profile):
+        self._conn, self._profile = conn, profile
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self._conn.cursor(*args, **kwargs), self._profile)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return self._conn.commit()
+        finally:
+            self._profile.db_ms += (time.perf_counter() - started) * 1000
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def track_db(conn, connect_started):
+    """Attribute a new connection (and the time it took to get it) to the
+    current request. Returns conn itself outside a profiled request."""
+    profile = _current.get()
+    if profile is None:
+        return conn
+    profile.db_connections += 1
+    profile.db_ms += (time.perf_counter() - connect_started) * 1000
+    return _TimedConnection(conn, profile)
+
+
+@contextmanager
+def span(name):
+    """Time one external call against the current request and the
+    tradie_external_* metrics — `name` is one of SPANS."""
+    profile = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.inc("tradie_external_errors_total", service=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.inc("tradie_external_requests_total", service=name)
+        metrics.observe("tradie_external_request_seconds", elapsed, service=name)
+        if profile is not None:
+            profile.spans[name] += elapsed * 1000
+
+
+# ── Rolling histograms ─────────────────────────────────────────────────────
+
+class _RouteStats:
+    __slots__ = ("count", "buckets", "wall_ms", "max_ms", "db_ms", "db_queries",
+                 "db_connections", "spans")
+
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.wall_ms = self.max_ms = self.db_ms = 0.0
+        self.db_queries = self.db_connections = 0
+        self.spans = dict.fromkeys(SPANS, 0.0)
+
+    def add(self, wall_ms, profile):
+        self.count += 1
+        self.buckets[next(i for i, b in enumerate(BUCKETS_MS) if wall_ms <= b)] += 1
+        self.wall_ms += wall_ms
+        self.max_ms = max(self.max_ms, wall_ms)
+        self.db_ms += profile.db_ms
+        self.db_queries += profile.db_queries
+        self.db_connections += profile.db_connections
+        for name, ms in profile.spans.items():
+            self.spans[name] += ms
+
+    def merge(self, other):
+        self.count += other.count
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.wall_ms += other.wall_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.db_ms += other.db_ms
+        self.db_queries += other.db_queries
+        self.db_connections += other.db_connections
+        for name, ms in other.spans.items():
+            self.spans[name] += ms
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile."""
+        rank, seen = p / 100 * self.count, 0
+        for bound, n in zip(BUCKETS_MS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound if bound != float("inf") else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def report(self):
+        n = self.count or 1
+        return {
+            "requests": self.count,
+            "p50_ms": self.percentile(50), "p95_ms": self.percentile(95), "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 1),
+            "avg_ms": round(self.wall_ms / n, 1),
+            "avg_db_ms": round(self.db_ms / n, 1),
+            "avg_db_queries": round(self.db_queries / n, 2),
+            "avg_db_connections": round(self.db_connections / n, 2),
+            **{f"avg_{name}_ms": round(ms / n, 1) for name, ms in self.spans.items()},
+            "histogram": {("+Inf" if b == float("inf") else str(b)): c
+                          for b, c in zip(BUCKETS_MS, self.buckets)},
+        }
+
+
+_minutes = {}  # minute number → {route: _RouteStats}
+_stats_lock = threading.Lock()
+
+_slow = deque(maxlen=PROFILE_KEEP)
+_slow_ids = itertools.count(1)
+
+_in_flight = {}  # id(profile) → profile, for the stack sampler
+_profiler_lock = threading.Lock()  # cProfile allows one active profiler per process
+_sampler = None
+
+
+def _record(profile, wall_ms):
+    minute = int(time.time() // 60)
+    with _stats_lock:
+        routes = _minutes.get(minute)
+        if routes is None:
+            routes = _minutes[minute] = {}
+            for old in [m for m in _minutes if m <= minute - PROFILE_WINDOW_MINUTES]:
+                del _minutes[old]
+        stats = routes.get(profile.route)
+        if stats is None:
+            stats = routes[profile.route] = _RouteStats()
+        stats.add(wall_ms, profile)
+
+
+def report():
+    """Per-route stats over the last PROFILE_WINDOW_MINUTES."""
+    cutoff = int(time.time() // 60) - PROFILE_WINDOW_MINUTES
+    merged = {}
+    with _stats_lock:
+        for minute, routes in _minutes.items():
+            if minute <= cutoff:
+                continue
+            for route, stats in routes.items():
+                merged.setdefault(route, _RouteStats()).merge(stats)
+    return {
+        "window_minutes": PROFILE_WINDOW_MINUTES,
+        "slow_ms": PROFILE_SLOW_MS,
+        "routes": {route: stats.report() for route, stats in sorted(merged.items())},
+    }
+
+
+# ── Slow requests ──────────────────────────────────────────────────────────
+
+def slow_requests():
+    """Summaries of the kept slow-request snapshots, newest first."""
+    return [{k: v for k, v in s.items() if k not in ("stacks", "profile")} for s in reversed(_slow)]
+
+
+def slow_request(snapshot_id):
+    """One snapshot with its stack samples and cProfile output, or None."""
+    return next((s for s in _slow if s["id"] == snapshot_id), None)
+
+
+def _keep_snapshot(profile, wall_ms):
+    profile_text = None
+    if profile.profiler is not None:
+        out = io.StringIO()
+        pstats.Stats(profile.profiler, stream=out).sort_stats("cumulative").print_stats(40)
+        profile_text = out.getvalue()
+    _slow.append({
+        "id": next(_slow_ids),
+        "route": profile.route,
+        "method": profile.method,
+        "path": profile.path,  # no query string — it can carry tokens
+        "status": profile.status,
+        "started_at": profile.started_at.isoformat(),
+        "wall_ms": round(wall_ms, 1),
+        "db_ms": round(profile.db_ms, 1),
+        "db_queries": profile.db_queries,
+        "db_connections": profile.db_connections,
+        **{f"{name}_ms": round(ms, 1) for name, ms in profile.spans.items()},
+        "stacks": [{"count": n, "stack": text} for text, n in profile.stacks],
+        "profile": profile_text,
+    })
+    log.warning("slow_request", method=profile.method, path=profile.path, wall_ms=round(wall_ms),
+                db_ms=round(profile.db_ms), db_queries=profile.db_queries,
+                openai_ms=round(profile.spans["openai"]), twilio_ms=round(profile.spans["twilio"]))
+
+
+def _sample_stacks():
+    """Record where every request past the slow threshold currently is."""
+    while True:
+        time.sleep(PROFILE_STACK_INTERVAL)
+        try:
+            now = time.perf_counter()
+            frames = None
+            for profile in list(_in_flight.values()):
+                if (now - profile.started) * 1000 < PROFILE_SLOW_MS or len(profile.stacks) >= PROFILE_MAX_STACKS:
+                    continue
+                if frames is None:
+                    frames = sys._current_frames()
+                frame = frames.get(profile.thread_id)
+                if frame is None:
+                    continue
+                text = "".join(traceback.format_stack(frame))
+                if profile.stacks and profile.stacks[-1][0] == text:
+                    profile.stacks[-1][1] += 1
+                else:
+                    profile.stacks.append([text, 1])
+            del frames
+        except Exception as e:
+            log.error("stack_sampler_error", error=e)
+
+
+# ── Flask hooks ────────────────────────────────────────────────────────────
+
+def install(app):
+    """Register the request hooks. Slow requests only get stack samples once
+    start_sampler() has run."""
+    if not PROFILING:
+        return
+    from flask import request, g
+
+    @app.before_request
+    def _start_profile():
+        if request.path in PROFILE_EXCLUDE or request.path.startswith("/admin/"):
+            return
+        profile = RequestProfile(request.method, request.path)
+        profile.route = f"{request.method} {request.url_rule.rule if request.url_rule else 'unmatched'}"
+        if random.random() < PROFILE_SAMPLE_RATE and _profiler_lock.acquire(blocking=False):
+            profile.profiler = cProfile.Profile()
+            try:
+                profile.profiler.enable()
+            except ValueError:  # another profiler (a debugger, say) is active
+                profile.profiler = None
+                _profiler_lock.release()
+        g.profile_token = _current.set(profile)
+        _in_flight[id(profile)] = profile
+
+    @app.after_request
+    def _profile_status(response):
+        profile = _current.get()
+        if profile is not None:
+            profile.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_profile(exc):
+        token = g.pop("profile_token", None)
+        profile = _current.get()
+        if token is None or profile is None:
+            return
+        wall_ms = (time.perf_counter() - profile.started) * 1000
+        _in_flight.pop(id(profile), None)
+        if profile.profiler is not None:
+            profile.profiler.disable()
+            _profiler_lock.release()
+        if exc is not None and profile.status is None:
+            profile.status = 500
+        try:
+            _current.reset(token)
+        except ValueError:
+            pass
+        _record(profile, wall_ms)
+        if wall_ms >= PROFILE_SLOW_MS:
+            _keep_snapshot(profile, wall_ms)
+
+
+def start_sampler():
+    global _sampler
+    if PROFILING and _sampler is None:
+        _sampler = threading.Thread(target=_sample_stacks, daemon=True)
+        _sampler.start()
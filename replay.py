@@ -0,0 +1,497 @@
+"""
+Deterministic replay of recorded conversations, for catching prompt and code
+changes that make calls slower or longer before they ship.
+
+    python replay.py record --client 42 --limit 50            # messages → replay_fixtures/
+    python replay.py run --json head.json                     # replay against this tree
+    python replay.py compare main HEAD                        # replay two revisions, diff them
+    python replay.py compare main .                           # … or main vs the working tree
+
+record exports conversations from the hot messages table into one JSON
+fixture per caller: the caller's turns, the assistant reply recorded for
+each, and the lead saved for that caller (if any). Phone numbers in the text
+are masked; names and addresses are not, so fixtures stay out of git.
+
+run replays every fixture turn by turn — voice fixtures through
+handle_conversation_relay on a scripted socket, SMS fixtures through
+get_agent_response — against a throwaway SQLite database and an LLM stub
+that answers with the recorded replies (and the recorded lead for the
+post-call extractor). Nothing leaves the machine. Per turn it measures:
+
+  latency_ms      prompt → last text frame (voice) / reply returned (SMS)
+  prompt_tokens   tokens sent to the LLM, estimated as characters / 4
+  db_round_trips  statements executed plus commits
+
+and per conversation the turns played and the number of turns to lead
+capture (voice only — SMS conversations never save a lead). Each fixture is
+replayed --repeat times and the fastest run of each turn is kept.
+
+compare checks both revisions out into temporary git worktrees, runs them
+with this file's harness, and exits 1 if the second regresses past the
+thresholds. Revisions need the embedded SQLite backend (storage.py).
+"""
+import sys
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = "replay_fixtures"
+
+# Regression thresholds for compare — relative, with an absolute floor on
+# latency so sub-millisecond noise never fails a build
+LATENCY_REGRESSION   = 0.25
+LATENCY_FLOOR_MS     = 2.0
+TOKENS_REGRESSION    = 0.05
+
+PHONE_RE = re.compile(r"\+?\d[\d\s().-]{7,}\d")
+
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+
+# ── Record ─────────────────────────────────────────────────────────────────
+
+def _pair_turns(history):
+    """[{role, content}] → [{"user", "assistant"}]; consecutive caller
+    messages are merged into one turn."""
+    turns = []
+    for m in history:
+        if m["role"] == "user":
+            if turns and not turns[-1]["assistant"]:
+                turns[-1]["user"] += " " + m["content"]
+            else:
+                turns.append({"user": m["content"], "assistant": ""})
+        elif m["role"] == "assistant" and turns and not turns[-1]["assistant"]:
+            turns[-1]["assistant"] = m["content"]
+    return turns
+
+
+def record(client_id, out_dir, limit=50, since=None, channel="sms"):
+    """Write up to `limit` of the tenant's most recent conversations to
+    out_dir. channel is used for callers with no lead to take it from."""
+    from database import get_db, get_conversation, get_lead_by_phone, tenant_key
+
+    where  = "m.client_id = %(client_id)s" + (" AND m.created_at >= %(since)s" if since else "")
+    params = {"client_id": tenant_key(client_id), "since": since, "limit": limit}
+    conn = get_db(readonly=True)
+    try:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT m.phone, l.channel FROM messages m
+            LEFT JOIN leads l ON l.client_id = m.client_id AND l.phone = m.phone
+            WHERE {where}
+            GROUP BY m.phone, l.channel ORDER BY MAX(m.created_at) DESC LIMIT %(limit)s
+        """, params)
+        callers = c.fetchall()
+        c.execute("SELECT business_name, owner_name, province FROM clients WHERE id = %s", (client_id,))
+        row = c.fetchone()
+    finally:
+        conn.close()
+
+    client = {"business_name": row[0], "owner_name": row[1], "province": row[2]} if row else {
+        "business_name": os.getenv("BUSINESS_NAME", "Mike's Emergency Plumbing"),
+        "owner_name": os.getenv("BUSINESS_OWNER", "Mike"), "province": "ON"}
+
+    os.makedirs(out_dir, exist_ok=True)
+    written = 0
+    for n, (phone, lead_channel) in enumerate(callers, 1):
+        turns = _pair_turns(get_conversation(phone, client_id=client_id))
+        if not turns:
+            continue
+        for t in turns:
+            t["user"] = PHONE_RE.sub("555-0100", t["user"])
+            t["assistant"] = PHONE_RE.sub("555-0100", t["assistant"])
+        lead = get_lead_by_phone(phone, client_id=client_id)
+        fixture = {
+            "id": f"c{tenant_key(client_id)}-{n:04d}",
+            "channel": lead_channel or channel,
+            "client": client,
+            "turns": turns,
+            "lead": {k: lead[k] for k in ("name", "address", "problem", "urgent")} if lead else None,
+        }
+        with open(os.path.join(out_dir, fixture["id"] + ".json"), "w") as f:
+            json.dump(fixture, f, indent=2)
+        written += 1
+    print(f"Recorded {written} conversations to {out_dir}")
+    return written
+
+
+# ── Instrumentation ────────────────────────────────────────────────────────
+
+class Counter:
+    def __init__(self):
+        self.db = 0
+        self.tokens = 0
+        self.connections = 0
+
+
+class CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor, self._counter = cursor, counter
+
+    def execute(self, *args, **kwargs):
+        self._counter.db += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._counter.db += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    def __init__(self, conn, counter):
+        self._conn, self._counter = conn, counter
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._counter)
+
+    def commit(self):
+        self._counter.db += 1
+        return self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class RecordedLLM:
+    """Stands in for openai_client: agent calls get the next recorded reply
+    (streamed word by word when asked to stream), the post-call extractor
+    gets the recorded lead."""
+
+    def __init__(self, counter, extractor_prompt):
+        self.counter = counter
+        self.extractor_prompt = extractor_prompt
+        self.replies = []
+        self.lead = None
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def __call__(self):
+        # Revisions that fetch the client through clients.openai_client() call it
+        return self
+
+    def with_options(self, **options):
+        return self
+
+    def load(self, fixture):
+        self.replies = [t["assistant"] for t in fixture["turns"]]
+        self.lead = fixture["lead"]
+
+    def create(self, messages, stream=False, **kwargs):
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+        self.counter.tokens += prompt_tokens
+        if messages and messages[0].get("content") == self.extractor_prompt:
+            lead = self.lead or {}
+            reply = json.dumps({**lead, "phone": None, "lead_captured":
+                                bool(lead.get("name") and lead.get("address") and lead.get("problem"))})
+        else:
+            reply = self.replies.pop(0) if self.replies else ""
+        completion_tokens = estimate_tokens(reply)
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                total_tokens=prompt_tokens + completion_tokens)
+        if not stream:
+            return SimpleNamespace(usage=usage, choices=[
+                SimpleNamespace(message=SimpleNamespace(role="assistant", content=reply))])
+        words = reply.split(" ")
+        chunks = [SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=w))])
+                  for w in words[:1] + [" " + w for w in words[1:]]]
+        return iter(chunks + [SimpleNamespace(usage=usage, choices=[])])
+
+
+class ReplaySocket:
+    """Scripted ConversationRelay socket: hands out setup, one prompt per
+    recorded turn, then end, and times each reply."""
+
+    def __init__(self, caller_phone, turns, counter):
+        self.counter = counter
+        self.events = [{"type": "setup", "from": caller_phone, "callSid": "CAreplay"}]
+        self.events += [{"type": "prompt", "voicePrompt": t["user"], "last": True} for t in turns]
+        self.events.append({"type": "end", "reason": "hangup"})
+        self.turns = []       # per played prompt: {latency_ms, prompt_tokens, db_round_trips}
+        self.post_call = None  # {"db_round_trips"} from the end event on
+        self._open = None
+
+    def _close_turn(self):
+        if self._open:
+            turn, db0, tok0 = self._open
+            turn["db_round_trips"] = self.counter.db - db0
+            turn["prompt_tokens"] = self.counter.tokens - tok0
+            self.turns.append(turn)
+            self._open = None
+
+    def receive(self, timeout=None):
+        self._close_turn()
+        if not self.events:
+            return None
+        event = self.events.pop(0)
+        if event["type"] == "prompt":
+            self._open = ({"latency_ms": None, "_start": time.perf_counter()},
+                          self.counter.db, self.counter.tokens)
+        elif event["type"] == "end":
+            self.post_call = {"_db": self.counter.db}
+        return json.dumps(event)
+
+    def send(self, raw):
+        frame = json.loads(raw)
+        if frame.get("type") == "text" and frame.get("last") and self._open:
+            turn = self._open[0]
+            turn["latency_ms"] = (time.perf_counter() - turn.pop("_start")) * 1000
+        elif frame.get("type") == "end":
+            # The agent hung up: what follows is post-call work
+            self._close_turn()
+            self.post_call = {"_db": self.counter.db}
+            self.events = [e for e in self.events if e["type"] != "prompt"]
+
+    def finish(self):
+        """Close the last turn and the post-call window once the handler returns."""
+        self._close_turn()
+        db0 = self.post_call["_db"] if self.post_call else self.counter.db
+        self.post_call = {"db_round_trips": self.counter.db - db0}
+
+
+# ── Run ────────────────────────────────────────────────────────────────────
+
+def _prepare_env(src, workdir):
+    """Point the revision under test at a fresh SQLite database and migrate it."""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'replay.db')}",
+        "DATABASE_REPLICA_URL": "",
+        "OPENAI_API_KEY": "sk-replay",
+        "TWILIO_ACCOUNT_SID": "AC" + "0" * 32,
+        "TWILIO_AUTH_TOKEN": "replay",
+        "LLM_DAILY_TOKEN_BUDGET": "1000000000",
+    })
+    subprocess.run([sys.executable, os.path.join(src, "migrations.py")], cwd=workdir,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    sys.path.insert(0, src)
+
+
+def _replay_voice(fixture, phone, counter):
+    import voice_agent
+    from database import get_lead_by_phone
+
+    client = {"id": None, "twilio_number": "+15550000000", "owner_phone": "+15550000001",
+              "plan": "replay", "active": True, **fixture["client"]}
+    ws = ReplaySocket(phone, fixture["turns"], counter)
+    voice_agent.handle_conversation_relay(ws, phone, client)
+    ws.finish()
+    captured = get_lead_by_phone(phone) is not None
+    return {
+        "turns": [{k: v for k, v in t.items() if not k.startswith("_")} for t in ws.turns],
+        "post_call_db_round_trips": ws.post_call["db_round_trips"],
+        "lead_captured": captured,
+        "turns_to_lead": len(ws.turns) if captured else None,
+    }
+
+
+def _replay_sms(fixture, phone, counter):
+    import agent_sms
+
+    turns = []
+    for t in fixture["turns"]:
+        db0, tok0, start = counter.db, counter.tokens, time.perf_counter()
+        agent_sms.get_agent_response(phone, t["user"], client_id=None)
+        turns.append({"latency_ms": (time.perf_counter() - start) * 1000,
+                      "prompt_tokens": counter.tokens - tok0, "db_round_trips": counter.db - db0})
+    return {"turns": turns, "post_call_db_round_trips": 0,
+            "lead_captured": False, "turns_to_lead": None}
+
+
+def run(fixture_dir, src=ROOT, repeat=3):
+    """Replay every fixture in fixture_dir with the code in src. Returns
+    {"conversations": [...], "summary": {...}}."""
+    fixtures = []
+    for name in sorted(os.listdir(fixture_dir)):
+        if name.endswith(".json"):
+            with open(os.path.join(fixture_dir, name)) as f:
+                fixtures.append(json.load(f))
+    if not fixtures:
+        raise SystemExit(f"No fixtures in {fixture_dir} — run `python replay.py record` first")
+
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    try:
+        _prepare_env(src, workdir)
+        import database
+        import voice_agent
+        import agent_sms
+
+        counter = Counter()
+        real_get_db = database.get_db
+
+        def counting_get_db(*args, **kwargs):
+            return CountingConnection(real_get_db(*args, **kwargs), counter)
+        database.get_db = counting_get_db
+
+        llm = RecordedLLM(counter, voice_agent.build_extractor_prompt())
+        # Older revisions call the client from the agents, newer ones from llm.py
+        for module in (voice_agent, agent_sms, sys.modules.get("llm")):
+            if hasattr(module, "openai_client"):
+                module.openai_client = llm
+        # Owner SMS would go to Twilio — count it instead
+        notified = []
+        voice_agent._notify_owner = lambda lead, phone, client: notified.append(phone)
+
+        conversations = []
+        for i, fixture in enumerate(fixtures):
+            best = None
+            for r in range(repeat):
+                llm.load(fixture)
+                phone = f"+1555{r}{i:06d}"
+                replay = _replay_voice if fixture["channel"] == "voice" else _replay_sms
+                result = replay(fixture, phone, counter)
+                if best is None:
+                    best = result
+                else:
+                    # Keep the fastest run of each turn; the counts are deterministic
+                    for b, t in zip(best["turns"], result["turns"]):
+                        if t["latency_ms"] is not None and (b["latency_ms"] is None
+                                                             or t["latency_ms"] < b["latency_ms"]):
+                            b["latency_ms"] = t["latency_ms"]
+            for t in best["turns"]:
+                if t["latency_ms"] is not None:
+                    t["latency_ms"] = round(t["latency_ms"], 3)
+            conversations.append({"id": fixture["id"], "channel": fixture["channel"],
+                                  "turns_played": len(best["turns"]), **best})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"conversations": conversations, "summary": summarize(conversations)}
+
+
+def summarize(conversations):
+    turns = [t for c in conversations for t in c["turns"]]
+    latencies = sorted(t["latency_ms"] for t in turns if t["latency_ms"] is not None)
+    leads = [c["turns_to_lead"] for c in conversations if c["turns_to_lead"] is not None]
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] if latencies else None
+    return {
+        "conversations": len(conversations),
+        "turns": len(turns),
+        "latency_p50_ms": pct(50),
+        "latency_p90_ms": pct(90),
+        "prompt_tokens": sum(t["prompt_tokens"] for t in turns),
+        "prompt_tokens_per_turn": round(sum(t["prompt_tokens"] for t in turns) / len(turns), 1) if turns else 0,
+        "db_round_trips_per_turn": round(sum(t["db_round_trips"] for t in turns) / len(turns), 2) if turns else 0,
+        "post_call_db_round_trips": sum(c["post_call_db_round_trips"] for c in conversations),
+        "leads_captured": len(leads),
+        "avg_turns_to_lead": round(sum(leads) / len(leads), 2) if leads else None,
+    }
+
+
+# ── Compare ────────────────────────────────────────────────────────────────
+
+def regressions(base, head):
+    """Human-readable list of the ways head's summary is worse than base's."""
+    found = []
+    b, h = base["summary"], head["summary"]
+    if b["latency_p50_ms"] is not None and h["latency_p50_ms"] is not None:
+        if (h["latency_p50_ms"] > b["latency_p50_ms"] * (1 + LATENCY_REGRESSION)
+                and h["latency_p50_ms"] - b["latency_p50_ms"] > LATENCY_FLOOR_MS):
+            found.append(f"turn latency p50 {b['latency_p50_ms']:.1f} → {h['latency_p50_ms']:.1f} ms")
+    if h["prompt_tokens"] > b["prompt_tokens"] * (1 + TOKENS_REGRESSION):
+        found.append(f"prompt tokens {b['prompt_tokens']} → {h['prompt_tokens']}")
+    if h["db_round_trips_per_turn"] > b["db_round_trips_per_turn"]:
+        found.append(f"DB round trips per turn {b['db_round_trips_per_turn']} → {h['db_round_trips_per_turn']}")
+    if h["post_call_db_round_trips"] > b["post_call_db_round_trips"]:
+        found.append(f"post-call DB round trips {b['post_call_db_round_trips']} → {h['post_call_db_round_trips']}")
+    if h["leads_captured"] < b["leads_captured"]:
+        found.append(f"leads captured {b['leads_captured']} → {h['leads_captured']}")
+    if (b["avg_turns_to_lead"] is not None and h["avg_turns_to_lead"] is not None
+            and h["avg_turns_to_lead"] > b["avg_turns_to_lead"]):
+        found.append(f"turns to lead {b['avg_turns_to_lead']} → {h['avg_turns_to_lead']}")
+
+    base_turns = {c["id"]: c["turns_played"] for c in base["conversations"]}
+    for c in head["conversations"]:
+        if c["turns_played"] > base_turns.get(c["id"], c["turns_played"]):
+            found.append(f"{c['id']}: {base_turns[c['id']]} → {c['turns_played']} turns")
+    return found
+
+
+def _run_revision(rev, fixture_dir, repeat, out_path):
+    """Replay one revision in a subprocess; "." is the working tree."""
+    worktree = None
+    src = ROOT
+    if rev != ".":
+        worktree = tempfile.mkdtemp(prefix="replay-" + re.sub(r"[^\w.-]", "_", rev) + "-")
+        subprocess.run(["git", "-C", ROOT, "worktree", "add", "--detach", worktree, rev],
+                       check=True, stdout=subprocess.DEVNULL)
+        src = worktree
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "run", "--src", src,
+                        "--fixtures", os.path.abspath(fixture_dir), "--repeat", str(repeat),
+                        "--json", out_path], check=True, stdout=sys.stderr)
+        with open(out_path) as f:
+            return json.load(f)
+    finally:
+        if worktree:
+            subprocess.run(["git", "-C", ROOT, "worktree", "remove", "--force", worktree],
+                           stdout=subprocess.DEVNULL)
+
+
+def print_summary(label, summary, out):
+    out.write(f"{label}\n")
+    for k, v in summary.items():
+        out.write(f"  {k:26} {v}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded conversations deterministically.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("record", help="export conversations from messages into fixtures")
+    p.add_argument("--client", type=int, default=0, help="client id (0 = default client)")
+    p.add_argument("--limit", type=int, default=50)
+    p.add_argument("--since", help="only callers active since this ISO date")
+    p.add_argument("--channel", choices=["sms", "voice"], default="sms",
+                   help="channel for callers without a lead (default sms)")
+    p.add_argument("--out", default=FIXTURE_DIR)
+
+    p = sub.add_parser("run", help="replay the fixtures against one source tree")
+    p.add_argument("--fixtures", default=FIXTURE_DIR)
+    p.add_argument("--src", default=ROOT, help="source tree to replay (default: this one)")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--json", help="write the full results here")
+
+    p = sub.add_parser("compare", help="replay two git revisions and fail on regressions")
+    p.add_argument("base")
+    p.add_argument("head", nargs="?", default=".", help='revision, or "." for the working tree')
+    p.add_argument("--fixtures", default=FIXTURE_DIR)
+    p.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.client or None, args.out, args.limit, args.since, args.channel)
+
+    elif args.command == "run":
+        results = run(args.fixtures, os.path.abspath(args.src), args.repeat)
+        print_summary(os.path.abspath(args.src), results["summary"], sys.stdout)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+
+    else:
+        tmp = tempfile.mkdtemp(prefix="replay-compare-")
+        try:
+            base = _run_revision(args.base, args.fixtures, args.repeat, os.path.join(tmp, "base.json"))
+            head = _run_revision(args.head, args.fixtures, args.repeat, os.path.join(tmp, "head.json"))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        print_summary(f"base: {args.base}", base["summary"], sys.stdout)
+        print_summary(f"head: {args.head}", head["summary"], sys.stdout)
+        found = regressions(base, head)
+        for r in found:
+            print(f"REGRESSION  {r}")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,32 @@
+"""
+Cold-start phase timings.
+
+app.py imports this module first and calls mark() at the end of each
+startup phase; each phase runs from the previous mark (or from this import)
+to its own. The report is logged as startup_complete once the app is ready,
+and is included in /admin/profile.
+
+    mark("imports")   # → imports: time since app.py started importing
+    mark("warm_up")   # → warm_up: time since the "imports" mark
+"""
+import time
+
+_started = time.perf_counter()
+_last    = _started
+_phases  = []   # (name, seconds) in order
+
+
+def mark(name):
+    """End the phase called name (it started at the previous mark)."""
+    global _last
+    now = time.perf_counter()
+    _phases.append((name, now - _last))
+    _last = now
+
+
+def report():
+    """{phases: [{phase, ms}], total_ms} — total from this import to the last mark."""
+    return {
+        "phases": [{"phase": name, "ms": round(seconds * 1000, 1)} for name, seconds in _phases],
+        "total_ms": round((_last - _started) * 1000, 1),
+    }
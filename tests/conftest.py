@@ -0,0 +1,23 @@
+"""Tests run against the embedded SQLite backend, on a throwaway database
+migrated once per session. DATABASE_URL is read when database.py is first
+imported, so it is set here before any test module imports it."""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_db_dir = tempfile.mkdtemp(prefix="tradie-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACtest")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "test")
+
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    import migrations
+    migrations.migrate()
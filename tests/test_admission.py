@@ -0,0 +1,24 @@
+import admission
+
+
+def test_sender_burst_then_denied():
+    sender, tenant = "+15550300000", "+15550399999"
+    burst = int(admission.SENDER_BURST)
+
+    decisions = [admission.admit("sms", sender, tenant) for _ in range(burst + 2)]
+
+    assert all(d.admitted for d in decisions[:burst])
+    denied = decisions[burst:]
+    assert [d.admitted for d in denied] == [False, False]
+    assert {d.reason for d in denied} == {"sender"}
+    # One canned reply per flood: only the first rejection notifies
+    assert [d.notify for d in denied] == [True, False]
+
+
+def test_senders_have_separate_buckets():
+    tenant = "+15550499999"
+    for _ in range(int(admission.SENDER_BURST)):
+        admission.admit("sms", "+15550400000", tenant)
+
+    assert not admission.admit("sms", "+15550400000", tenant).admitted
+    assert admission.admit("sms", "+15550400001", tenant).admitted
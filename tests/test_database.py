@@ -0,0 +1,29 @@
+from datetime import datetime
+
+import database
+
+
+def _save(phone, name, client_id):
+    assert database.save_lead(phone, {"name": name, "problem": "leaking tap"}, client_id=client_id)
+
+
+def test_leads_page_keyset_round_trip():
+    for i in range(5):
+        _save(f"+1555010{i:04d}", f"Lead {i}", client_id=41)
+
+    first = database.get_leads_page(41, limit=3)
+    assert [lead["name"] for lead in first] == ["Lead 4", "Lead 3", "Lead 2"]
+
+    # The cursor travels as text in the "Older" link and is parsed back, as in app._page_args
+    last = first[-1]
+    before = (datetime.fromisoformat(last["created_at"]), last["id"])
+    rest = database.get_leads_page(41, before=before, limit=3)
+    assert [lead["name"] for lead in rest] == ["Lead 1", "Lead 0"]
+
+
+def test_leads_page_is_scoped_to_the_tenant():
+    _save("+15550200000", "Default client", client_id=None)
+    _save("+15550200001", "Other tenant", client_id=42)
+
+    assert [lead["name"] for lead in database.get_leads_page(0)] == ["Default client"]
+    assert "Other tenant" in [lead["name"] for lead in database.get_leads_page(all_tenants=True)]
@@ -0,0 +1,28 @@
+from storage import translate_sql
+
+
+def test_interval_becomes_now_shift():
+    assert translate_sql("WHERE created_at >= NOW() - INTERVAL '7 days'") == \
+        "WHERE created_at >= NOW_SHIFT(-7, 'day')"
+
+
+def test_interval_with_multiplier():
+    assert translate_sql("SET expires_at = NOW() + %s * INTERVAL '1 minute'") == \
+        "SET expires_at = NOW_SHIFT(+1 * ?, 'minute')"
+    assert translate_sql("WHERE t < NOW() - %(hours)s * INTERVAL '1 hour'") == \
+        "WHERE t < NOW_SHIFT(-1 * :hours, 'hour')"
+
+
+def test_casts_are_dropped():
+    assert translate_sql("(created_at, id) < (%s::timestamptz, %s)") == "(created_at, id) < (?, ?)"
+    assert translate_sql("WHERE event_type = ANY(%s::text[])") == "WHERE event_type = ANY(?)"
+
+
+def test_named_placeholders():
+    assert translate_sql("WHERE client_id = %(client_id)s AND created_at >= %(today)s") == \
+        "WHERE client_id = :client_id AND created_at >= :today"
+
+
+def test_positional_placeholders_and_literal_percent():
+    assert translate_sql("WHERE name LIKE '%%plumb%%' AND phone = %s") == \
+        "WHERE name LIKE '%plumb%' AND phone = ?"
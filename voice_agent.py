@@ -1,12 +1,15 @@
-import sys
-sys.stdout = sys.stderr
-
 import os
 import json
-from openai import OpenAI
+import time
+from clients import twilio_client
+from jsoncodec import loads, text_frame, END_FRAME
 from database import save_message, save_lead, get_conversation
+from llm import stream, complete_json
+from metrics import inc, observe
+from profiling import span
+from logs import get_logger
 
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+log = get_logger("voice_agent")
 
 # Tracks calls already processed — keyed by caller_phone:twilio_number
 notified_conversations = set()
@@ -88,6 +91,25 @@ lead_captured is true only when we have name AND address AND phone AND problem.
 urgent is true if caller mentioned: no heat, furnace, flooding, burst pipe, gas leak, sewage, no hot water, frozen pipes, carbon monoxide."""
 
 
+# Structured-output schema for the extractor's reply (llm.complete_json)
+LEAD_SCHEMA = {
+    "name": "lead",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "lead_captured": {"type": "boolean"},
+            "name": {"type": ["string", "null"]},
+            "address": {"type": ["string", "null"]},
+            "phone": {"type": ["string", "null"]},
+            "problem": {"type": ["string", "null"]},
+            "urgent": {"type": "boolean"},
+        },
+        "required": ["lead_captured", "name", "address", "phone", "problem", "urgent"],
+        "additionalProperties": False,
+    },
+}
+
+
 # ── Main WebSocket handler ─────────────────────────────────────────────────
 
 def handle_conversation_relay(ws, caller_phone, client):
@@ -96,7 +118,7 @@ def handle_conversation_relay(ws, caller_phone, client):
     client dict comes from database.get_client_by_twilio_number()
     """
     session_key = f"{caller_phone}:{client['twilio_number']}"
-    print(f"Voice session — caller: {caller_phone}, business: {client['business_name']}")
+    log.info("voice_session", caller=caller_phone, business=client["business_name"])
 
     conversation_history = []
     voice_prompt = build_voice_prompt(client)
@@ -105,21 +127,21 @@ def handle_conversation_relay(ws, caller_phone, client):
         while True:
             raw = ws.receive(timeout=30)
             if raw is None:
-                print("WebSocket closed")
+                log.info("ws_closed", caller=caller_phone)
                 break
 
             try:
-                data = json.loads(raw)
+                data = loads(raw)
             except json.JSONDecodeError:
-                print(f"Invalid JSON: {raw[:100]}")
+                log.warning("ws_invalid_json", raw=raw[:100])
                 continue
 
             msg_type = data.get("type")
-            print(f"Event: {msg_type} — {str(data)[:120]}")
+            log.info("ws_event", type=msg_type)
 
             if msg_type == "setup":
                 caller_phone = data.get("from", caller_phone)
-                print(f"Setup — caller: {caller_phone}, sid: {data.get('callSid')}")
+                log.info("ws_setup", caller=caller_phone, call_sid=data.get("callSid"))
                 continue
 
             elif msg_type == "prompt":
@@ -127,93 +149,78 @@ def handle_conversation_relay(ws, caller_phone, client):
                 if not caller_text:
                     continue
 
-                print(f"Caller: {caller_text}")
-                save_message(caller_phone, "user", caller_text)
+                log.debug("caller_said", caller=caller_phone, text=caller_text)
+                inc("tradie_messages_processed_total", channel="voice")
+                save_message(caller_phone, "user", caller_text, client_id=client["id"])
                 conversation_history.append({"role": "user", "content": caller_text})
 
-                agent_response = stream_voice_response(conversation_history, voice_prompt, ws)
-                print(f"Agent: {agent_response}")
+                agent_response = stream_voice_response(conversation_history, voice_prompt, ws,
+                                                       client_id=client["id"])
+                log.debug("agent_said", caller=caller_phone, text=agent_response)
 
-                save_message(caller_phone, "assistant", agent_response)
+                save_message(caller_phone, "assistant", agent_response, client_id=client["id"])
                 conversation_history.append({"role": "assistant", "content": agent_response})
 
                 if should_end_call(agent_response):
-                    print("Call complete — sending end signal")
-                    ws.send(json.dumps({"type": "end"}))
+                    log.info("call_complete", caller=caller_phone)
+                    ws.send(END_FRAME)
                     break
 
             elif msg_type == "end":
-                print(f"Call ended — reason: {data.get('reason')}")
-                _process_call_end(caller_phone, session_key, client)
+                log.info("call_ended", caller=caller_phone, reason=data.get("reason"))
+                process_call_end(caller_phone, session_key, client)
                 break
 
             elif msg_type == "dtmf":
-                print(f"DTMF: {data.get('digit')} — ignored")
+                log.debug("dtmf_ignored", digit=data.get("digit"))
 
             else:
-                print(f"Unknown event: {msg_type}")
+                log.warning("ws_unknown_event", type=msg_type)
 
     except Exception as e:
-        print(f"handle_conversation_relay error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("relay_error", caller=caller_phone, error=e)
     finally:
         if caller_phone and caller_phone != "unknown":
-            _process_call_end(caller_phone, session_key, client)
+            process_call_end(caller_phone, session_key, client)
 
 
-# ── OpenAI streaming ───────────────────────────────────────────────────────
+# ── LLM streaming ──────────────────────────────────────────────────────────
 
-def stream_voice_response(conversation_history, voice_prompt, ws):
+def stream_voice_response(conversation_history, voice_prompt, ws, client_id=None):
     """
     Stream tokens directly to ConversationRelay.
-    ElevenLabs TTS starts speaking before GPT-4o finishes generating.
+    ElevenLabs TTS starts speaking before the model finishes generating.
     Reduces perceived latency ~60%.
     """
     full_response = []
     buffer = ""
 
     try:
-        stream = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": voice_prompt}] + conversation_history,
+        for delta in stream(
+            "voice_turn",
+            [{"role": "system", "content": voice_prompt}] + conversation_history,
+            client_id=client_id,
             temperature=0.7,
-            max_tokens=200,
-            stream=True
-        )
-
-        for chunk in stream:
-            delta = chunk.choices[0].delta.content
-            if delta is None:
-                continue
-
+            max_tokens=200
+        ):
             buffer += delta
             full_response.append(delta)
 
             # Send on natural speech boundaries for smooth TTS
             if any(buffer.endswith(p) for p in [".", "!", "?", ",", " —", " -"]):
                 if buffer.strip():
-                    ws.send(json.dumps({
-                        "type": "text",
-                        "token": buffer,
-                        "last": False
-                    }))
+                    ws.send(text_frame(buffer))
                     buffer = ""
 
         # Final token — add trailing space to prevent TTS cutoff on last word
         final = (buffer.strip() + "  ") if buffer.strip() else "  "
-        ws.send(json.dumps({
-            "type": "text",
-            "token": final,
-            "last": True
-        }))
-
+        ws.send(text_frame(final, last=True))
         return "".join(full_response).strip()
 
     except Exception as e:
-        print(f"Streaming error: {e}")
+        log.error("stream_error", client_id=client_id, error=e)
         fallback = "Sorry about that — let me get someone to call you right back."
-        ws.send(json.dumps({"type": "text", "token": fallback, "last": True}))
+        ws.send(text_frame(fallback, last=True))
         return fallback
 
 
@@ -229,23 +236,26 @@ def should_end_call(agent_text):
     return has_thanks and has_day
 
 
-def _process_call_end(caller_phone, session_key, client):
-    """Extract lead from conversation and notify owner. Runs once per call."""
+def process_call_end(caller_phone, session_key, client):
+    """Extract lead from conversation and notify owner. Runs once per call
+    (voicemails too — see voicemail.py)."""
     if session_key in notified_conversations:
         return
     notified_conversations.add(session_key)
+    started = time.perf_counter()
 
-    print(f"Processing end — {caller_phone} for {client['business_name']}")
-    data = _extract_lead(caller_phone)
-    print(f"Extraction result: {data}")
+    log.info("call_end_processing", caller=caller_phone, business=client["business_name"])
+    data = _extract_lead(caller_phone, client_id=client["id"])
+    log.debug("lead_extracted", caller=caller_phone, lead=data)
 
     if data and data.get("lead_captured"):
         lead_id = save_lead(caller_phone, data, client_id=client["id"])
         if lead_id:
             _notify_owner(data, caller_phone, client)
-            print(f"Full lead saved: {data.get('name')}")
+            observe("tradie_owner_notify_seconds", time.perf_counter() - started, lead="full")
+            log.info("lead_saved", lead_id=lead_id, caller=caller_phone)
     else:
-        history = get_conversation(caller_phone)
+        history = get_conversation(caller_phone, client_id=client["id"])
         if history:
             partial = {
                 "name": (data.get("name") if data else None) or "Unknown caller",
@@ -256,12 +266,13 @@ def _process_call_end(caller_phone, session_key, client):
                 "channel": "voice"
             }
             _notify_owner(partial, caller_phone, client)
-            print("Partial lead — owner notified")
+            observe("tradie_owner_notify_seconds", time.perf_counter() - started, lead="partial")
+            log.info("partial_lead_notified", caller=caller_phone)
 
 
-def _extract_lead(caller_phone):
-    """Run GPT-4o extractor on full conversation history."""
-    history = get_conversation(caller_phone)
+def _extract_lead(caller_phone, client_id=None):
+    """Run the extraction model on the full conversation history."""
+    history = get_conversation(caller_phone, client_id=client_id)
     if len(history) < 2:
         return None
 
@@ -269,34 +280,23 @@ def _extract_lead(caller_phone):
         [f"{m['role'].upper()}: {m['content']}" for m in history]
     )
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
+        return complete_json(
+            "extraction",
+            [
                 {"role": "system", "content": build_extractor_prompt()},
                 {"role": "user", "content": f"Conversation:\n{history_text}"}
             ],
+            client_id=client_id,
+            schema=LEAD_SCHEMA,
             temperature=0
         )
-        raw = response.choices[0].message.content.strip()
-        # Strip markdown code fences if present
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-        return json.loads(raw.strip())
     except Exception as e:
-        print(f"Extractor error: {e}")
+        log.error("extractor_error", client_id=client_id, error=e)
         return None
 
 
 def _notify_owner(lead_data, customer_phone, client):
     """Send lead SMS to business owner from their assigned Twilio number."""
-    from twilio.rest import Client as TwilioClient
-    twilio = TwilioClient(
-        os.getenv("TWILIO_ACCOUNT_SID"),
-        os.getenv("TWILIO_AUTH_TOKEN")
-    )
-
     urgent_tag = "URGENT" if lead_data.get("urgent") else "New Lead"
     message = (
         f"{urgent_tag}: {lead_data.get('name')}\n"
@@ -310,11 +310,12 @@ def _notify_owner(lead_data, customer_phone, client):
     )
 
     try:
-        result = twilio.messages.create(
-            body=message,
-            from_=client["twilio_number"],
-            to=client["owner_phone"]
-        )
-        print(f"Owner SMS sent: {result.sid}")
+        with span("twilio"):
+            result = twilio_client().messages.create(
+                body=message,
+                from_=client["twilio_number"],
+                to=client["owner_phone"]
+            )
+        log.info("owner_sms_sent", sid=result.sid)
     except Exception as e:
-        print(f"Notify owner error: {e}")
\ No newline at end of file
+        log.error("notify_owner_error", error=e)
\ No newline at end of file
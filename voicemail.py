@@ -0,0 +1,113 @@
+"""
+Voicemail fallback for calls turned away by the live-call caps.
+
+When admission.admit_call() says no, /voice answers with voicemail_twiml():
+a <Say> greeting and a <Record> with Twilio's own transcription. That costs
+us nothing per second of the call — no socket, no thread, no LLM tokens.
+When the transcript arrives, /voice/voicemail-transcribed calls enqueue()
+and returns. A worker thread stores the voicemail as a two-message
+conversation (greeting, then the transcript) and runs the normal post-call
+extraction on it (voice_agent.process_call_end), so the owner gets a lead
+SMS just as for a live call. If transcription failed, or the caller hung up
+without leaving a message (/voice/voicemail-done), they get a partial lead.
+
+The worker handles one voicemail at a time, so a surge of voicemails turns
+into a queue of extractor calls, not a burst against OpenAI.
+"""
+import os
+import queue
+import threading
+
+from twilio.twiml.voice_response import VoiceResponse
+from database import save_message
+from logs import get_logger
+from metrics import inc
+
+log = get_logger("voicemail")
+
+# Longest message recorded; Twilio transcribes recordings up to 2 minutes
+VOICEMAIL_MAX_SECONDS = int(os.getenv("VOICEMAIL_MAX_SECONDS", "120"))
+# Voicemails waiting for extraction; more are dropped (the recording stays in Twilio)
+VOICEMAIL_QUEUE_MAX = 1000
+
+GREETING = (
+    "Thanks for calling {business_name}. All our lines are busy right now. "
+    "After the tone, please leave your name, your address, and what's going on, "
+    "and {owner_name} will call you right back."
+)
+
+_queue  = queue.Queue(maxsize=VOICEMAIL_QUEUE_MAX)
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def voicemail_twiml(client, base_url):
+    """TwiML for a caller who couldn't get a live slot. base_url is where
+    Twilio reaches this app (https://…)."""
+    response = VoiceResponse()
+    response.say(GREETING.format(business_name=client["business_name"], owner_name=client["owner_name"]))
+    response.record(
+        max_length=VOICEMAIL_MAX_SECONDS,
+        timeout=5,
+        play_beep=True,
+        transcribe=True,
+        transcribe_callback=f"{base_url}/voice/voicemail-transcribed",
+        # Without an action Twilio re-requests /voice when the recording ends
+        action=f"{base_url}/voice/voicemail-done",
+    )
+    return str(response)
+
+
+def goodbye_twiml():
+    response = VoiceResponse()
+    response.say("Thanks, we've got your message. Goodbye.")
+    response.hangup()
+    return str(response)
+
+
+def enqueue(caller, client, call_sid, transcript, recording_url):
+    """Hand one voicemail to the worker. transcript is None when Twilio could
+    not transcribe it; recording_url is None when the caller hung up without
+    leaving one. False if the queue is full."""
+    status = "transcribed" if transcript else "failed" if recording_url else "empty"
+    inc("tradie_voicemails_total", status=status)
+    if _worker is None:
+        _start_worker()
+    try:
+        _queue.put_nowait((caller, client, call_sid, transcript, recording_url))
+        return True
+    except queue.Full:
+        log.error("voicemail_dropped", caller=caller, call_sid=call_sid, recording_url=recording_url)
+        return False
+
+
+def process(caller, client, call_sid, transcript, recording_url):
+    from voice_agent import process_call_end
+
+    greeting = GREETING.format(business_name=client["business_name"], owner_name=client["owner_name"])
+    if transcript:
+        text = transcript
+    elif recording_url:
+        text = f"[Voicemail — no transcript. Recording: {recording_url}]"
+    else:
+        text = "[Hung up without leaving a voicemail]"
+    save_message(caller, "assistant", greeting, client_id=client["id"])
+    save_message(caller, "user", text, client_id=client["id"])
+    process_call_end(caller, f"voicemail:{call_sid}", client)
+
+
+def _run():
+    while True:
+        item = _queue.get()
+        try:
+            process(*item)
+        except Exception as e:
+            log.exception("voicemail_error", caller=item[0], call_sid=item[2], error=e)
+
+
+def _start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run, daemon=True)
+            _worker.start()